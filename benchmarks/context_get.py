@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+
+    Compare reading a large context_get response in one piece and parsing
+    it into a tree, with parsing it incrementally as it is received.
+
+    Run from the root of the repository:
+
+        python -m benchmarks.context_get --size 50
+"""
+
+__author__ = "robertbasic"
+
+import argparse
+import socket
+import threading
+import time
+import tracemalloc
+
+from pugdebug.tests.synthetic import frame, context_get_response
+from pugdebug.frame_reader import PugdebugFrameReader
+from pugdebug.message_parser import PugdebugMessageParser
+from pugdebug.pipeline import PugdebugCommandPipeline
+
+
+def receive_variables(data, streaming):
+    """Receive a context_get response over a socket and parse it
+
+    Returns the number of top level variables.
+    """
+    engine, ide = socket.socketpair()
+
+    parser = PugdebugMessageParser()
+    pipeline = PugdebugCommandPipeline(ide, PugdebugFrameReader(ide), parser)
+
+    if streaming:
+        future = pipeline.queue(
+            'context_get',
+            stream_parser=parser.get_variables_stream_parser
+        )
+    else:
+        future = pipeline.queue(
+            'context_get',
+            callback=parser.parse_variables_message
+        )
+
+    def respond():
+        engine.recv(1024)
+        engine.sendall(data)
+
+    thread = threading.Thread(target=respond)
+    thread.start()
+
+    try:
+        pipeline.wait([future])
+        return len(future.result())
+    finally:
+        thread.join()
+        engine.close()
+        ide.close()
+
+
+def measure(data, streaming):
+    start = time.perf_counter()
+    receive_variables(data, streaming)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    receive_variables(data, streaming)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main():
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument('--size', type=float, default=50,
+                           help='size of the response in MB')
+    arguments.add_argument('--width', type=int, default=10)
+    arguments.add_argument('--depth', type=int, default=3)
+    options = arguments.parse_args()
+
+    data = frame(context_get_response(
+        int(options.size * 1024 * 1024),
+        width=options.width,
+        depth=options.depth
+    ))
+
+    size = len(data) / 1024 / 1024
+    print('context_get response: %.1f MB' % size)
+
+    for name, streaming in [('buffered', False), ('streaming', True)]:
+        elapsed, peak = measure(data, streaming)
+        print('%-10s %7.2f s %8.1f MB/s  peak memory %7.1f MB (%.1fx)' % (
+            name,
+            elapsed,
+            size / elapsed,
+            peak / 1024 / 1024,
+            peak / len(data)
+        ))
+
+
+if __name__ == '__main__':
+    main()
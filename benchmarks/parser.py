@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+
+    Measure the parse methods of the message parser on generated messages,
+    from 1 KB to 100 MB, and compare the results with a baseline.
+
+    For every case the throughput, the peak memory while parsing, and the
+    number of memory blocks the parsed result holds per variable are
+    reported. Run from the root of the repository:
+
+        python -m benchmarks.parser --max-size 10
+        python -m benchmarks.parser --save benchmarks/parser_baseline.json
+        python -m benchmarks.parser --compare benchmarks/parser_baseline.json
+"""
+
+__author__ = "robertbasic"
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from pugdebug.message_parser import PugdebugMessageParser
+from pugdebug.tests.synthetic import (response, string_property,
+                                      int_property, variable_tree,
+                                      object_chain, repeat_until,
+                                      stack_get_body,
+                                      init_message, typemap_body,
+                                      typemap_attributes, contexts_body,
+                                      breakpoints_body, break_body,
+                                      break_attributes)
+
+KB = 1024
+MB = 1024 * 1024
+
+SIZES = [KB, 10 * KB, 100 * KB, MB, 10 * MB, 100 * MB]
+
+# Builders of a single variable of every shape
+SHAPES = {
+    'wide': lambda i: variable_tree('$wide%d' % i, 50, 1),
+    'deep': lambda i: object_chain('$deep%d' % i, 16),
+    'base64': lambda i: string_property('$long%d' % i, 'x' * 4096),
+}
+
+# Minimum time in seconds to run a case for
+MIN_TIME = 0.5
+
+# Chunk size for feeding the stream parser, as read from a socket
+CHUNK_SIZE = 65536
+
+
+class PugdebugParserBenchmarkCase():
+    """A parse method run over a generated message
+
+    The message is `count` times the given body, to measure messages
+    that have a fixed size, like the init message, at larger sizes.
+    """
+
+    def __init__(self, name, parse, message, count=1,
+                 count_records=None):
+        self.name = name
+        self.parse = parse
+        self.message = message
+        self.count = count
+        self.count_records = count_records or count_variables
+
+    def get_size(self):
+        return len(self.message) * self.count
+
+    def run(self):
+        return [self.parse(self.message) for i in range(self.count)]
+
+
+def count_variables(result):
+    """Count the variables, or other records, in a parse result"""
+    if isinstance(result, list):
+        return sum(count_variables(item) for item in result)
+
+    if isinstance(result, dict) and 'variables' in result:
+        return 1 + count_variables(result['variables'])
+
+    return 1
+
+
+def stream_parse(parser, message):
+    stream_parser = parser.get_variables_stream_parser()
+
+    for start in range(0, len(message), CHUNK_SIZE):
+        stream_parser.feed(message[start:start + CHUNK_SIZE])
+
+    return stream_parser.close()
+
+
+def get_cases(parser, sizes):
+    """Generate the benchmark cases for all the sizes"""
+    cases = []
+
+    for size in sizes:
+        label = format_size(size)
+
+        for shape, build in sorted(SHAPES.items()):
+            body, count = repeat_until(size, build)
+            message = response('context_get', 1, body)
+
+            cases.append(PugdebugParserBenchmarkCase(
+                'parse_variables_message/%s/%s' % (shape, label),
+                parser.parse_variables_message,
+                message
+            ))
+            cases.append(PugdebugParserBenchmarkCase(
+                'stream_parser/%s/%s' % (shape, label),
+                lambda message: stream_parse(parser, message),
+                message
+            ))
+
+            # The same variables, as the children of an evaluated array
+            result = (b'<property name="$result" type="array" '
+                      b'numchildren="%d">' % count + body + b'</property>')
+            cases.append(PugdebugParserBenchmarkCase(
+                'parse_eval_message/%s/%s' % (shape, label),
+                parser.parse_eval_message,
+                response('eval', 1, result)
+            ))
+
+        cases.extend([
+            PugdebugParserBenchmarkCase(
+                'parse_stacktraces_message/%s' % label,
+                parser.parse_stacktraces_message,
+                response('stack_get', 1, stack_get_body(size // 160 + 1))
+            ),
+            PugdebugParserBenchmarkCase(
+                'parse_breakpoint_list_message/%s' % label,
+                parser.parse_breakpoint_list_message,
+                response('breakpoint_list', 1,
+                         breakpoints_body(size // 140 + 1))
+            ),
+            PugdebugParserBenchmarkCase(
+                'parse_variable_contexts_message/%s' % label,
+                parser.parse_variable_contexts_message,
+                response('context_names', 1, contexts_body(size // 40 + 1))
+            ),
+            PugdebugParserBenchmarkCase(
+                'parse_typemap_message/%s' % label,
+                parser.parse_typemap_message,
+                response('typemap_get', 1, typemap_body(size // 70 + 1),
+                         typemap_attributes()),
+                count_records=lambda results: sum(map(len, results))
+            ),
+        ])
+
+        # Messages with a fixed size are parsed many times over
+        fixed = [
+            ('parse_init_message', parser.parse_init_message,
+             init_message()),
+            ('parse_continuation_message', parser.parse_continuation_message,
+             response('step_into', 1, break_body(), break_attributes())),
+            ('parse_breakpoint_set_message',
+             parser.parse_breakpoint_set_message,
+             response('breakpoint_set', 1, b'', b' state="enabled" id="1"')),
+            ('parse_breakpoint_remove_message',
+             parser.parse_breakpoint_remove_message,
+             response('breakpoint_remove', 1,
+                      b'<breakpoint type="line" id="1"></breakpoint>')),
+            ('parse_transaction_id', parser.parse_transaction_id,
+             response('context_get', 1, int_property('$i', 1))),
+        ]
+
+        for name, parse, message in fixed:
+            cases.append(PugdebugParserBenchmarkCase(
+                '%s/%s' % (name, label),
+                parse,
+                message,
+                max(1, size // len(message))
+            ))
+
+    return cases
+
+
+def measure(case, repeat):
+    """Measure a case
+
+    The time is the best of at least `repeat` runs, small cases are run
+    for at least `MIN_TIME` seconds to smooth out the noise. The peak
+    memory is measured with tracemalloc, in a separate run. The memory
+    blocks are the blocks still allocated after the run, while the result
+    is kept alive.
+    """
+    best = None
+    runs = 0
+    total = 0
+
+    while runs < repeat or total < MIN_TIME:
+        start = time.perf_counter()
+        case.run()
+        elapsed = time.perf_counter() - start
+
+        best = elapsed if best is None else min(best, elapsed)
+        runs += 1
+        total += elapsed
+
+    gc.collect()
+    tracemalloc.start()
+    case.run()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    result = case.run()
+    blocks = sys.getallocatedblocks() - blocks
+
+    size = case.get_size()
+
+    return {
+        'size': size,
+        'seconds': best,
+        'throughput': size / best / MB,
+        'peak_memory': peak,
+        'blocks_per_variable': max(0, blocks) / case.count_records(result)
+    }
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """Find the cases that got slower or use more memory than the baseline
+
+    The times depend on the load of the machine, the memory use does not,
+    so the times are given more slack.
+    """
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        base = baseline[name]
+
+        if result['throughput'] < base['throughput'] * (1 - time_tolerance):
+            regressions.append('%s: throughput %.1f MB/s, was %.1f MB/s' % (
+                name, result['throughput'], base['throughput']
+            ))
+
+        max_peak_memory = base['peak_memory'] * (1 + memory_tolerance)
+
+        if result['peak_memory'] > max_peak_memory:
+            regressions.append('%s: peak memory %s, was %s' % (
+                name,
+                format_size(result['peak_memory']),
+                format_size(base['peak_memory'])
+            ))
+
+        if (result['blocks_per_variable'] >
+                base['blocks_per_variable'] * (1 + memory_tolerance) + 0.5):
+            regressions.append('%s: %.1f blocks per variable, was %.1f' % (
+                name,
+                result['blocks_per_variable'],
+                base['blocks_per_variable']
+            ))
+
+    return regressions
+
+
+def format_size(size):
+    for unit, factor in [('MB', MB), ('KB', KB)]:
+        if size >= factor:
+            return '%g%s' % (round(size / factor, 1), unit)
+
+    return '%dB' % size
+
+
+def main():
+    arguments = argparse.ArgumentParser(
+        description='Benchmark the message parser'
+    )
+    arguments.add_argument('--max-size', type=float, default=100,
+                           help='largest message size in MB')
+    arguments.add_argument('--repeat', type=int, default=3)
+    arguments.add_argument('--filter', default='',
+                           help='only run cases with this in their name')
+    arguments.add_argument('--save', help='save the results as a baseline')
+    arguments.add_argument('--compare', help='compare with a baseline')
+    arguments.add_argument('--time-tolerance', type=float, default=0.4,
+                           help='allowed drop of the throughput')
+    arguments.add_argument('--memory-tolerance', type=float, default=0.1,
+                           help='allowed growth of the memory use')
+    options = arguments.parse_args()
+
+    parser = PugdebugMessageParser()
+
+    sizes = [size for size in SIZES if size <= options.max_size * MB]
+
+    results = {}
+
+    print('%-48s %9s %10s %10s %8s' % (
+        'case', 'size', 'MB/s', 'peak', 'blocks/v'
+    ))
+
+    for case in get_cases(parser, sizes):
+        if options.filter not in case.name:
+            continue
+
+        result = measure(case, options.repeat)
+        results[case.name] = result
+
+        print('%-48s %9s %10.1f %10s %8.1f' % (
+            case.name,
+            format_size(result['size']),
+            result['throughput'],
+            format_size(result['peak_memory']),
+            result['blocks_per_variable']
+        ))
+
+    if options.save:
+        with open(options.save, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results
+            }, file, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)['results']
+
+        regressions = compare(
+            results,
+            baseline,
+            options.time_tolerance,
+            options.memory_tolerance
+        )
+
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+
+    Step through debugging sessions of the fake Xdebug engine, through
+    the server, the debugger and the variable and stacktrace viewers, and
+    measure how long every step takes until it's state is displayed.
+
+    Run from the root of the repository:
+
+        python -m benchmarks.session --variables 200 --depth 3 --steps 50
+"""
+
+__author__ = "robertbasic"
+
+import argparse
+import os
+import socket
+import statistics
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from pugdebug.debugger import PugdebugDebugger  # noqa: E402
+from pugdebug.gui.stacktraces import PugdebugStacktraceViewer  # noqa: E402
+from pugdebug.gui.variables import PugdebugVariableViewer  # noqa: E402
+from pugdebug.tests.fake_engine import PugdebugFakeEngine  # noqa: E402
+
+
+class PugdebugSessionBenchmark():
+
+    def __init__(self, steps):
+        self.steps = steps
+
+        self.debugger = PugdebugDebugger()
+        self.variable_viewer = PugdebugVariableViewer()
+        self.stacktrace_viewer = PugdebugStacktraceViewer()
+
+        self.step_started = 0
+        self.timings = []
+        self.sessions = 0
+        self.stopped = False
+
+        debugger = self.debugger
+        debugger.debugging_started_signal.connect(self.start_session)
+        debugger.debugging_post_start_signal.connect(self.step)
+        debugger.got_all_variables_signal.connect(self.show_variables)
+        debugger.got_stacktraces_signal.connect(
+            self.stacktrace_viewer.set_stacktraces
+        )
+        debugger.debugging_stopped_signal.connect(self.handle_stopped)
+
+    def start_session(self):
+        self.sessions += 1
+        self.debugger.post_start_command({
+            'breakpoints': [],
+            'expressions': []
+        })
+
+    def step(self):
+        self.step_started = time.perf_counter()
+        self.debugger.step_over()
+
+    def show_variables(self, variables):
+        self.variable_viewer.set_variables(variables)
+        self.timings.append(time.perf_counter() - self.step_started)
+
+        if len(self.timings) % self.steps == 0:
+            self.debugger.stop_debug()
+        else:
+            self.step()
+
+    def handle_stopped(self):
+        self.stopped = True
+
+
+def get_free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def main():
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument('--variables', type=int, default=100)
+    arguments.add_argument('--width', type=int, default=4)
+    arguments.add_argument('--depth', type=int, default=2)
+    arguments.add_argument('--stack-depth', type=int, default=10)
+    arguments.add_argument('--latency', type=float, default=0)
+    arguments.add_argument('--connections', type=int, default=1)
+    arguments.add_argument('--steps', type=int, default=20)
+    options = arguments.parse_args()
+
+    application = QApplication([])
+
+    port = get_free_port()
+
+    benchmark = PugdebugSessionBenchmark(options.steps)
+    benchmark.debugger.server.start_listening([('127.0.0.1', port)])
+
+    engine = PugdebugFakeEngine(
+        port=port,
+        variables=options.variables,
+        width=options.width,
+        depth=options.depth,
+        stack_depth=options.stack_depth,
+        latency=options.latency,
+        connections=options.connections,
+        steps=options.steps + 1
+    )
+    engine.start()
+
+    while not (benchmark.stopped and
+               benchmark.sessions == options.connections):
+        application.processEvents()
+        time.sleep(0.0005)
+
+    benchmark.debugger.stop_listening()
+    engine.join(5)
+
+    timings = sorted(benchmark.timings)
+    size = len(engine.context_get_body) / 1024
+
+    print('%d sessions, %d steps, context_get %.0f kB' % (
+        options.connections, len(timings), size
+    ))
+    print('step to variables displayed: median %.1f ms, '
+          'p95 %.1f ms, max %.1f ms' % (
+              statistics.median(timings) * 1000,
+              timings[int(len(timings) * 0.95)] * 1000,
+              timings[-1] * 1000
+          ))
+
+
+if __name__ == '__main__':
+    main()
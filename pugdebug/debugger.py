@@ -13,6 +13,8 @@ from collections import deque
 from PyQt5.QtCore import QObject, pyqtSignal
 
 from pugdebug.server import PugdebugServer
+from pugdebug.models.projects import PugdebugProject
+from pugdebug.models.settings import get_setting, get_projects
 
 
 class PugdebugDebugger(QObject):
@@ -25,6 +27,9 @@ class PugdebugDebugger(QObject):
     init_message = None
     step_result = ''
 
+    # Was the state fetched together with the current step result
+    state_fetched = False
+
     current_file = ''
     current_line = 0
 
@@ -35,10 +40,13 @@ class PugdebugDebugger(QObject):
     step_command_signal = pyqtSignal()
     got_all_variables_signal = pyqtSignal(object)
     got_stacktraces_signal = pyqtSignal(object)
+    breakpoint_set_signal = pyqtSignal(object)
     breakpoint_removed_signal = pyqtSignal(int)
+    breakpoint_remove_failed_signal = pyqtSignal(int)
     breakpoints_listed_signal = pyqtSignal(list)
     expression_evaluated_signal = pyqtSignal(int, dict)
     expressions_evaluated_signal = pyqtSignal(list)
+    logged_signal = pyqtSignal(str)
 
     error_signal = pyqtSignal(str)
 
@@ -76,7 +84,7 @@ class PugdebugDebugger(QObject):
         a connection is stopped or detached, when a step command is done,
         when variables are read, when stacktraces are read, when breakpoints
         are set or removed, when breakpoints are read, when expressions are
-        evaluated.
+        evaluated, when logpoints log.
         """
 
         # Stop/detach signals
@@ -94,6 +102,9 @@ class PugdebugDebugger(QObject):
         connection.stepped_signal.connect(
             self.handle_stepped
         )
+        connection.stepped_and_fetched_signal.connect(
+            self.handle_stepped_and_fetched
+        )
 
         # Variables signals
         connection.got_variables_signal.connect(
@@ -112,6 +123,9 @@ class PugdebugDebugger(QObject):
         connection.removed_breakpoint_signal.connect(
             self.handle_removed_breakpoint
         )
+        connection.remove_breakpoint_failed_signal.connect(
+            self.handle_remove_breakpoint_failed
+        )
         connection.listed_breakpoints_signal.connect(
             self.handle_listed_breakpoints
         )
@@ -124,6 +138,11 @@ class PugdebugDebugger(QObject):
             self.handle_expressions_evaluated
         )
 
+        # Log signals
+        connection.logged_signal.connect(
+            self.handle_logged
+        )
+
         # Error signals
         connection.connection_error_signal.connect(
             self.handle_connection_error
@@ -141,6 +160,7 @@ class PugdebugDebugger(QObject):
 
         self.current_connection = None
         self.step_result = ''
+        self.state_fetched = False
         self.current_file = ''
         self.current_line = 0
 
@@ -157,18 +177,47 @@ class PugdebugDebugger(QObject):
     def start_listening(self):
         """Start listening to new connections
         """
-        self.server.start_listening()
+        self.server.start_listening(self.get_listen_addresses())
+
+    def get_listen_addresses(self):
+        """Get the host/port pairs to listen on
+
+        Always listen on the host and port from the settings. If the
+        listen on all projects setting is turned on, listen on the ports
+        of all the projects as well.
+        """
+        addresses = [(get_setting('debugger/host'),
+                      int(get_setting('debugger/port_number')))]
+
+        if int(get_setting('debugger/listen_on_all_projects')) == 0:
+            return addresses
+
+        for project_name in get_projects():
+            address = PugdebugProject(project_name).get_address()
+
+            if address is not None and address not in addresses:
+                addresses.append(address)
+
+        return addresses
 
     def handle_new_connection_established(self, connection):
         """Handle when the server establishes a new connection
 
+        The server passes on only connections with a finished handshake,
+        the init message is read and the typemap is loaded.
+
         Connect the signals for the new connection.
 
-        Add it to the queue of connections.
+        Add it to the queue of connections. If the queue is full, detach
+        from the new connection, so the script doesn't wait for us.
 
         If there is no active connection, start the new connection.
         """
-        connection.load_typemap()
+        max_pending = int(get_setting('debugger/max_pending_connections'))
+
+        if len(self.connections) >= max_pending:
+            connection.dismiss()
+            return
 
         self.connect_connection_signals(connection)
 
@@ -238,11 +287,15 @@ class PugdebugDebugger(QObject):
     def handle_stopped(self):
         """Handle when a server stopped signal is received
 
-        If there are pending connections, start a new one.
+        If there are pending connections, disconnect from the stopped one,
+        so it's worker is done, and start a new one.
 
         Otherwise emit a debugging stopped signal.
         """
         if self.has_pending_connections():
+            if self.is_connected():
+                self.current_connection.disconnect()
+
             self.start_debugging_new_connection()
         else:
             self.cleanup_current_connection()
@@ -251,6 +304,14 @@ class PugdebugDebugger(QObject):
     def run_debug(self):
         self.current_connection.step_run()
 
+    def pause_debug(self):
+        """Break into the script of the current connection if it runs
+        """
+        if not self.is_connected():
+            return False
+
+        return self.current_connection.pause()
+
     def step_over(self):
         self.current_connection.step_over()
 
@@ -260,44 +321,119 @@ class PugdebugDebugger(QObject):
     def step_out(self):
         self.current_connection.step_out()
 
+    def run_to(self, filename, line_number):
+        self.current_connection.run_to(filename, line_number)
+
+    def auto_step(self, options):
+        self.current_connection.auto_step(options)
+
     def handle_stepped(self, step_result):
         """Handle when server executes a step command
 
         Save the result of the step command and emit
         a step command signal.
+
+        The step result holds the generation of the step, if a newer step
+        was started since, the step result is stale.
         """
         self.step_result = step_result
+        self.state_fetched = False
         self.step_command_signal.emit()
 
+    def handle_stepped_and_fetched(self, state):
+        """Handle when server executes a step and fetches the state with it
+
+        Handle the step result as any other, then emit the variables,
+        stacktraces and expressions that were fetched with it.
+        """
+        self.step_result = state['step']
+        self.state_fetched = True
+        self.step_command_signal.emit()
+
+        generation = state['generation']
+        self.handle_got_variables(state['variables'], generation)
+        self.handle_got_stacktraces(state['stacktraces'], generation)
+        self.handle_expressions_evaluated(state['expressions'], generation)
+
+    def has_fetched_state(self):
+        """Was the state already fetched together with the current step
+        """
+        return self.state_fetched
+
+    def set_expressions(self, expressions):
+        """Set the expressions to evaluate after every step
+        """
+        if self.is_connected():
+            self.current_connection.set_expressions(expressions)
+
+    def is_step_stale(self):
+        """Was a newer step started since the current step result
+        """
+        if not self.is_connected() or 'generation' not in self.step_result:
+            return False
+
+        return self.current_connection.is_stale(
+            self.step_result['generation']
+        )
+
     def post_step_command(self, post_step_data):
+        """Refresh the state after a step
+
+        The refresh is tagged with the generation of the step, so it gets
+        skipped if a newer step is started in the meantime.
+        """
+        if 'generation' in self.step_result:
+            post_step_data['generation'] = self.step_result['generation']
+
         self.current_connection.post_step_command(post_step_data)
 
-    def handle_got_variables(self, variables):
+    def is_generation_stale(self, generation):
+        return (self.is_connected() and
+                self.current_connection.is_stale(generation))
+
+    def handle_got_variables(self, variables, generation):
         """Handle when server recieves all variables
 
-        Emit a signal with all variables received.
+        Emit a signal with all variables received, unless they are
+        for an older step.
         """
+        if self.is_generation_stale(generation):
+            return
+
         self.got_all_variables_signal.emit(variables)
 
-    def handle_got_stacktraces(self, stacktraces):
+    def handle_got_stacktraces(self, stacktraces, generation):
         """Handle when server receives stacktraces
 
-        Emit a signal with the stacktraces.
+        Emit a signal with the stacktraces, unless they are
+        for an older step.
         """
+        if self.is_generation_stale(generation):
+            return
+
         self.got_stacktraces_signal.emit(stacktraces)
 
     def set_breakpoint(self, breakpoint):
         self.current_connection.set_breakpoint(breakpoint)
 
-    def handle_set_breakpoint(self, successful):
-        if successful:
-            self.list_breakpoints()
+    def handle_set_breakpoint(self, breakpoint):
+        """Handle when a breakpoint is set
+
+        The breakpoint comes with the id the engine gave it, there is no
+        need to list all the breakpoints again.
+        """
+        if breakpoint is not None:
+            self.breakpoint_set_signal.emit(breakpoint)
 
     def remove_breakpoint(self, breakpoint_id):
         self.current_connection.remove_breakpoint(breakpoint_id)
 
     def handle_removed_breakpoint(self, breakpoint_id):
-        self.breakpoint_removed_signal.emit(breakpoint_id)
+        if breakpoint_id is not False:
+            self.breakpoint_removed_signal.emit(breakpoint_id)
+
+    def handle_remove_breakpoint_failed(self, breakpoint_id):
+        self.breakpoint_remove_failed_signal.emit(breakpoint_id)
 
     def list_breakpoints(self):
         self.current_connection.list_breakpoints()
@@ -323,10 +459,16 @@ class PugdebugDebugger(QObject):
         """Handle when server evaluates an expression"""
         self.expression_evaluated_signal.emit(index, result)
 
-    def handle_expressions_evaluated(self, results):
+    def handle_expressions_evaluated(self, results, generation):
         """Handle when server evaluates a list of expressions"""
+        if self.is_generation_stale(generation):
+            return
+
         self.expressions_evaluated_signal.emit(results)
 
+    def handle_logged(self, entry):
+        self.logged_signal.emit(entry)
+
     def set_debugger_features(self):
         self.current_connection.set_debugger_features()
 
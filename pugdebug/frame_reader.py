@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import errno
+import time
+
+
+class PugdebugFrameReader():
+    """Decode DBGp frames from a socket
+
+    Xdebug sends every message as a frame of the form `length\\0xml\\0`.
+
+    The reader keeps its own receive buffer, a preallocated bytearray, and
+    fills it with `recv_into`, so a large message is read with a handful
+    of syscalls instead of one per byte, and it is never copied around
+    as a growing string.
+
+    Complete frames are sliced out of the buffer as bytes and can be
+    handed straight to the message parser.
+
+    The buffer grows to fit frames larger than it, and shrinks back to
+    it's initial size once such a frame is consumed. Frames can also be
+    read in chunks as they arrive, then the buffer doesn't grow at all.
+    """
+
+    socket = None
+
+    buffer_size = 65536
+    buffer = None
+    view = None
+
+    # Start and end of the not yet consumed data in the buffer
+    start = 0
+    end = 0
+
+    # Length of the frame body that is being read,
+    # None while the length header is not read yet
+    frame_length = None
+
+    # When data was last received, and when the first data of the
+    # frame being read was received, as `time.perf_counter` values
+    received_at = 0
+    frame_started_at = 0
+
+    def __init__(self, socket, buffer_size=65536):
+        self.socket = socket
+
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+
+        self.start = 0
+        self.end = 0
+        self.frame_length = None
+
+        self.received_at = 0
+        self.frame_started_at = 0
+
+    def read_frame(self):
+        """Read a single frame
+
+        Block until a complete frame is received and return it's body.
+        """
+        frame = self.pop_frame()
+
+        while frame is None:
+            self.receive()
+            frame = self.pop_frame()
+
+        return frame
+
+    def read_frames(self):
+        """Read all frames that are available
+
+        Block until at least one complete frame is received, and return
+        the bodies of all the complete frames that are in the buffer.
+        """
+        frames = [self.read_frame()]
+
+        frame = self.pop_frame()
+        while frame is not None:
+            frames.append(frame)
+            frame = self.pop_frame()
+
+        return frames
+
+    def has_frame(self):
+        """Is there a complete frame in the buffer
+        """
+        if self.frame_length is None and not self.__read_length():
+            return False
+
+        return self.end - self.start >= self.frame_length + 1
+
+    def pop_frame(self):
+        """Take the next complete frame from the buffer
+
+        Returns the body of the frame as bytes, or None if the buffer
+        doesn't hold a complete frame yet.
+
+        Raises a ConnectionError if the body is not terminated by a null
+        byte, as then the stream is out of sync.
+        """
+        if not self.has_frame():
+            return None
+
+        body_end = self.start + self.frame_length
+
+        self.__check_terminator(body_end, self.frame_length)
+
+        frame = bytes(self.view[self.start:body_end])
+
+        self.frame_length = None
+        self.__skip_terminator(body_end)
+
+        return frame
+
+    def read_frame_chunks(self):
+        """Read the next frame in chunks, as the data arrives
+
+        A generator yielding the body of the next frame piece by piece,
+        as bytes. The body is never assembled in one piece, so the buffer
+        doesn't grow for large frames, and the chunks can be fed straight
+        to an incremental parser.
+
+        The generator must be exhausted, otherwise the rest of the frame
+        would be read as the next frame.
+        """
+        while self.frame_length is None and not self.__read_length():
+            self.receive()
+
+        remaining = self.frame_length
+        length = self.frame_length
+
+        # The body is read as it comes, without waiting for all of it
+        self.frame_length = None
+
+        while remaining > 0:
+            if self.start == self.end:
+                self.receive()
+
+            chunk_end = min(self.end, self.start + remaining)
+
+            chunk = bytes(self.view[self.start:chunk_end])
+
+            remaining -= chunk_end - self.start
+            self.start = chunk_end
+
+            yield chunk
+
+        if self.start == self.end:
+            self.receive()
+
+        self.__check_terminator(self.start, length)
+        self.__skip_terminator(self.start)
+
+    def receive(self):
+        """Receive data from the socket into the buffer
+
+        Makes room in the buffer if needed, so a frame of a known length
+        fits into it in one piece.
+
+        Returns the number of bytes received. Raises a ConnectionResetError
+        if the other side closed the connection.
+        """
+        self.__make_room()
+
+        received = self.socket.recv_into(self.view[self.end:])
+
+        if received == 0:
+            raise ConnectionResetError(
+                errno.ECONNRESET,
+                'Connection closed by the debugger engine'
+            )
+
+        self.end += received
+        self.received_at = time.perf_counter()
+
+        return received
+
+    def __check_terminator(self, position, length):
+        """Check there is a null byte after the body of a frame
+
+        Raises a ConnectionError if there is not, as then the stream
+        is out of sync.
+        """
+        if self.buffer[position] != 0:
+            raise ConnectionError(
+                errno.EPROTO,
+                'Malformed message from the debugger engine, '
+                'missing null byte after %d bytes' % length
+            )
+
+    def __skip_terminator(self, position):
+        """Skip the null byte that terminates the body of a frame
+        """
+        self.start = position + 1
+
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+
+            # Don't hold on to a buffer grown for a large frame
+            if len(self.buffer) > self.buffer_size:
+                self.buffer = bytearray(self.buffer_size)
+                self.view = memoryview(self.buffer)
+
+    def __read_length(self):
+        """Read the length header of the next frame
+
+        The header is the length of the frame body as ASCII digits,
+        terminated by a null byte.
+
+        Raises a ConnectionError if the header is not a number, as then
+        the stream is out of sync.
+        """
+        null = self.buffer.find(b'\0', self.start, self.end)
+
+        if null == -1:
+            return False
+
+        length = bytes(self.view[self.start:null])
+
+        if not length.isdigit():
+            raise ConnectionError(
+                errno.EPROTO,
+                'Malformed message from the debugger engine, '
+                'invalid length %r' % length[:20]
+            )
+
+        self.frame_length = int(length)
+        self.start = null + 1
+
+        # The length header came with the latest received data
+        self.frame_started_at = self.received_at
+
+        return True
+
+    def __make_room(self):
+        """Make sure there is free space at the end of the buffer
+
+        Move the unconsumed data to the beginning of the buffer, and grow
+        the buffer when the frame being read would not fit into it.
+        """
+        pending = self.end - self.start
+
+        needed = pending + 1
+        if self.frame_length is not None:
+            needed = max(needed, self.frame_length + 1)
+
+        if needed > len(self.buffer):
+            size = len(self.buffer)
+            while size < needed:
+                size *= 2
+
+            buffer = bytearray(size)
+            buffer[:pending] = self.view[self.start:self.end]
+
+            self.buffer = buffer
+            self.view = memoryview(self.buffer)
+        elif needed > len(self.buffer) - self.start:
+            self.view[:pending] = self.view[self.start:self.end]
+        else:
+            return
+
+        self.start = 0
+        self.end = pending
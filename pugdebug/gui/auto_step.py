@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+from PyQt5.QtWidgets import (QDialog, QFormLayout, QComboBox, QSpinBox,
+                             QLineEdit, QDialogButtonBox)
+
+
+class PugdebugAutoStepWindow(QDialog):
+    """Set up stepping until a condition is true or a value changes
+
+    The steps are done by the debugger on it's own, the state is shown only
+    once it stops stepping.
+    """
+
+    def __init__(self, parent):
+        super(PugdebugAutoStepWindow, self).__init__(parent)
+
+        self.setWindowTitle("Auto step")
+
+        self.command = QComboBox()
+        self.command.addItem("Step over", 'step_over')
+        self.command.addItem("Step into", 'step_into')
+
+        self.count = QSpinBox()
+        self.count.setRange(0, 99999999)
+        self.count.setValue(1000)
+        self.count.setSpecialValueText("No limit")
+
+        self.stop_when = QComboBox()
+        self.stop_when.addItem("Steps are done", '')
+        self.stop_when.addItem("Expression is true", 'condition')
+        self.stop_when.addItem("Expression changes", 'watch')
+        self.stop_when.currentIndexChanged.connect(
+            self.handle_stop_when_changed
+        )
+
+        self.expression = QLineEdit()
+        self.handle_stop_when_changed()
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok |
+                                   QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QFormLayout()
+        layout.addRow("Step", self.command)
+        layout.addRow("Steps at most", self.count)
+        layout.addRow("Stop when", self.stop_when)
+        layout.addRow("Expression", self.expression)
+        layout.addRow(buttons)
+        self.setLayout(layout)
+
+    def handle_stop_when_changed(self):
+        stop_when = self.stop_when.currentData()
+
+        self.expression.setEnabled(stop_when != '')
+
+        if stop_when == 'condition':
+            self.expression.setPlaceholderText("Like $i > 500")
+        elif stop_when == 'watch':
+            self.expression.setPlaceholderText("Like $user->name")
+        else:
+            self.expression.setPlaceholderText("")
+
+    def get_options(self):
+        options = {
+            'command': self.command.currentData(),
+            'count': self.count.value()
+        }
+
+        stop_when = self.stop_when.currentData()
+        expression = self.expression.text().strip()
+
+        if stop_when != '' and expression != '':
+            options[stop_when] = expression
+
+        return options
@@ -9,9 +9,15 @@
 
 __author__ = "robertbasic"
 
-from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import (QTreeWidget, QTreeWidgetItem, QMenu, QAction,
+                             QInputDialog, QDialog, QFormLayout, QLineEdit,
+                             QComboBox, QSpinBox, QDialogButtonBox)
 
+from pugdebug.models.breakpoints import (hit_conditions, is_line_breakpoint,
+                                         get_hit_value, get_breakpoint_key,
+                                         describe_breakpoint_location,
+                                         describe_breakpoint_condition)
 from pugdebug.models.settings import get_setting
 
 
@@ -19,35 +25,138 @@ class PugdebugBreakpointViewer(QTreeWidget):
 
     item_double_clicked_signal = pyqtSignal(str, int)
 
+    breakpoint_added_signal = pyqtSignal(object)
+    breakpoint_removed_signal = pyqtSignal(object)
+
     def __init__(self):
         super(PugdebugBreakpointViewer, self).__init__()
 
-        self.setColumnCount(2)
-        self.setHeaderLabels(['File', 'Line', 'Full filename'])
+        self.setColumnCount(4)
+        self.setHeaderLabels(['File', 'Line', 'Full filename', 'Condition'])
 
         self.setColumnWidth(0, 350)
         self.setColumnHidden(2, True)
 
         self.itemDoubleClicked.connect(self.handle_item_double_clicked)
 
+        # Items of the breakpoints, by the keys of the breakpoints
+        self.items = {}
+
+        # Actions for breakpoints that are not set on a line
+        self.add_exception_action = QAction("Break on &exception...", self)
+        self.add_exception_action.triggered.connect(
+            lambda: self.handle_add_action(
+                'exception',
+                "Exception class name"
+            )
+        )
+
+        self.add_call_action = QAction("Break on function &call...", self)
+        self.add_call_action.triggered.connect(
+            lambda: self.handle_add_action(
+                'call',
+                "Function or Class::method"
+            )
+        )
+
+        self.add_return_action = QAction("Break on function &return...",
+                                         self)
+        self.add_return_action.triggered.connect(
+            lambda: self.handle_add_action(
+                'return',
+                "Function or Class::method"
+            )
+        )
+
+        self.remove_action = QAction("Re&move breakpoint", self)
+        self.remove_action.triggered.connect(self.handle_remove_action)
+
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.show_context_menu)
+
     def set_breakpoints(self, breakpoints):
         self.clear()
+        self.items = {}
 
         for breakpoint in breakpoints:
+            self.add_breakpoint(breakpoint)
+
+    def add_breakpoint(self, breakpoint):
+        """Add a breakpoint, or update the one with the same key"""
+        key = get_breakpoint_key(breakpoint)
+
+        item = self.items.get(key)
+
+        if item is None:
+            item = QTreeWidgetItem()
+            self.items[key] = item
+            self.addTopLevelItem(item)
+
+        if is_line_breakpoint(breakpoint):
             filename = self.__cut_filename(breakpoint['filename'])
             args = [
                 filename,
                 str(breakpoint['lineno']),
                 breakpoint['filename']
             ]
+        else:
+            args = [describe_breakpoint_location(breakpoint), '', '']
 
-            item = QTreeWidgetItem(args)
-            item.setToolTip(0, breakpoint['filename'])
+        args.append(describe_breakpoint_condition(breakpoint))
 
-            self.addTopLevelItem(item)
+        for column, text in enumerate(args):
+            item.setText(column, text)
+
+        item.setToolTip(0, args[2] or args[0])
+        item.setData(0, Qt.UserRole, breakpoint)
+
+    def remove_breakpoint(self, breakpoint):
+        item = self.items.pop(get_breakpoint_key(breakpoint), None)
+
+        if item is not None:
+            self.takeTopLevelItem(self.indexOfTopLevelItem(item))
+
+    def show_context_menu(self, point):
+        context_menu = QMenu(self)
+
+        context_menu.addAction(self.add_exception_action)
+        context_menu.addAction(self.add_call_action)
+        context_menu.addAction(self.add_return_action)
+
+        # If clicked on a breakpoint, offer to remove it
+        if self.itemAt(point):
+            context_menu.addSeparator()
+            context_menu.addAction(self.remove_action)
+
+        context_menu.popup(self.mapToGlobal(point))
+
+    def handle_add_action(self, breakpoint_type, label):
+        name, ok = QInputDialog.getText(self, "Add breakpoint", label)
+        name = name.strip()
+
+        if not ok or name == '':
+            return
+
+        key = 'exception' if breakpoint_type == 'exception' else 'function'
+
+        self.breakpoint_added_signal.emit({
+            'type': breakpoint_type,
+            key: name
+        })
+
+    def handle_remove_action(self):
+        item = self.currentItem()
+
+        if item is not None:
+            self.breakpoint_removed_signal.emit(item.data(0, Qt.UserRole))
 
     def handle_item_double_clicked(self, item, column):
         file = item.text(2)
+
+        # Breakpoints that are not on a line have nowhere to jump to
+        if file == '':
+            return
+
         line = int(item.text(1))
 
         self.item_double_clicked_signal.emit(file, line)
@@ -62,3 +171,96 @@ class PugdebugBreakpointViewer(QTreeWidget):
             root = root.rstrip('/')
             filename = filename[len(root):]
         return "~%s" % filename
+
+
+class PugdebugBreakpointDialog(QDialog):
+    """Edit when a breakpoint on a line breaks
+
+    The breakpoint breaks when the expression is true, and when it's hit
+    count meets the hit condition. Both are checked by the engine.
+
+    With a log message the breakpoint is a logpoint. Instead of breaking,
+    the message is logged, with the expressions in braces evaluated.
+    """
+
+    def __init__(self, parent, breakpoint):
+        super(PugdebugBreakpointDialog, self).__init__(parent)
+
+        self.breakpoint = breakpoint
+
+        self.setWindowTitle("Breakpoint on line %s" % breakpoint['lineno'])
+
+        self.expression = QLineEdit()
+        self.expression.setPlaceholderText("Break when true, like $id == 42")
+        if breakpoint.get('type') == 'conditional':
+            self.expression.setText(breakpoint.get('expression', ''))
+
+        self.hit_condition = QComboBox()
+        self.hit_condition.addItem("Every hit", '')
+        self.hit_condition.addItem("Hit count at least", '>=')
+        self.hit_condition.addItem("Hit count equals", '==')
+        self.hit_condition.addItem("Hit count is a multiple of", '%')
+
+        self.hit_value = QSpinBox()
+        self.hit_value.setRange(1, 999999999)
+
+        hit_value = get_hit_value(breakpoint)
+        hit_condition = breakpoint.get('hit_condition') or '>='
+        if hit_value > 0 and hit_condition in hit_conditions:
+            self.hit_condition.setCurrentIndex(
+                hit_conditions.index(hit_condition) + 1
+            )
+            self.hit_value.setValue(hit_value)
+
+        self.hit_condition.currentIndexChanged.connect(
+            self.handle_hit_condition_changed
+        )
+        self.handle_hit_condition_changed()
+
+        self.log = QLineEdit()
+        self.log.setPlaceholderText("Log instead of breaking, like id {$id}")
+        self.log.setText(breakpoint.get('log', ''))
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok |
+                                   QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QFormLayout()
+        layout.addRow("Condition", self.expression)
+        layout.addRow("Break on", self.hit_condition)
+        layout.addRow("Hit count", self.hit_value)
+        layout.addRow("Log message", self.log)
+        layout.addRow(buttons)
+        self.setLayout(layout)
+
+    def handle_hit_condition_changed(self):
+        self.hit_value.setEnabled(self.hit_condition.currentData() != '')
+
+    def get_breakpoint(self):
+        """Get the edited breakpoint
+
+        The breakpoint is a new one, without the id of the breakpoint that
+        was edited.
+        """
+        breakpoint = {
+            'type': 'line',
+            'filename': self.breakpoint['filename'],
+            'lineno': self.breakpoint['lineno']
+        }
+
+        expression = self.expression.text().strip()
+        if expression != '':
+            breakpoint['type'] = 'conditional'
+            breakpoint['expression'] = expression
+
+        hit_condition = self.hit_condition.currentData()
+        if hit_condition != '':
+            breakpoint['hit_condition'] = hit_condition
+            breakpoint['hit_value'] = self.hit_value.value()
+
+        log = self.log.text().strip()
+        if log != '':
+            breakpoint['log'] = log
+
+        return breakpoint
@@ -13,7 +13,7 @@ import math
 
 from PyQt5.QtCore import pyqtSignal, Qt, QRect
 from PyQt5.QtWidgets import (QWidget, QPlainTextEdit, QTextEdit, QGridLayout,
-                             QShortcut, QInputDialog)
+                             QShortcut, QInputDialog, QMenu)
 from PyQt5.QtGui import (QColor, QTextFormat, QTextCursor, QPainter,
                          QTextBlockUserData, QFont, QKeySequence)
 
@@ -35,9 +35,18 @@ class PugdebugDocument(QWidget):
 
     document_double_clicked_signal = pyqtSignal(str, int)
 
+    breakpoint_edit_requested_signal = pyqtSignal(str, int)
+
+    run_to_line_requested_signal = pyqtSignal(str, int)
+
+    # Profiled costs of the lines, formatted, by the line number
+    line_costs = None
+
     def __init__(self, document_model, formatter):
         super(PugdebugDocument, self).__init__()
 
+        self.line_costs = {}
+
         # The QPlainTextEdit widget that holds the contents of the document
         self.document_contents = PugdebugDocumentContents(
             self,
@@ -98,7 +107,8 @@ class PugdebugDocument(QWidget):
         """Paint the line numbers
 
         For every visible block in the document draw it's corresponding line
-        number in the line numbers widget.
+        number in the line numbers widget, and the profiled cost of the line
+        if there is one.
         """
         font_metrics = self.document_contents.fontMetrics()
 
@@ -118,16 +128,18 @@ class PugdebugDocument(QWidget):
             content_offset = self.document_contents.contentOffset()
             # Get the top coordinate of the current block
             # to know where to paint the line number for it
-            block_top = (self.document_contents
-                             .blockBoundingGeometry(block)
-                             .translated(content_offset)
-                             .top())
+            block_top = int(self.document_contents
+                                .blockBoundingGeometry(block)
+                                .translated(content_offset)
+                                .top())
 
             if not block.isVisible() or block_top >= event.rect().bottom():
                 break
 
             # If block has a breakpoint,
-            # draw a green rectangle by the line number
+            # draw a green rectangle by the line number,
+            # a yellow one if the breakpoint is conditional,
+            # a blue one if it is a logpoint
             # if the block number matches the current line number
             # make it red, as it is then a breakpoint hit
             if self.document_contents.block_has_breakpoint(block):
@@ -135,12 +147,28 @@ class PugdebugDocument(QWidget):
                 brush.setStyle(Qt.SolidPattern)
                 if self.document_contents.block_is_current(block):
                     brush.setColor(Qt.red)
+                elif self.document_contents.block_has_logpoint(block):
+                    brush.setColor(Qt.darkCyan)
+                elif self.document_contents.block_has_conditional_breakpoint(
+                    block
+                ):
+                    brush.setColor(Qt.darkYellow)
                 else:
                     brush.setColor(Qt.darkGreen)
                 painter.setBrush(brush)
                 rect = QRect(0, block_top + 2, 7, 7)
                 painter.drawRect(rect)
 
+            # Paint the profiled cost of the line between the breakpoint
+            # marker and the line number
+            if line_number in self.line_costs:
+                pen = painter.pen()
+                painter.setPen(Qt.darkMagenta)
+                painter.drawText(9, block_top, line_numbers.costs_width,
+                                 height, Qt.AlignLeft,
+                                 self.line_costs[line_number])
+                painter.setPen(pen)
+
             # Convert the line number to string so we can paint it
             text = str(line_number)
 
@@ -161,6 +189,47 @@ class PugdebugDocument(QWidget):
         self.document_contents.remove_line_highlights()
         self.rehighlight_breakpoint_lines()
 
+    def set_breakpoint_markers(self, markers):
+        """Mark the lines with breakpoints, and unmark all the others
+
+        The markers are whether the breakpoint is conditional and whether
+        it is a logpoint, by the line number. This way the lines are marked
+        the same, no matter how their breakpoints were set.
+        """
+        block = self.document_contents.document().firstBlock()
+
+        while block.isValid():
+            marker = markers.get(block.blockNumber() + 1)
+
+            if marker is not None:
+                self.document_contents.block_set_breakpoint(block, *marker)
+            elif self.document_contents.block_has_breakpoint(block):
+                self.document_contents.block_remove_breakpoint(block)
+
+            block = block.next()
+
+        self.rehighlight_breakpoint_lines()
+
+    def set_line_costs(self, line_costs):
+        """Set the profiled costs of the lines, painted by the line numbers
+
+        The costs are formatted already, like `12.5%`. No costs clear them.
+        """
+        self.line_costs = line_costs
+
+        if len(line_costs) > 0:
+            font_metrics = self.line_numbers.fontMetrics()
+            costs_width = max(font_metrics.width(cost)
+                              for cost in line_costs.values()) + 6
+        else:
+            costs_width = 0
+
+        self.line_numbers.set_costs_width(costs_width)
+        self.line_numbers.set_numbers_width(
+            self.document_contents.blockCount()
+        )
+        self.line_numbers.update()
+
     def rehighlight_breakpoint_lines(self):
         """Rehighlight breakpoint lines
 
@@ -245,7 +314,39 @@ class PugdebugDocumentContents(QPlainTextEdit):
         )
 
     def contextMenuEvent(self, event):
-        pass
+        """Show a menu to run to the clicked line, or to edit it's
+        breakpoint
+
+        The breakpoint can be made conditional on an expression or a hit
+        count there.
+        """
+        block = self.cursorForPosition(event.pos()).block()
+
+        if len(block.text()) == 0:
+            return
+
+        path = self.document_model.path
+        line_number = block.blockNumber() + 1
+
+        menu = QMenu(self)
+
+        run_to_line_action = menu.addAction("Run to line")
+        run_to_line_action.triggered.connect(
+            lambda: self.document_widget.run_to_line_requested_signal.emit(
+                path,
+                line_number
+            )
+        )
+
+        edit_breakpoint_action = menu.addAction("Edit breakpoint...")
+        edit_breakpoint_action.triggered.connect(
+            lambda: self.document_widget.breakpoint_edit_requested_signal.emit(
+                path,
+                line_number
+            )
+        )
+
+        menu.exec_(event.globalPos())
 
     def move_to_line(self, line, is_current=True):
         """Move cursor to line
@@ -313,14 +414,27 @@ class PugdebugDocumentContents(QPlainTextEdit):
         user_data = self.__get_block_user_data(block)
         return user_data.breakpoint
 
-    def block_set_breakpoint(self, block):
+    def block_has_conditional_breakpoint(self, block):
+        user_data = self.__get_block_user_data(block)
+        return user_data.breakpoint and user_data.is_conditional
+
+    def block_has_logpoint(self, block):
+        user_data = self.__get_block_user_data(block)
+        return user_data.breakpoint and user_data.is_logpoint
+
+    def block_set_breakpoint(self, block, is_conditional=False,
+                             is_logpoint=False):
         user_data = self.__get_block_user_data(block)
         user_data.breakpoint = True
+        user_data.is_conditional = is_conditional
+        user_data.is_logpoint = is_logpoint
         block.setUserData(user_data)
 
     def block_remove_breakpoint(self, block):
         user_data = self.__get_block_user_data(block)
         user_data.breakpoint = False
+        user_data.is_conditional = False
+        user_data.is_logpoint = False
         block.setUserData(user_data)
 
     def block_is_current(self, block):
@@ -343,6 +457,8 @@ class PugdebugLineNumbers(QWidget):
 
     document_widget = None
 
+    costs_width = 0
+
     def __init__(self, document_widget):
         super(PugdebugLineNumbers, self).__init__()
 
@@ -356,9 +472,12 @@ class PugdebugLineNumbers(QWidget):
     def set_numbers_width(self, number_of_lines):
         digits = int(math.log10(number_of_lines) + 1)
         # add 7 to have space to paint the breakpoint markers
-        width = digits * 10 + 7
+        width = digits * 10 + 7 + self.costs_width
         self.setFixedWidth(width)
 
+    def set_costs_width(self, costs_width):
+        self.costs_width = costs_width
+
     def paintEvent(self, event):
         self.document_widget.paint_line_numbers(self, event)
 
@@ -366,6 +485,8 @@ class PugdebugLineNumbers(QWidget):
 class PugdebugBlockData(QTextBlockUserData):
 
     breakpoint = False
+    is_conditional = False
+    is_logpoint = False
     is_current = False
 
     def __init__(self):
@@ -70,6 +70,8 @@ class PugdebugDocumentViewer(QTabWidget):
 
     def get_document_by_path(self, path):
         index = self.find_tab_index_by_path(path)
+        if index is None:
+            return None
         return self.widget(index)
 
     def get_all_documents(self):
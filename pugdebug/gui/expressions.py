@@ -9,20 +9,21 @@
 
 __author__ = "robertbasic"
 
-import base64
-
 from PyQt5.QtCore import Qt, pyqtSignal, QSize
 from PyQt5.QtGui import QIcon, QKeySequence
 from PyQt5.QtWidgets import (QMenu, QWidget, QTreeWidget, QTreeWidgetItem,
                              QAction, QToolBar, QVBoxLayout, QAbstractItemView)
 
 from pugdebug.models.settings import get_setting, set_setting, has_setting
+from pugdebug.models.variables import (PugdebugChildVariables,
+                                       get_variable_type, get_variable_value)
 
 
 class PugdebugExpressionViewer(QWidget):
 
     expression_added_signal = pyqtSignal(int, str)
     expression_changed_signal = pyqtSignal(int, str)
+    expressions_changed_signal = pyqtSignal(list)
 
     def __init__(self):
         super(PugdebugExpressionViewer, self).__init__()
@@ -50,6 +51,7 @@ class PugdebugExpressionViewer(QWidget):
         self.tree.setSelectionMode(QAbstractItemView.ContiguousSelection)
         self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
         self.tree.customContextMenuRequested.connect(self.show_context_menu)
+        self.tree.itemExpanded.connect(self.handle_item_expanded)
 
         layout = QVBoxLayout()
         layout.addWidget(self.toolbar)
@@ -111,6 +113,7 @@ class PugdebugExpressionViewer(QWidget):
             item = self.tree.topLevelItem(index)
             item.setData(1, Qt.DisplayRole, '')
             item.setData(2, Qt.DisplayRole, '')
+            item.setData(2, Qt.UserRole, None)
             item.takeChildren()
 
     def delete_expression(self, item):
@@ -129,18 +132,49 @@ class PugdebugExpressionViewer(QWidget):
 
     def set_evaluated(self, index, result):
         """Displays an evaluated expression result"""
-        type = self.decode_type(result)
-        value = self.decode_value(result)
+        type = get_variable_type(result)
+        value = get_variable_value(result)
 
         item = self.tree.topLevelItem(index)
+
+        # The expression was deleted while it was being evaluated
+        if item is None:
+            return
+
         item.setText(1, type)
         item.setText(2, value)
 
         variables = result['variables'] if 'variables' in result else []
         self.set_variables(item, variables)
 
+    def handle_item_expanded(self, item):
+        """Display the children of an item when it is expanded"""
+        children = item.data(2, Qt.UserRole)
+
+        if children is not None:
+            self.set_variables(item, children.variables)
+
     def set_variables(self, parent, variables):
-        """Display an array of variables for the given parent item"""
+        """Display an array of variables for the given parent item
+
+        The variables are displayed only if the parent item is expanded,
+        otherwise they are kept on the item until it's expanded, so values
+        that are not displayed are not decoded.
+        """
+        # Kept on the value column, changes to the expression column
+        # would evaluate the expression again
+        parent.setData(2, Qt.UserRole, PugdebugChildVariables(variables))
+
+        if len(variables) > 0:
+            parent.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+        else:
+            parent.setChildIndicatorPolicy(
+                QTreeWidgetItem.DontShowIndicatorWhenChildless
+            )
+
+        if not parent.isExpanded():
+            return
+
         for index, variable in enumerate(variables):
             self.set_variable(parent, index, variable)
 
@@ -153,8 +187,8 @@ class PugdebugExpressionViewer(QWidget):
     def set_variable(self, parent, index, variable):
         """Display a single variable within the given parent item"""
         name = variable['name']
-        type = self.decode_type(variable)
-        value = self.decode_value(variable)
+        type = get_variable_type(variable)
+        value = get_variable_value(variable)
 
         item = parent.child(index)
         if item is None:
@@ -168,40 +202,14 @@ class PugdebugExpressionViewer(QWidget):
             item.setData(2, Qt.DisplayRole, value)
 
         # Recurse (we need to go deeper)
-        if 'variables' in variable:
-            self.set_variables(item, variable['variables'])
-
-    def decode_type(self, result):
-        if 'type' not in result:
-            return ''
-
-        # Display the class name instead of type for objects
-        if result['type'] == 'object':
-            return result['classname']
-
-        return result['type']
-
-    def decode_value(self, result):
-        value = None
-
-        if 'value' in result:
-            value = result['value']
-
-        if 'encoding' in result and value is not None:
-            value = base64.b64decode(value)
-            try:
-                value = value.decode()
-            except:
-                value = repr(value)
-
-        if result['type'] == 'bool':
-            value = 'false' if value == '0' else 'true'
-
-        return value
+        self.set_variables(item, variable.get('variables', []))
 
     def save_state(self):
         """Save current expressions to settings"""
-        set_setting('expressions_viewer/expressions', self.get_expressions())
+        expressions = self.get_expressions()
+        set_setting('expressions_viewer/expressions', expressions)
+
+        self.expressions_changed_signal.emit(expressions)
 
     def restore_state(self):
         """Load expressions from settings"""
@@ -10,7 +10,7 @@
 __author__ = "robertbasic"
 
 from PyQt5.QtWidgets import (QLineEdit, QFormLayout, QSpinBox, QCheckBox,
-                             QGroupBox)
+                             QGroupBox, QPlainTextEdit)
 
 
 class PugdebugSettingsForm():
@@ -23,18 +23,53 @@ class PugdebugSettingsForm():
             'debugger/host': QLineEdit(),
             'debugger/port_number': QSpinBox(),
             'debugger/idekey': QLineEdit(),
+            'debugger/backlog': QSpinBox(),
+            'debugger/handshake_timeout': QSpinBox(),
+            'debugger/command_timeout': QSpinBox(),
+            'debugger/eval_timeout': QSpinBox(),
             'debugger/break_at_first_line': QCheckBox("Break at first line"),
+            'debugger/fetch_state': QCheckBox(
+                "Fetch variables together with steps"
+            ),
             'debugger/max_depth': QLineEdit(),
             'debugger/max_children': QLineEdit(),
             'debugger/max_data': QLineEdit(),
+            'debugger/listen_on_all_projects': QCheckBox(
+                "Listen on the ports of all projects"
+            ),
+            'debugger/recordings_dir': QLineEdit(),
+            'debugger/proxy': QLineEdit(),
+            'debugger/max_pending_connections': QSpinBox(),
+            'debugger/connection_rules': QPlainTextEdit(),
             'editor/tab_width': QSpinBox(),
             'editor/font_size': QSpinBox(),
+            'editor/stall_threshold': QSpinBox(),
         }
 
         # Widget settings
         self.widgets['debugger/port_number'].setRange(1, 65535)
+        self.widgets['debugger/backlog'].setRange(1, 1024)
+        self.widgets['debugger/handshake_timeout'].setRange(1, 60)
+        self.widgets['debugger/handshake_timeout'].setSuffix(" s")
+        self.widgets['debugger/command_timeout'].setRange(1, 3600)
+        self.widgets['debugger/command_timeout'].setSuffix(" s")
+        self.widgets['debugger/eval_timeout'].setRange(1, 3600)
+        self.widgets['debugger/eval_timeout'].setSuffix(" s")
+        self.widgets['debugger/proxy'].setPlaceholderText("host:9001")
+        self.widgets['debugger/proxy'].setToolTip(
+            "The port above is registered with the proxy, once per IDE key"
+        )
+        self.widgets['debugger/max_pending_connections'].setRange(1, 1024)
+        self.widgets['debugger/connection_rules'].setPlaceholderText(
+            "detach fileuri */vendor/*\nrun request_uri /assets/*"
+        )
+        self.widgets['debugger/connection_rules'].setMaximumHeight(80)
         self.widgets['editor/tab_width'].setRange(1, 120)
         self.widgets['editor/font_size'].setRange(8, 24)
+        self.widgets['editor/stall_threshold'].setRange(0, 10000)
+        self.widgets['editor/stall_threshold'].setSingleStep(100)
+        self.widgets['editor/stall_threshold'].setSuffix(" ms")
+        self.widgets['editor/stall_threshold'].setSpecialValueText("Off")
 
         self.setup_path_widgets()
         self.setup_debugger_widgets()
@@ -53,16 +88,53 @@ class PugdebugSettingsForm():
         debugger_layout.addRow("Host", self.widgets['debugger/host'])
         debugger_layout.addRow("Port", self.widgets['debugger/port_number'])
         debugger_layout.addRow("IDE Key", self.widgets['debugger/idekey'])
+        debugger_layout.addRow(
+            "Connection backlog",
+            self.widgets['debugger/backlog']
+        )
+        debugger_layout.addRow(
+            "Init timeout",
+            self.widgets['debugger/handshake_timeout']
+        )
+        debugger_layout.addRow(
+            "Command timeout",
+            self.widgets['debugger/command_timeout']
+        )
+        debugger_layout.addRow(
+            "Eval timeout",
+            self.widgets['debugger/eval_timeout']
+        )
         debugger_layout.addRow(
             "",
             self.widgets['debugger/break_at_first_line']
         )
+        debugger_layout.addRow("", self.widgets['debugger/fetch_state'])
         debugger_layout.addRow("Max depth", self.widgets['debugger/max_depth'])
         debugger_layout.addRow(
             "Max children",
             self.widgets['debugger/max_children']
         )
         debugger_layout.addRow("Max data", self.widgets['debugger/max_data'])
+        debugger_layout.addRow(
+            "",
+            self.widgets['debugger/listen_on_all_projects']
+        )
+        debugger_layout.addRow(
+            "Record sessions to",
+            self.widgets['debugger/recordings_dir']
+        )
+        debugger_layout.addRow(
+            "Register with DBGp proxy",
+            self.widgets['debugger/proxy']
+        )
+        debugger_layout.addRow(
+            "Max pending connections",
+            self.widgets['debugger/max_pending_connections']
+        )
+        debugger_layout.addRow(
+            "Skip connections",
+            self.widgets['debugger/connection_rules']
+        )
 
         self.debugger_group = QGroupBox("Debugger")
         self.debugger_group.setLayout(debugger_layout)
@@ -71,6 +143,10 @@ class PugdebugSettingsForm():
         editor_layout = QFormLayout()
         editor_layout.addRow("Tab width", self.widgets['editor/tab_width'])
         editor_layout.addRow("Font size", self.widgets['editor/font_size'])
+        editor_layout.addRow(
+            "Log GUI stalls over",
+            self.widgets['editor/stall_threshold']
+        )
 
         self.editor_group = QGroupBox("Editor")
         self.editor_group.setLayout(editor_layout)
@@ -80,6 +156,8 @@ class PugdebugSettingsForm():
         """
         if isinstance(widget, QLineEdit):
             widget.setText(value)
+        elif isinstance(widget, QPlainTextEdit):
+            widget.setPlainText(value)
         elif isinstance(widget, QSpinBox):
             widget.setValue(int(value))
         elif isinstance(widget, QCheckBox):
@@ -93,6 +171,8 @@ class PugdebugSettingsForm():
         """
         if isinstance(widget, QLineEdit):
             return widget.text()
+        elif isinstance(widget, QPlainTextEdit):
+            return widget.toPlainText()
         elif isinstance(widget, QSpinBox):
             return widget.value()
         elif isinstance(widget, QCheckBox):
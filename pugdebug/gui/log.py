@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+from PyQt5.QtWidgets import (QWidget, QPlainTextEdit, QPushButton,
+                             QVBoxLayout, QHBoxLayout)
+
+
+class PugdebugLogViewer(QWidget):
+    """Show the messages logged by logpoints
+
+    Only the latest entries are kept, the oldest ones are dropped as new
+    ones are logged.
+    """
+
+    max_entries = 10000
+
+    def __init__(self):
+        super(PugdebugLogViewer, self).__init__()
+
+        self.entries = QPlainTextEdit()
+        self.entries.setReadOnly(True)
+        self.entries.setMaximumBlockCount(self.max_entries)
+
+        self.clear_button = QPushButton("Clear")
+        self.clear_button.clicked.connect(self.entries.clear)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(self.clear_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.entries)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+    def append_entry(self, entry):
+        self.entries.appendPlainText(entry)
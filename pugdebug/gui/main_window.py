@@ -11,7 +11,7 @@ __author__ = "robertbasic"
 
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtWidgets import (QMainWindow, QToolBar, QMenuBar, QDockWidget,
-                             QAction)
+                             QAction, QToolButton)
 from PyQt5.QtGui import QFont, QKeySequence
 
 from pugdebug.gui.file_browser import PugdebugFileBrowser
@@ -19,12 +19,16 @@ from pugdebug.gui.settings import PugdebugSettingsWindow
 from pugdebug.gui.projects import (PugdebugNewProjectWindow,
                                    PugdebugProjectsBrowser)
 from pugdebug.gui.search import PugdebugFileSearchWindow
+from pugdebug.gui.auto_step import PugdebugAutoStepWindow
 from pugdebug.gui.documents import PugdebugDocumentViewer
 from pugdebug.gui.variables import PugdebugVariableViewer
 from pugdebug.gui.stacktraces import PugdebugStacktraceViewer
 from pugdebug.gui.breakpoints import PugdebugBreakpointViewer
 from pugdebug.gui.expressions import PugdebugExpressionViewer
+from pugdebug.gui.log import PugdebugLogViewer
+from pugdebug.gui.profile import PugdebugProfileViewer
 from pugdebug.gui.statusbar import PugdebugStatusBar
+from pugdebug.gui.timings import PugdebugTimingsViewer
 from pugdebug.models.settings import get_setting, set_setting, has_setting
 
 
@@ -50,7 +54,11 @@ class PugdebugMainWindow(QMainWindow):
         self.breakpoint_viewer = PugdebugBreakpointViewer()
         self.stacktrace_viewer = PugdebugStacktraceViewer()
         self.expression_viewer = PugdebugExpressionViewer()
+        self.timings_viewer = PugdebugTimingsViewer()
+        self.log_viewer = PugdebugLogViewer()
+        self.profile_viewer = PugdebugProfileViewer()
         self.file_search_window = PugdebugFileSearchWindow(self)
+        self.auto_step_window = PugdebugAutoStepWindow(self)
 
         self.setCentralWidget(self.document_viewer)
 
@@ -92,6 +100,10 @@ class PugdebugMainWindow(QMainWindow):
         self.statusBar().addPermanentWidget(self.permanent_statusbar)
         self.set_debugging_status(0)
 
+        timings_button = QToolButton()
+        timings_button.setDefaultAction(self.timings_dock.toggleViewAction())
+        self.statusBar().addPermanentWidget(timings_button)
+
     def setup_fonts(self):
         font = QFont('mono')
         font.setStyleHint(QFont.Monospace)
@@ -135,6 +147,28 @@ class PugdebugMainWindow(QMainWindow):
             Qt.BottomDockWidgetArea
         )
 
+        self.__add_dock_widget(
+            self.log_viewer,
+            "Log",
+            Qt.BottomDockWidgetArea
+        )
+
+        # Hidden until shown from the status bar or the view menu
+        self.timings_dock = self.__add_dock_widget(
+            self.timings_viewer,
+            "Timings",
+            Qt.BottomDockWidgetArea
+        )
+        self.timings_dock.hide()
+
+        # Hidden until a profile is opened
+        self.profile_dock = self.__add_dock_widget(
+            self.profile_viewer,
+            "Profile",
+            Qt.BottomDockWidgetArea
+        )
+        self.profile_dock.hide()
+
     def setup_file_actions(self):
         self.new_project_action = QAction("&New project", self)
         self.new_project_action.setToolTip("Create a new project (Ctrl+N)")
@@ -152,6 +186,17 @@ class PugdebugMainWindow(QMainWindow):
         self.show_settings_action.setShortcut(QKeySequence("Ctrl+S"))
         self.show_settings_action.triggered.connect(self.settings_window.exec)
 
+        self.open_profile_action = QAction("Open &profile...", self)
+        self.open_profile_action.setToolTip(
+            "Open a cachegrind profile (Ctrl+Shift+P)"
+        )
+        self.open_profile_action.setStatusTip(
+            "Open a cachegrind profile of the Xdebug profiler, or an "
+            "Xdebug function trace. Shortcut: Ctrl+Shift+P"
+        )
+        self.open_profile_action.setShortcut(QKeySequence("Ctrl+Shift+P"))
+        self.open_profile_action.triggered.connect(self.open_profile)
+
         self.quit_action = QAction("&Quit", self)
         self.quit_action.setToolTip("Exit the application (Alt+F4)")
         self.quit_action.setStatusTip("Exit the application. Shortcut: Alt+F4")
@@ -200,6 +245,14 @@ class PugdebugMainWindow(QMainWindow):
         )
         self.run_debug_action.setShortcut(QKeySequence("F5"))
 
+        self.pause_debug_action = QAction("Pause", self)
+        self.pause_debug_action.setToolTip("Pause the running script (F9)")
+        self.pause_debug_action.setStatusTip(
+            "Break into the script while it is running, on the line it got "
+            "to. Shortcut: F9"
+        )
+        self.pause_debug_action.setShortcut(QKeySequence("F9"))
+
         self.step_over_action = QAction("Over", self)
         self.step_over_action.setToolTip("Step over the next statement (F6)")
         self.step_over_action.setStatusTip(
@@ -227,6 +280,17 @@ class PugdebugMainWindow(QMainWindow):
         )
         self.step_out_action.setShortcut(QKeySequence("F8"))
 
+        self.auto_step_action = QAction("Auto step...", self)
+        self.auto_step_action.setToolTip(
+            "Step until an expression is true or changes (Shift+F6)"
+        )
+        self.auto_step_action.setStatusTip(
+            "Step over or into the statements, without refreshing on every "
+            "step, until the given number of steps is done, an expression "
+            "is true or it's value changes. Shortcut: Shift+F6"
+        )
+        self.auto_step_action.setShortcut(QKeySequence("Shift+F6"))
+
     def setup_search_actions(self):
         self.file_search_action = QAction("&File search...", self)
         self.file_search_action.setToolTip(
@@ -249,6 +313,7 @@ class PugdebugMainWindow(QMainWindow):
         toolbar.addAction(self.detach_debug_action)
         toolbar.addSeparator()
         toolbar.addAction(self.run_debug_action)
+        toolbar.addAction(self.pause_debug_action)
         toolbar.addAction(self.step_over_action)
         toolbar.addAction(self.step_into_action)
         toolbar.addAction(self.step_out_action)
@@ -261,6 +326,7 @@ class PugdebugMainWindow(QMainWindow):
         file_menu = menu_bar.addMenu("&File")
         file_menu.addAction(self.new_project_action)
         file_menu.addAction(self.show_settings_action)
+        file_menu.addAction(self.open_profile_action)
         file_menu.addSeparator()
         file_menu.addAction(self.quit_action)
 
@@ -278,9 +344,11 @@ class PugdebugMainWindow(QMainWindow):
         debug_menu.addAction(self.detach_debug_action)
         debug_menu.addSeparator()
         debug_menu.addAction(self.run_debug_action)
+        debug_menu.addAction(self.pause_debug_action)
         debug_menu.addAction(self.step_over_action)
         debug_menu.addAction(self.step_into_action)
         debug_menu.addAction(self.step_out_action)
+        debug_menu.addAction(self.auto_step_action)
 
         search_menu = menu_bar.addMenu("&Search")
         search_menu.addAction(self.file_search_action)
@@ -291,9 +359,11 @@ class PugdebugMainWindow(QMainWindow):
         self.stop_debug_action.setEnabled(enabled)
         self.detach_debug_action.setEnabled(enabled)
         self.run_debug_action.setEnabled(enabled)
+        self.pause_debug_action.setEnabled(enabled)
         self.step_over_action.setEnabled(enabled)
         self.step_into_action.setEnabled(enabled)
         self.step_out_action.setEnabled(enabled)
+        self.auto_step_action.setEnabled(enabled)
 
         self.start_listening_action.setEnabled(not enabled)
 
@@ -318,9 +388,20 @@ class PugdebugMainWindow(QMainWindow):
     def get_breakpoint_viewer(self):
         return self.breakpoint_viewer
 
+    def get_log_viewer(self):
+        return self.log_viewer
+
     def get_expression_viewer(self):
         return self.expression_viewer
 
+    def get_profile_viewer(self):
+        return self.profile_viewer
+
+    def open_profile(self):
+        self.profile_dock.show()
+        self.profile_dock.raise_()
+        self.profile_viewer.handle_open()
+
     def handle_project_deleted(self, is_project_current):
         if is_project_current:
             self.set_window_title(None)
@@ -341,3 +422,5 @@ class PugdebugMainWindow(QMainWindow):
         dw.setObjectName(object_name)
         dw.setWidget(widget)
         self.addDockWidget(area, dw)
+
+        return dw
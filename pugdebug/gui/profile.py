@@ -0,0 +1,531 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import os
+
+from PyQt5.QtCore import (Qt, QThread, QAbstractTableModel, QModelIndex,
+                          pyqtSignal)
+from PyQt5.QtWidgets import (QWidget, QTableView, QTreeWidget,
+                             QTreeWidgetItem, QAbstractItemView, QSplitter,
+                             QTabWidget, QPushButton, QLabel, QFileDialog,
+                             QVBoxLayout, QHBoxLayout)
+
+from pugdebug.models.profile import PugdebugProfileDiff, read_cachegrind
+from pugdebug.models.trace import PugdebugTrace, is_trace, read_trace
+
+
+class PugdebugProfileLoader(QThread):
+    """Read a profile or a trace in the background, so the GUI doesn't
+    freeze
+    """
+
+    loaded_signal = pyqtSignal(object)
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, path):
+        super(PugdebugProfileLoader, self).__init__()
+
+        self.path = path
+
+    def run(self):
+        try:
+            if is_trace(self.path):
+                loaded = read_trace(self.path)
+            else:
+                loaded = read_cachegrind(self.path)
+        except (OSError, ValueError) as e:
+            self.error_signal.emit(str(e))
+        else:
+            self.loaded_signal.emit(loaded)
+
+
+class PugdebugProfileModel(QAbstractTableModel):
+    """The functions of a profile, as a table of their costs
+
+    Only the rows that are shown are ever asked for, so the model holds
+    just the order of the functions, not the rows of the table.
+    """
+
+    def __init__(self, profile):
+        super(PugdebugProfileModel, self).__init__()
+
+        self.profile = profile
+
+        self.columns = [
+            ('Function', profile.get_function_name),
+            ('File', self.get_file),
+            ('Calls', lambda function: profile.calls[function])
+        ]
+
+        for event, name in enumerate(profile.events):
+            self.columns.append(
+                ('Self %s' % name, profile.self_costs[event].__getitem__)
+            )
+            self.columns.append(
+                ('Inclusive %s' % name,
+                 profile.inclusive_costs[event].__getitem__)
+            )
+
+        self.order = list(range(profile.get_function_count()))
+
+    def get_file(self, function):
+        filename = self.profile.get_function_file(function)
+        line = self.profile.get_function_line(function)
+
+        if line > 0:
+            return '%s:%d' % (os.path.basename(filename), line)
+
+        return os.path.basename(filename)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section][0]
+
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        function = self.order[index.row()]
+
+        if role == Qt.DisplayRole:
+            return self.format_value(
+                index.column(),
+                self.columns[index.column()][1](function)
+            )
+
+        if role == Qt.TextAlignmentRole and index.column() > 1:
+            return Qt.AlignRight | Qt.AlignVCenter
+
+        if role == Qt.ToolTipRole:
+            profile, function = self.get_function(index.row())
+            return profile.get_function_file(function)
+
+        return None
+
+    def format_value(self, column, value):
+        return format(value, ',') if isinstance(value, int) else value
+
+    def get_sort_key(self, column):
+        return self.columns[column][1]
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+
+        self.order.sort(key=self.get_sort_key(column),
+                        reverse=order == Qt.DescendingOrder)
+
+        self.layoutChanged.emit()
+
+    def get_function(self, row):
+        """Get the profile and the index of the function of a row"""
+        return self.profile, self.order[row]
+
+    def get_row(self, profile, function):
+        """Get the row of a function, None if it is not shown"""
+        if profile is not self.profile:
+            return None
+
+        return self.order.index(function)
+
+
+class PugdebugProfileDiffModel(PugdebugProfileModel):
+    """The functions of two profiles, as a table of the changes of their
+    costs
+    """
+
+    def __init__(self, diff):
+        QAbstractTableModel.__init__(self)
+
+        self.diff = diff
+
+        self.columns = [
+            ('Function', diff.get_function_name),
+            ('File', self.get_file),
+            ('Before', diff.before_inclusive.__getitem__),
+            ('After', diff.after_inclusive.__getitem__),
+            ('Delta', diff.inclusive_deltas.__getitem__),
+            ('Delta %', diff.get_relative_delta),
+            ('Self before', diff.before_self.__getitem__),
+            ('Self after', diff.after_self.__getitem__),
+            ('Self delta', diff.self_deltas.__getitem__)
+        ]
+
+        self.order = list(range(len(diff)))
+
+    def get_file(self, row):
+        filename = self.diff.get_function_file(row)
+        line = self.diff.get_function_line(row)
+
+        if line > 0:
+            return '%s:%d' % (os.path.basename(filename), line)
+
+        return os.path.basename(filename)
+
+    def format_value(self, column, value):
+        if column == 5:
+            return 'new' if value is None else '%+.1f%%' % value
+
+        if column in (4, 8):
+            return format(value, '+,')
+
+        return super(PugdebugProfileDiffModel, self).format_value(column,
+                                                                  value)
+
+    def get_sort_key(self, column):
+        # New functions grew the most
+        if column == 5:
+            return self.diff.relative_deltas.__getitem__
+
+        return super(PugdebugProfileDiffModel, self).get_sort_key(column)
+
+    def get_function(self, row):
+        return self.diff.get_profile_function(self.order[row])
+
+    def get_row(self, profile, function):
+        if profile is self.diff.after:
+            functions = self.diff.after_functions
+        elif profile is self.diff.before:
+            functions = self.diff.before_functions
+        else:
+            return None
+
+        return self.order.index(functions.index(function))
+
+
+class PugdebugProfileViewer(QWidget):
+    """Show where the time of a profiled request went
+
+    The hotspots are the functions of the profile, sortable by their self
+    and inclusive costs. The callers and the callees of the selected
+    function are shown below them. Double clicking a function shows it's
+    line in the document.
+
+    A function trace is shown as the profile of it's functions, and it's
+    calls are shown as a tree, as they were made.
+
+    A profile can be compared with the one that is shown, the changes of
+    the costs of the functions are shown then, the largest regression
+    first.
+    """
+
+    # Calls shown at most when a call of a trace is expanded
+    max_children = 1000
+
+    item_double_clicked_signal = pyqtSignal(str, int)
+
+    profile_loaded_signal = pyqtSignal(object)
+
+    def __init__(self):
+        super(PugdebugProfileViewer, self).__init__()
+
+        self.profile = None
+        self.trace = None
+        self.loader = None
+
+        # The profile the callers and the callees are of
+        self.calls_profile = None
+
+        self.open_button = QPushButton("Open...")
+        self.open_button.clicked.connect(self.handle_open)
+
+        self.compare_button = QPushButton("Compare with...")
+        self.compare_button.setToolTip(
+            "Compare a profile with the one that is shown"
+        )
+        self.compare_button.setEnabled(False)
+        self.compare_button.clicked.connect(self.handle_compare)
+
+        self.status = QLabel()
+
+        self.hotspots = QTableView()
+        self.hotspots.setSortingEnabled(True)
+        self.hotspots.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.hotspots.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.hotspots.verticalHeader().hide()
+        self.hotspots.doubleClicked.connect(self.handle_hotspot_double_clicked)
+
+        self.callers = self.__create_calls_tree('Caller')
+        self.callees = self.__create_calls_tree('Callee')
+
+        calls = QSplitter(Qt.Horizontal)
+        calls.addWidget(self.callers)
+        calls.addWidget(self.callees)
+
+        self.call_tree = QTreeWidget()
+        self.call_tree.setColumnCount(4)
+        self.call_tree.setHeaderLabels(['Call', 'Called from', 'Time ms',
+                                        'Memory'])
+        self.call_tree.setColumnWidth(0, 300)
+        self.call_tree.setColumnWidth(1, 200)
+        self.call_tree.itemExpanded.connect(self.handle_call_expanded)
+        self.call_tree.itemDoubleClicked.connect(
+            self.handle_call_tree_double_clicked
+        )
+
+        self.tabs = QTabWidget()
+        self.tabs.addTab(calls, "Callers / callees")
+        self.tabs.addTab(self.call_tree, "Call tree")
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.hotspots)
+        splitter.addWidget(self.tabs)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.open_button)
+        buttons.addWidget(self.compare_button)
+        buttons.addWidget(self.status)
+        buttons.addStretch()
+
+        layout = QVBoxLayout()
+        layout.addLayout(buttons)
+        layout.addWidget(splitter)
+        self.setLayout(layout)
+
+    def handle_open(self):
+        path = self.__get_open_file_name("Open profile")
+
+        if path:
+            self.load_profile(path, self.handle_loaded)
+
+    def handle_compare(self):
+        path = self.__get_open_file_name("Compare with profile")
+
+        if path:
+            self.load_profile(path, self.handle_compare_loaded)
+
+    def load_profile(self, path, handle_loaded):
+        self.open_button.setEnabled(False)
+        self.compare_button.setEnabled(False)
+        self.status.setText("Loading %s..." % os.path.basename(path))
+
+        self.loader = PugdebugProfileLoader(path)
+        self.loader.loaded_signal.connect(handle_loaded)
+        self.loader.error_signal.connect(self.handle_error)
+        self.loader.finished.connect(self.handle_loader_finished)
+        self.loader.start()
+
+    def handle_loader_finished(self):
+        self.open_button.setEnabled(True)
+        self.compare_button.setEnabled(self.profile is not None)
+
+    def handle_error(self, error):
+        self.status.setText("Could not load the profile: %s" % error)
+
+    def handle_loaded(self, loaded):
+        if isinstance(loaded, PugdebugTrace):
+            self.set_profile(loaded.profile, loaded)
+        else:
+            self.set_profile(loaded)
+
+    def handle_compare_loaded(self, loaded):
+        """Compare the loaded profile, as after, with the shown one"""
+        if isinstance(loaded, PugdebugTrace):
+            profile, trace = loaded.profile, loaded
+        else:
+            profile, trace = loaded, None
+
+        try:
+            diff = PugdebugProfileDiff(self.profile, profile)
+        except ValueError as e:
+            self.handle_error(str(e))
+            return
+
+        self.set_profile(profile, trace, diff)
+
+    def set_profile(self, profile, trace=None, diff=None):
+        """Show a profile, or the diff of the shown one and a profile"""
+        self.profile = profile
+        self.trace = trace
+
+        if diff is None:
+            self.status.setText("%s, %s functions" % (
+                profile.cmd or "Profile",
+                format(profile.get_function_count(), ',')
+            ))
+            self.hotspots.setModel(PugdebugProfileModel(profile))
+        else:
+            self.status.setText("%s compared, %s functions" % (
+                diff.event,
+                format(len(diff), ',')
+            ))
+            self.hotspots.setModel(PugdebugProfileDiffModel(diff))
+
+        self.hotspots.selectionModel().currentRowChanged.connect(
+            self.handle_hotspot_changed
+        )
+
+        # Sort by the inclusive cost of the first event, or by how much
+        # it changed
+        self.hotspots.sortByColumn(4, Qt.DescendingOrder)
+        self.hotspots.setColumnWidth(0, 300)
+
+        self.callers.clear()
+        self.callees.clear()
+
+        self.call_tree.clear()
+        self.tabs.setTabEnabled(1, trace is not None)
+
+        if trace is not None:
+            self.__add_calls(self.call_tree.invisibleRootItem(),
+                             trace.get_roots())
+
+        self.profile_loaded_signal.emit(profile)
+
+    def handle_hotspot_changed(self, current, previous):
+        if not current.isValid():
+            return
+
+        profile, function = self.hotspots.model().get_function(current.row())
+
+        self.calls_profile = profile
+
+        self.__fill_calls_tree(self.callers, profile.get_callers(function))
+        self.__fill_calls_tree(self.callees, profile.get_callees(function))
+
+    def handle_hotspot_double_clicked(self, index):
+        self.jump_to_function(
+            *self.hotspots.model().get_function(index.row())
+        )
+
+    def handle_call_double_clicked(self, item, column):
+        """Select the double clicked caller or callee in the hotspots"""
+        function = item.data(0, Qt.UserRole)
+        row = self.hotspots.model().get_row(self.calls_profile, function)
+
+        if row is None:
+            return
+
+        self.hotspots.selectRow(row)
+        self.hotspots.scrollTo(self.hotspots.model().index(row, 0))
+
+    def handle_call_expanded(self, item):
+        """Add the calls made from the expanded call, the first time"""
+        if item.childCount() > 0:
+            return
+
+        call = item.data(0, Qt.UserRole)
+
+        if call is not None:
+            self.__add_calls(item, self.trace.get_children(call))
+
+    def handle_call_tree_double_clicked(self, item, column):
+        """Show the line the double clicked call was made from"""
+        call = item.data(0, Qt.UserRole)
+
+        if call is None:
+            return
+
+        filename, line = self.trace.get_call_location(call)
+
+        if line > 0:
+            self.item_double_clicked_signal.emit(filename, line)
+
+    def jump_to_function(self, profile, function):
+        line = profile.get_function_line(function)
+
+        # Internal PHP functions have no file to jump to
+        if line > 0:
+            self.item_double_clicked_signal.emit(
+                profile.get_function_file(function),
+                line
+            )
+
+    def __add_calls(self, parent, calls):
+        """Add calls of a trace to the call tree
+
+        Only the first calls are added, as a call can make millions of
+        calls. The calls made from them are added when they are expanded.
+        """
+        items = []
+
+        for call in calls:
+            if len(items) == self.max_children:
+                items.append(QTreeWidgetItem(["More calls not shown"]))
+                break
+
+            filename, line = self.trace.get_call_location(call)
+
+            item = QTreeWidgetItem([
+                self.profile.get_function_name(
+                    self.trace.get_call_function(call)
+                ),
+                '%s:%d' % (os.path.basename(filename), line),
+                '%.3f' % (self.trace.get_call_time(call) * 1000),
+                format(self.trace.get_call_memory(call), ',')
+            ])
+            item.setData(0, Qt.UserRole, call)
+            item.setToolTip(1, filename)
+
+            if self.trace.call_first_children[call] != -1:
+                item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+
+            items.append(item)
+
+        parent.addChildren(items)
+
+    def __get_open_file_name(self, title):
+        path, _ = QFileDialog.getOpenFileName(
+            self,
+            title,
+            "",
+            "Cachegrind files (cachegrind.out*);;"
+            "Function traces (*.xt);;"
+            "All files (*)"
+        )
+
+        return path
+
+    def __create_calls_tree(self, label):
+        tree = QTreeWidget()
+        tree.setColumnCount(3)
+        tree.setHeaderLabels([label, 'Calls', 'Inclusive'])
+        tree.setColumnWidth(0, 250)
+        tree.setRootIsDecorated(False)
+        tree.setSortingEnabled(True)
+        tree.itemDoubleClicked.connect(self.handle_call_double_clicked)
+
+        return tree
+
+    def __fill_calls_tree(self, tree, calls):
+        tree.setSortingEnabled(False)
+        tree.clear()
+
+        for function, call in calls.items():
+            item = PugdebugCallItem([
+                self.calls_profile.get_function_name(function),
+                format(call[0], ','),
+                format(call[1] if len(call) > 1 else 0, ',')
+            ])
+            item.setData(0, Qt.UserRole, function)
+            item.setToolTip(0,
+                            self.calls_profile.get_function_file(function))
+            tree.addTopLevelItem(item)
+
+        tree.setSortingEnabled(True)
+        tree.sortByColumn(2, Qt.DescendingOrder)
+
+
+class PugdebugCallItem(QTreeWidgetItem):
+    """A caller or a callee, with the numbers sorted as numbers"""
+
+    def __lt__(self, other):
+        column = self.treeWidget().sortColumn()
+
+        if column == 0:
+            return self.text(0) < other.text(0)
+
+        return (int(self.text(column).replace(',', '')) <
+                int(other.text(column).replace(',', '')))
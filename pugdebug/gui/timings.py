@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import (QWidget, QTreeWidget, QTreeWidgetItem,
+                             QPushButton, QFileDialog, QMessageBox,
+                             QVBoxLayout, QHBoxLayout)
+
+from pugdebug.models.timings import get_timings
+
+
+class PugdebugTimingsViewer(QWidget):
+    """Show the timings of the DBGp commands and the GUI updates
+
+    The median and the 95th percentile are shown for every phase of a
+    command, in milliseconds. The timings are refreshed every second,
+    while the viewer is visible.
+    """
+
+    refresh_interval = 1000
+
+    def __init__(self):
+        super(PugdebugTimingsViewer, self).__init__()
+
+        self.tree = QTreeWidget()
+        self.tree.setColumnCount(8)
+        self.tree.setHeaderLabels([
+            'Name', 'Count', 'Total ms', 'Send ms', 'Wait ms', 'Receive ms',
+            'Parse ms', 'Bytes sent / received'
+        ])
+        self.tree.headerItem().setToolTip(
+            2, 'Median / 95th percentile, in milliseconds'
+        )
+        self.tree.setColumnWidth(0, 200)
+
+        self.reset_button = QPushButton("Reset")
+        self.reset_button.clicked.connect(self.handle_reset)
+
+        self.dump_button = QPushButton("Dump to JSON")
+        self.dump_button.clicked.connect(self.handle_dump)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(self.reset_button)
+        buttons.addWidget(self.dump_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.tree)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.refresh_interval)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+
+        super(PugdebugTimingsViewer, self).showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+
+        super(PugdebugTimingsViewer, self).hideEvent(event)
+
+    def refresh(self):
+        timings = get_timings().to_dict()
+
+        self.tree.clear()
+
+        commands = QTreeWidgetItem(['Commands'])
+        self.tree.addTopLevelItem(commands)
+
+        for name, command in sorted(timings['commands'].items()):
+            commands.addChild(QTreeWidgetItem([
+                name,
+                str(command['total']['count']),
+                self.format_histogram(command['total']),
+                self.format_histogram(command['send']),
+                self.format_histogram(command['wait']),
+                self.format_histogram(command['receive']),
+                self.format_histogram(command['parse']),
+                '%d / %d' % (command['bytes_sent'],
+                             command['bytes_received'])
+            ]))
+
+        gui_updates = QTreeWidgetItem(['GUI updates'])
+        self.tree.addTopLevelItem(gui_updates)
+
+        for name, histogram in sorted(timings['gui_updates'].items()):
+            gui_updates.addChild(QTreeWidgetItem([
+                name,
+                str(histogram['count']),
+                self.format_histogram(histogram)
+            ]))
+
+        self.tree.expandAll()
+
+    def format_histogram(self, histogram):
+        return '%.1f / %.1f' % (histogram['p50'], histogram['p95'])
+
+    def handle_reset(self):
+        get_timings().reset()
+        self.refresh()
+
+    def handle_dump(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Dump timings",
+            "timings.json",
+            "JSON (*.json)"
+        )
+
+        if not path:
+            return
+
+        try:
+            get_timings().dump(path)
+        except OSError as e:
+            QMessageBox.critical(self, "Dump timings", str(e))
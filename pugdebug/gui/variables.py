@@ -9,11 +9,13 @@
 
 __author__ = "robertbasic"
 
-import base64
-
+from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import (QTabWidget, QTreeWidget, QTreeWidgetItem, QDialog,
                              QTextEdit, QGridLayout, QHeaderView)
 
+from pugdebug.models.variables import (PugdebugChildVariables,
+                                       get_variable_type, get_variable_value)
+
 
 class PugdebugVariableViewer(QTabWidget):
 
@@ -39,6 +41,23 @@ class PugdebugVariableViewer(QTabWidget):
         if item.text(1).find('string') > -1:
             PugdebugVariableDetails(self, item)
 
+    def handle_variable_expanded(self, table, item):
+        """Handle when a variable is expanded
+
+        The children of a variable are displayed only when it is expanded
+        for the first time, so values that are never looked at are never
+        decoded.
+        """
+        children = item.data(2, Qt.UserRole)
+
+        if children is None:
+            return
+
+        item.setData(2, Qt.UserRole, None)
+
+        for subvar in children.variables:
+            self.add_variable(table, subvar, item)
+
     def clear(self):
         """Clear the variable tables
         """
@@ -77,22 +96,21 @@ class PugdebugVariableViewer(QTabWidget):
             table.itemDoubleClicked.connect(
                 self.handle_variable_double_clicked
             )
+            table.itemExpanded.connect(
+                lambda item: self.handle_variable_expanded(table, item)
+            )
 
             self.setCurrentIndex(0)
 
         return table
 
     def add_variable(self, table, variable, parent=None):
-        type = variable['type']
+        type = get_variable_type(variable)
         tooltip = None
 
         if type == 'uninitialized':
             return
 
-        # Display the class name instead of type for objects
-        if type == 'object':
-            type = variable['classname']
-
         if (type == 'array' or type == 'hash') and 'numchildren' in variable:
             type = "%s {%d}" % (type, int(variable['numchildren']))
 
@@ -101,21 +119,11 @@ class PugdebugVariableViewer(QTabWidget):
             tooltip = "Double click to inspect"
 
         if 'value' in variable:
-            value = variable['value']
-
-            if 'encoding' in variable and value is not None:
-                value = base64.b64decode(value)
-                try:
-                    value = value.decode()
-                except:
-                    value = repr(value)
+            value = get_variable_value(variable)
 
             if value is None:
                 value = 'NULL'
 
-            if type == 'bool':
-                value = ("%s" % (int(value) == 1)).lower()
-
             args = [variable['name'], type, value]
         else:
             args = [variable['name'], type, ' ... ']
@@ -125,9 +133,14 @@ class PugdebugVariableViewer(QTabWidget):
         else:
             item = QTreeWidgetItem(parent, args)
 
-        if 'variables' in variable:
-            for subvar in variable['variables']:
-                self.add_variable(table, subvar, item)
+        # Children are added when the variable is expanded
+        if len(variable.get('variables', [])) > 0:
+            item.setData(
+                2,
+                Qt.UserRole,
+                PugdebugChildVariables(variable['variables'])
+            )
+            item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
 
         if parent is None:
             table.addTopLevelItem(item)
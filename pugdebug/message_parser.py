@@ -10,14 +10,19 @@
 __author__ = "robertbasic"
 
 import os
+import re
 import xml.etree.ElementTree as xml_parser
 
+from pugdebug.models.variables import decode_base64
+
 
 class PugdebugMessageParser():
 
     namespace = '{urn:debugger_protocol_v1}'
     typemap = {}
 
+    transaction_id_pattern = re.compile(rb'transaction_id="(\d+)"')
+
     def __init__(self):
         pass
 
@@ -32,7 +37,7 @@ class PugdebugMessageParser():
         attribs = ['fileuri', 'idekey']
         init_message = self.get_attribs(xml, attribs, init_message)
 
-        for element in xml.getchildren():
+        for element in list(xml):
             tag_name = element.tag.replace(self.namespace, '')
             tag_value = element.text
 
@@ -44,18 +49,58 @@ class PugdebugMessageParser():
 
         return init_message
 
+    def parse_init_attributes(self, message):
+        """Get all the attributes of the init message
+
+        Attributes in a namespace are skipped.
+        """
+        xml = xml_parser.fromstring(message)
+
+        attribs = [attrib for attrib in xml.attrib
+                   if not attrib.startswith('{')]
+
+        return self.get_attribs(xml, attribs, {})
+
     def parse_typemap_message(self, message):
         xml = xml_parser.fromstring(message)
 
         typemap = {}
 
-        for item in xml.getchildren():
+        for item in list(xml):
             language, common = item.attrib['name'], item.attrib['type']
             if language and common:
                 typemap[language] = common
 
         return typemap
 
+    def parse_transaction_id(self, message):
+        """Get the transaction id of a response message
+
+        Only the opening tag of the response element is searched, the rest
+        of the message is not parsed.
+
+        Returns None for messages that are not responses to a command.
+        """
+        if not message:
+            return None
+
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+
+        start = message.find(b'<response')
+
+        if start == -1:
+            return None
+
+        end = message.find(b'>', start)
+
+        match = self.transaction_id_pattern.search(message, start, end)
+
+        if match is None:
+            return None
+
+        return int(match.group(1))
+
     def parse_continuation_message(self, message):
         if not message:
             return {}
@@ -71,7 +116,7 @@ class PugdebugMessageParser():
             continuation_message
         )
 
-        if len(xml.getchildren()) == 1:
+        if len(list(xml)) == 1:
             attribs = ['filename', 'lineno']
             continuation_message = self.get_attribs(
                 xml[0],
@@ -90,11 +135,19 @@ class PugdebugMessageParser():
         xml = xml_parser.fromstring(message)
 
         attribs = ['name', 'id']
-        for context in xml.getchildren():
+        for context in list(xml):
             variable_message.append(self.get_attribs(context, attribs, {}))
 
         return variable_message
 
+    def get_variables_stream_parser(self):
+        """Get a parser for a variables message received in chunks
+
+        The parser is fed the message as it arrives, and returns the same
+        variables as `parse_variables_message` when closed.
+        """
+        return PugdebugVariablesStreamParser(self)
+
     def parse_variables_message(self, message):
         if not message:
             return []
@@ -116,7 +169,7 @@ class PugdebugMessageParser():
         xml = xml_parser.fromstring(message)
 
         attribs = ['filename', 'lineno', 'where', 'level']
-        for child in xml.getchildren():
+        for child in list(xml):
             stacktrace = {}
             stacktrace = self.get_attribs(child, attribs, stacktrace)
 
@@ -125,15 +178,23 @@ class PugdebugMessageParser():
         return stacktraces
 
     def parse_breakpoint_set_message(self, message):
+        """Get the id of the breakpoint that was set
+
+        Returns False if the breakpoint was not set, and True if it was set
+        but the engine didn't tell it's id.
+        """
         if not message:
             return False
 
         xml = xml_parser.fromstring(message)
 
-        if len(xml.getchildren()):
+        if len(list(xml)):
             return False
 
-        return True
+        if 'id' not in xml.attrib:
+            return True
+
+        return int(xml.attrib['id'])
 
     def parse_breakpoint_remove_message(self, message):
         if not message:
@@ -141,7 +202,7 @@ class PugdebugMessageParser():
 
         xml = xml_parser.fromstring(message)
 
-        children = xml.getchildren()
+        children = list(xml)
 
         if len(children) == 1:
             child = children.pop()
@@ -158,11 +219,26 @@ class PugdebugMessageParser():
 
         xml = xml_parser.fromstring(message)
 
-        attribs = ['type', 'filename', 'lineno', 'state', 'id']
-        for child in xml.getchildren():
+        attribs = ['type', 'filename', 'lineno', 'state', 'id', 'function',
+                   'exception', 'hit_value', 'hit_condition', 'hit_count']
+        for child in list(xml):
             breakpoint = {}
             breakpoint = self.get_attribs(child, attribs, breakpoint)
 
+            # Methods are listed with their class separately
+            if 'class' in child.attrib and 'function' in breakpoint:
+                breakpoint['function'] = '%s::%s' % (
+                    child.attrib['class'],
+                    breakpoint['function']
+                )
+
+            expression = child.find('%sexpression' % self.namespace)
+            if expression is not None:
+                if 'encoding' in expression.attrib:
+                    breakpoint['expression'] = decode_base64(expression.text)
+                else:
+                    breakpoint['expression'] = expression.text or ''
+
             breakpoints.append(breakpoint)
 
         return breakpoints
@@ -181,12 +257,22 @@ class PugdebugMessageParser():
         return self.get_variable(child)
 
     def get_variables(self, parent, result):
-        for child in parent.getchildren():
+        for child in list(parent):
             result.append(self.get_variable(child))
 
         return result
 
     def get_variable(self, xml):
+        var = self.get_variable_attribs(xml)
+
+        if self.has_children(var):
+            var['variables'] = self.get_variables(xml, [])
+        else:
+            var['value'] = xml.text
+
+        return var
+
+    def get_variable_attribs(self, xml):
         attribs = [
             'name',
             'type',
@@ -200,14 +286,12 @@ class PugdebugMessageParser():
         if self.typemap:
             self.map_type(var)
 
-        numchildren = int(var.get('numchildren', 0))
-        if var['type'] in ['array', 'object', 'hash'] or numchildren > 0:
-            var['variables'] = self.get_variables(xml, [])
-        else:
-            var['value'] = xml.text
-
         return var
 
+    def has_children(self, var):
+        numchildren = int(var.get('numchildren', 0))
+        return var['type'] in ['array', 'object', 'hash'] or numchildren > 0
+
     def get_attribs(self, xml, attribs, result):
         for attrib in (attrib for attrib in xml.attrib if attrib in attribs):
             if attrib.startswith('file'):
@@ -239,3 +323,73 @@ class PugdebugMessageParser():
 
         if var_type:
             variable['type'] = self.typemap.get(var_type, var_type)
+
+
+class PugdebugVariablesStreamParser():
+    """Parse a variables message incrementally
+
+    The message is fed in chunks, as it is received from the socket. The
+    variable records are built as their property elements are closed, and
+    the elements are thrown away right after that, so only the records
+    are kept in memory, not the message and the element tree as well.
+    """
+
+    message_parser = None
+
+    def __init__(self, message_parser):
+        self.message_parser = message_parser
+
+        self.xml_parser = xml_parser.XMLPullParser(events=('start', 'end'))
+
+        self.variables = []
+
+        # The open elements, with the variable they describe,
+        # starting with the response element
+        self.open_elements = []
+
+    def feed(self, data):
+        self.xml_parser.feed(data)
+        self.__read_events()
+
+    def close(self):
+        """Finish parsing and return the variables
+        """
+        self.xml_parser.close()
+        self.__read_events()
+
+        return self.variables
+
+    def __read_events(self):
+        for event, element in self.xml_parser.read_events():
+            if event == 'start':
+                self.__start_element(element)
+            else:
+                self.__end_element(element)
+
+    def __start_element(self, element):
+        if len(self.open_elements) == 0:
+            self.open_elements.append((element, {'variables': self.variables}))
+            return
+
+        parent = self.open_elements[-1][1]
+
+        var = self.message_parser.get_variable_attribs(element)
+
+        if self.message_parser.has_children(var):
+            var['variables'] = []
+
+        # Added to the parent right away to keep the order of the variables
+        parent['variables'].append(var)
+
+        self.open_elements.append((element, var))
+
+    def __end_element(self, element):
+        element, var = self.open_elements.pop()
+
+        if 'variables' not in var:
+            var['value'] = element.text
+
+        # Free the element, it's described by the variable record now
+        element.clear()
+        if len(self.open_elements) > 0:
+            self.open_elements[-1][0].remove(element)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import os
+import re
+
+from pugdebug.models.variables import get_variable_type, get_variable_value
+
+# Breakpoint types, as named by the DBGp protocol
+breakpoint_types = ['line', 'conditional', 'call', 'return', 'exception']
+
+# Breakpoint types that are set on a line of a file
+line_breakpoint_types = ['line', 'conditional']
+
+# Hit conditions, when the breakpoint breaks compared to the hit value:
+# at or after the hit value, exactly on it, or on every multiple of it
+hit_conditions = ['>=', '==', '%']
+
+# Expressions in a log message are written in braces, like `id is {$id}`
+log_expression_pattern = re.compile(r'\{([^{}]+)\}')
+
+
+def get_breakpoint_type(breakpoint):
+    return breakpoint.get('type', 'line')
+
+
+def is_line_breakpoint(breakpoint):
+    return get_breakpoint_type(breakpoint) in line_breakpoint_types
+
+
+def is_logpoint(breakpoint):
+    """Does the breakpoint log a message instead of breaking"""
+    return bool(breakpoint.get('log'))
+
+
+def get_breakpoint_location(breakpoint):
+    return (breakpoint['filename'], int(breakpoint['lineno']))
+
+
+def get_hit_value(breakpoint):
+    return int(breakpoint.get('hit_value') or 0)
+
+
+def is_conditional_breakpoint(breakpoint):
+    """Does the breakpoint break only on some of the hits
+
+    Either because of it's expression, or because of it's hit condition.
+    """
+    return (get_breakpoint_type(breakpoint) == 'conditional' or
+            get_hit_value(breakpoint) > 0)
+
+
+def get_breakpoint_arguments(breakpoint):
+    """Get the arguments and the data of a breakpoint_set command
+
+    The data is the expression of a conditional breakpoint, None for
+    other breakpoints. The engine evaluates the expression and counts
+    the hits itself, so the debugger is not bothered with the hits
+    that don't break.
+
+    A temporary breakpoint is removed by the engine once it breaks on it.
+    """
+    breakpoint_type = get_breakpoint_type(breakpoint)
+
+    if breakpoint_type not in breakpoint_types:
+        raise ValueError("Unknown breakpoint type: %s" % breakpoint_type)
+
+    arguments = ['-t %s' % breakpoint_type]
+    data = None
+
+    if breakpoint_type in line_breakpoint_types:
+        arguments.append('-f %s -n %d' % (
+            breakpoint['filename'],
+            int(breakpoint['lineno'])
+        ))
+    elif breakpoint_type == 'exception':
+        arguments.append('-x %s' % breakpoint['exception'])
+    else:
+        class_name, separator, function = (
+            breakpoint['function'].rpartition('::')
+        )
+        if separator:
+            arguments.append('-a %s' % class_name)
+        arguments.append('-m %s' % function)
+
+    if breakpoint_type == 'conditional':
+        data = breakpoint['expression']
+
+    hit_value = get_hit_value(breakpoint)
+
+    if hit_value > 0:
+        hit_condition = breakpoint.get('hit_condition') or '>='
+
+        if hit_condition not in hit_conditions:
+            raise ValueError("Unknown hit condition: %s" % hit_condition)
+
+        arguments.append('-h %d -o %s' % (hit_value, hit_condition))
+
+    if breakpoint.get('temporary'):
+        arguments.append('-r 1')
+
+    return ' '.join(arguments), data
+
+
+def describe_breakpoint_location(breakpoint):
+    """Describe where a breakpoint that is not on a line breaks"""
+    breakpoint_type = get_breakpoint_type(breakpoint)
+
+    if breakpoint_type == 'exception':
+        return "Exception %s" % breakpoint.get('exception', '')
+
+    if breakpoint_type == 'return':
+        return "Return from %s" % breakpoint.get('function', '')
+
+    return "Call to %s" % breakpoint.get('function', '')
+
+
+def describe_breakpoint_condition(breakpoint):
+    """Describe when a breakpoint breaks, like `$id == 42, hit >= 500`"""
+    conditions = []
+
+    if get_breakpoint_type(breakpoint) == 'conditional':
+        conditions.append(breakpoint.get('expression', ''))
+
+    hit_value = get_hit_value(breakpoint)
+
+    if hit_value > 0:
+        conditions.append('hit %s %d' % (
+            breakpoint.get('hit_condition') or '>=',
+            hit_value
+        ))
+
+    if is_logpoint(breakpoint):
+        conditions.append('log "%s"' % breakpoint['log'])
+
+    return ', '.join(conditions)
+
+
+def get_log_expressions(message):
+    """Get the expressions to evaluate for a log message, each only once"""
+    expressions = []
+
+    for expression in log_expression_pattern.findall(message):
+        if expression not in expressions:
+            expressions.append(expression)
+
+    return expressions
+
+
+def format_log_entry(message, response, evaluated):
+    """Format a log entry of a logpoint hit
+
+    The expressions in the message are replaced with their evaluated
+    values, and the entry is prefixed with where the logpoint was hit.
+    Arrays and objects are shown by their type.
+    """
+    values = {}
+
+    for expression, variable in evaluated.items():
+        value = get_variable_value(variable)
+        values[expression] = (value if value is not None
+                              else get_variable_type(variable))
+
+    text = log_expression_pattern.sub(
+        lambda match: values.get(match.group(1), match.group(0)),
+        message
+    )
+
+    return '%s:%s %s' % (
+        os.path.basename(response.get('filename', '')),
+        response.get('lineno', ''),
+        text
+    )
+
+
+def get_breakpoint_key(breakpoint):
+    """Get what tells a breakpoint apart from the others
+
+    Only one breakpoint can be set on a line, on an exception, or on a call
+    or a return of a function.
+    """
+    if is_line_breakpoint(breakpoint):
+        return get_breakpoint_location(breakpoint)
+
+    breakpoint_type = get_breakpoint_type(breakpoint)
+
+    if breakpoint_type == 'exception':
+        return (breakpoint_type, breakpoint['exception'])
+
+    return (breakpoint_type, breakpoint['function'])
+
+
+class PugdebugBreakpoints():
+    """The breakpoints, indexed by their key, their engine id and their file
+
+    Breakpoints are looked up, added and removed without going through all
+    of them, so changes from the set and remove responses of the engine
+    are applied one by one, without listing all the breakpoints again.
+
+    The breakpoints are kept in the order they were added in.
+    """
+
+    def __init__(self, breakpoints=()):
+        self.replace(breakpoints)
+
+    def __len__(self):
+        return len(self.breakpoints)
+
+    def __iter__(self):
+        return iter(list(self.breakpoints.values()))
+
+    def to_list(self):
+        return list(self.breakpoints.values())
+
+    def replace(self, breakpoints):
+        """Replace all the breakpoints, like with the listed ones"""
+        self.breakpoints = {}
+        self.by_id = {}
+        self.by_file = {}
+
+        for breakpoint in breakpoints:
+            self.add(breakpoint)
+
+    def add(self, breakpoint):
+        """Add a breakpoint
+
+        A breakpoint with the same key is replaced. Returns the key.
+        """
+        key = get_breakpoint_key(breakpoint)
+
+        self.remove_by_key(key)
+
+        self.breakpoints[key] = breakpoint
+
+        if 'id' in breakpoint:
+            self.by_id[int(breakpoint['id'])] = key
+
+        if is_line_breakpoint(breakpoint):
+            self.by_file.setdefault(breakpoint['filename'], set()).add(key)
+
+        return key
+
+    def remove(self, breakpoint):
+        return self.remove_by_key(get_breakpoint_key(breakpoint))
+
+    def remove_by_id(self, breakpoint_id):
+        key = self.by_id.get(int(breakpoint_id))
+
+        if key is None:
+            return None
+
+        return self.remove_by_key(key)
+
+    def remove_by_key(self, key):
+        """Remove the breakpoint with the key
+
+        Returns the removed breakpoint, None if there was none.
+        """
+        breakpoint = self.breakpoints.pop(key, None)
+
+        if breakpoint is None:
+            return None
+
+        if 'id' in breakpoint:
+            self.by_id.pop(int(breakpoint['id']), None)
+
+        if is_line_breakpoint(breakpoint):
+            keys = self.by_file[breakpoint['filename']]
+            keys.discard(key)
+
+            if len(keys) == 0:
+                del self.by_file[breakpoint['filename']]
+
+        return breakpoint
+
+    def remove_file(self, filename):
+        """Remove the breakpoints of a file, returns the removed ones"""
+        return [self.remove_by_key(key)
+                for key in list(self.by_file.get(filename, []))]
+
+    def get(self, filename, line_number):
+        return self.breakpoints.get((filename, int(line_number)))
+
+    def get_by_id(self, breakpoint_id):
+        key = self.by_id.get(int(breakpoint_id))
+
+        return None if key is None else self.breakpoints[key]
+
+    def get_files(self):
+        return list(self.by_file.keys())
+
+    def get_file_breakpoints(self, filename):
+        return [self.breakpoints[key]
+                for key in self.by_file.get(filename, [])]
+
+    def get_line_markers(self, filename):
+        """Get how the lines of a file with breakpoints are marked
+
+        Returns whether the breakpoint is conditional and whether it is a
+        logpoint, by the line number.
+        """
+        return dict(
+            (int(breakpoint['lineno']),
+             (is_conditional_breakpoint(breakpoint), is_logpoint(breakpoint)))
+            for breakpoint in self.get_file_breakpoints(filename)
+        )
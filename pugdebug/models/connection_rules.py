@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import fnmatch
+import logging
+
+from pugdebug.models.settings import get_setting
+
+
+class PugdebugConnectionRule():
+    """A rule to let a new connection go without debugging it
+
+    A rule is written as `action field pattern`, for example:
+
+        detach fileuri */vendor/*
+        run request_uri /assets/*
+
+    The field is an attribute of the init message, like `fileuri`,
+    `idekey` or `appid`, or `request_uri`, which is read by evaluating
+    `$_SERVER['REQUEST_URI']`. The pattern is a shell-style wildcard.
+
+    Connections matching a `run` rule run to the end, without stopping on
+    any breakpoint. Connections matching a `detach` rule are detached
+    from, the script goes on without the debugger.
+    """
+
+    actions = ['run', 'detach']
+
+    action = None
+    field = None
+    pattern = None
+
+    def __init__(self, action, field, pattern):
+        self.action = action
+        self.field = field
+        self.pattern = pattern
+
+    def needs_request_uri(self):
+        return self.field == 'request_uri'
+
+    def matches(self, attributes):
+        value = attributes.get(self.field)
+
+        if value is None:
+            return False
+
+        return fnmatch.fnmatchcase(value, self.pattern)
+
+
+def parse_connection_rules(text):
+    """Parse the rules, one per line
+
+    Empty lines and lines starting with # are skipped, so are invalid
+    rules, with a warning logged.
+    """
+    rules = []
+
+    for line in (text or '').splitlines():
+        line = line.strip()
+
+        if line == '' or line.startswith('#'):
+            continue
+
+        parts = line.split(None, 2)
+
+        if len(parts) != 3 or parts[0] not in PugdebugConnectionRule.actions:
+            logging.warning("Invalid connection rule: %s" % line)
+            continue
+
+        rules.append(PugdebugConnectionRule(*parts))
+
+    return rules
+
+
+def get_connection_rules():
+    return parse_connection_rules(get_setting('debugger/connection_rules'))
+
+
+def match_connection_rules(rules, attributes):
+    """Get the action of the first rule the attributes match
+
+    Returns None if no rule matches.
+    """
+    for rule in rules:
+        if rule.matches(attributes):
+            return rule.action
+
+    return None
@@ -0,0 +1,577 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import mmap
+import os
+import re
+
+from array import array
+
+# Events with a unit, like `Time_(10ns)` of Xdebug 3
+event_unit_pattern = re.compile(r'^(\w+?)_\((\d*)(\w+)\)$')
+
+# Nanoseconds and bytes per unit of the events
+event_units = {
+    'ns': 1,
+    'us': 1000,
+    'ms': 1000000,
+    's': 1000000000,
+    'bytes': 1,
+    'b': 1
+}
+
+# Units of the events without a unit, Xdebug 2 and the traces count the
+# time in microseconds
+default_event_units = {
+    'Time': 1000,
+    'Memory': 1
+}
+
+
+class PugdebugProfile():
+    """A profile of a PHP request, read from a cachegrind file
+
+    Files and functions are kept in tables, every name only once, and are
+    referred to by their index in the tables. The costs of the functions
+    are kept in arrays, one array per event, indexed by the functions.
+
+    A function is told apart by it's file and it's name.
+    """
+
+    def __init__(self):
+        self.cmd = ''
+        self.events = []
+        self.totals = []
+
+        self.files = []
+        self.file_indexes = {}
+
+        # File index and name of every function
+        self.functions = []
+        self.function_indexes = {}
+
+        # Line on which a function starts, 0 if not known
+        self.function_lines = array('l')
+
+        # How many times a function was called
+        self.calls = array('q')
+
+        # One array per event
+        self.self_costs = []
+        self.inclusive_costs = []
+
+        # The calls between the functions, by the caller and by the callee.
+        # Both point to the same list of the number of calls followed by
+        # the inclusive costs of the calls.
+        self.callees = {}
+        self.callers = {}
+
+        # Costs of the lines, including the costs of the calls made on them,
+        # by file index and line number
+        self.line_costs = {}
+
+    def set_events(self, events):
+        self.events = events
+        self.self_costs = [array('q', bytes(8 * len(self.functions)))
+                           for event in events]
+        self.inclusive_costs = [array('q', bytes(8 * len(self.functions)))
+                                for event in events]
+
+    def get_file_index(self, filename):
+        index = self.file_indexes.get(filename)
+
+        if index is None:
+            index = len(self.files)
+            self.files.append(filename)
+            self.file_indexes[filename] = index
+            self.line_costs[index] = {}
+
+        return index
+
+    def get_function_index(self, file_index, name):
+        key = (file_index, name)
+        index = self.function_indexes.get(key)
+
+        if index is None:
+            index = len(self.functions)
+            self.functions.append(key)
+            self.function_indexes[key] = index
+
+            self.function_lines.append(0)
+            self.calls.append(0)
+            for costs in self.self_costs + self.inclusive_costs:
+                costs.append(0)
+
+        return index
+
+    def find_function(self, filename, name):
+        """Get the index of a function, None if it is not in the profile"""
+        file_index = self.file_indexes.get(filename)
+
+        if file_index is None:
+            return None
+
+        return self.function_indexes.get((file_index, name))
+
+    def get_function_count(self):
+        return len(self.functions)
+
+    def get_function_name(self, function):
+        return self.functions[function][1]
+
+    def get_function_file(self, function):
+        return self.files[self.functions[function][0]]
+
+    def get_function_line(self, function):
+        return self.function_lines[function]
+
+    def get_total(self, event=0):
+        """Get the total cost of an event
+
+        The summary of the file, or the sum of all the self costs if the
+        file has no summary.
+        """
+        if event < len(self.totals):
+            return self.totals[event]
+
+        return sum(self.self_costs[event])
+
+    def get_callers(self, function):
+        """Get the callers of a function
+
+        Returns a dict of the callers, with the number of calls and the
+        inclusive costs of the calls.
+        """
+        return self.callers.get(function, {})
+
+    def get_callees(self, function):
+        return self.callees.get(function, {})
+
+    def get_line_costs(self, filename, event=0):
+        """Get the costs of the lines of a file, by the line number"""
+        file_index = self.file_indexes.get(filename)
+
+        if file_index is None:
+            return {}
+
+        return dict(
+            (line, costs[event])
+            for line, costs in self.line_costs[file_index].items()
+            if costs[event] > 0
+        )
+
+    def add_call(self, caller, callee, calls, costs):
+        call = self.callees.setdefault(caller, {}).get(callee)
+
+        if call is None:
+            call = [0] * (len(self.events) + 1)
+            self.callees[caller][callee] = call
+            self.callers.setdefault(callee, {})[caller] = call
+
+        call[0] += calls
+        for event, cost in enumerate(costs):
+            call[event + 1] += cost
+
+        self.calls[callee] += calls
+
+    def add_line_cost(self, file_index, line, costs):
+        lines = self.line_costs[file_index]
+
+        line_costs = lines.get(line)
+
+        if line_costs is None:
+            lines[line] = list(costs)
+        else:
+            for event, cost in enumerate(costs):
+                line_costs[event] += cost
+
+
+def read_cachegrind(path):
+    """Read a cachegrind file, like the ones of the Xdebug profiler
+
+    The file is memory mapped and read line by line, it is never read
+    into memory as a whole. Compressed names, like `fn=(12) name` the
+    first time and `fn=(12)` after, are supported, as are relative
+    positions like `+2`, `-1` and `*`.
+
+    Raises a ValueError if the file is not a cachegrind file.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("%s is empty" % path)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return parse_cachegrind(iter(data.readline, b''))
+
+
+def parse_cachegrind(lines):
+    """Parse the lines of a cachegrind file into a profile"""
+    profile = PugdebugProfile()
+
+    # Names of the compressed files and functions, by their ids
+    file_names = {}
+    function_names = {}
+
+    positions = ['line']
+    line_position = 0
+
+    file_index = None
+    source_file_index = None
+    function = None
+
+    call_file_index = None
+    call_name = None
+    call_count = None
+
+    last_positions = []
+
+    for line in lines:
+        first = line[:1]
+
+        # Cost lines are the most common, they start with a position
+        if first.isdigit() or first in (b'+', b'-', b'*'):
+            if function is None:
+                continue
+
+            parts = line.split()
+
+            last_positions = get_positions(parts[:len(positions)],
+                                           last_positions)
+            line_number = last_positions[line_position]
+
+            costs = [int(cost) for cost in parts[len(positions):]]
+            costs += [0] * (len(profile.events) - len(costs))
+
+            if call_count is not None:
+                callee = profile.get_function_index(
+                    file_index if call_file_index is None
+                    else call_file_index,
+                    call_name
+                )
+
+                profile.add_call(function, callee, call_count, costs)
+
+                call_count = None
+                call_file_index = None
+            else:
+                for event, cost in enumerate(costs):
+                    profile.self_costs[event][function] += cost
+
+                if profile.function_lines[function] == 0:
+                    profile.function_lines[function] = line_number
+
+            for event, cost in enumerate(costs):
+                profile.inclusive_costs[event][function] += cost
+
+            profile.add_line_cost(source_file_index, line_number, costs)
+
+            continue
+
+        key, separator, value = line.partition(b'=')
+
+        if separator and b' ' not in key and b':' not in key:
+            value = value.strip()
+
+            if key == b'fl':
+                file_index = profile.get_file_index(
+                    get_name(value, file_names)
+                )
+                source_file_index = file_index
+            elif key in (b'fi', b'fe'):
+                source_file_index = profile.get_file_index(
+                    get_name(value, file_names)
+                )
+            elif key == b'fn':
+                if file_index is None:
+                    file_index = profile.get_file_index('')
+                function = profile.get_function_index(
+                    file_index,
+                    get_name(value, function_names)
+                )
+                source_file_index = file_index
+            elif key in (b'cfl', b'cfi'):
+                call_file_index = profile.get_file_index(
+                    get_name(value, file_names)
+                )
+            elif key == b'cfn':
+                call_name = get_name(value, function_names)
+            elif key == b'calls':
+                call_count = int(value.split()[0])
+
+            continue
+
+        key, separator, value = line.partition(b':')
+
+        if not separator:
+            continue
+
+        value = value.strip().decode('utf-8', 'replace')
+
+        if key == b'events':
+            profile.set_events(value.split())
+        elif key == b'positions':
+            positions = value.split()
+            line_position = (positions.index('line')
+                             if 'line' in positions else 0)
+        elif key in (b'summary', b'totals'):
+            profile.totals = [int(total) for total in value.split()]
+        elif key == b'cmd':
+            profile.cmd = value
+
+    if not profile.events:
+        raise ValueError("Not a cachegrind file, it has no events")
+
+    return profile
+
+
+def get_name(value, names):
+    """Get a name, that might be compressed
+
+    `(12) name` names the id 12, and `(12)` refers to it later on.
+    """
+    if value.startswith(b'('):
+        end = value.find(b')')
+
+        if end > 0:
+            name_id = value[1:end]
+            name = value[end + 1:].strip()
+
+            if name:
+                names[name_id] = name.decode('utf-8', 'replace')
+
+            return names.get(name_id, '')
+
+    return value.decode('utf-8', 'replace')
+
+
+def get_positions(parts, last_positions):
+    """Get the positions of a cost line
+
+    A position can be relative to the position on the previous cost line,
+    `+2` or `-2`, or the same as it, `*`.
+    """
+    result = []
+
+    for i, part in enumerate(parts):
+        last = last_positions[i] if i < len(last_positions) else 0
+
+        if part == b'*':
+            result.append(last)
+        elif part[:1] in (b'+', b'-'):
+            result.append(last + int(part))
+        else:
+            result.append(int(part, 0))
+
+    return result
+
+
+def format_line_costs(profile, filename, event=0):
+    """Format the costs of the lines of a file as percentages of the total
+    """
+    total = profile.get_total(event)
+
+    if total <= 0:
+        return {}
+
+    return dict(
+        (line, '%.1f%%' % (cost * 100.0 / total))
+        for line, cost in profile.get_line_costs(filename, event).items()
+    )
+
+
+class PugdebugProfileDiff():
+    """The differences of the costs of the functions of two profiles
+
+    The functions of the profiles are aligned by their files and names.
+    Every row of the diff is a function, in one or both of the profiles,
+    with the costs of one event before and after. A function that is in
+    only one of the profiles costs nothing in the other one.
+    """
+
+    def __init__(self, before, after, event=0):
+        self.before = before
+        self.after = after
+
+        before_event = find_event(before, after.events[event])
+
+        if before_event is None:
+            raise ValueError("The profiles have no %s event" %
+                             after.events[event])
+
+        # The costs are compared in the finer unit of the two events, like
+        # the 10 nanoseconds of Xdebug 3 over the microseconds of Xdebug 2
+        before_unit = get_event_unit(before.events[before_event])[1]
+        after_unit = get_event_unit(after.events[event])[1]
+
+        if before_unit < after_unit:
+            self.event = before.events[before_event]
+        else:
+            self.event = after.events[event]
+
+        unit = min(before_unit, after_unit)
+
+        self.__align_functions()
+
+        self.before_self = self.__get_costs(self.before_functions,
+                                            before.self_costs[before_event],
+                                            before_unit // unit)
+        self.before_inclusive = self.__get_costs(
+            self.before_functions,
+            before.inclusive_costs[before_event],
+            before_unit // unit
+        )
+        self.after_self = self.__get_costs(self.after_functions,
+                                           after.self_costs[event],
+                                           after_unit // unit)
+        self.after_inclusive = self.__get_costs(self.after_functions,
+                                                after.inclusive_costs[event],
+                                                after_unit // unit)
+
+        self.inclusive_deltas = array('q', map(int.__sub__,
+                                               self.after_inclusive,
+                                               self.before_inclusive))
+        self.self_deltas = array('q', map(int.__sub__,
+                                          self.after_self,
+                                          self.before_self))
+
+        # Changes of the inclusive costs in percents, infinite for the
+        # functions that are new in the profile after
+        self.relative_deltas = array('d', map(get_relative_delta,
+                                              self.before_inclusive,
+                                              self.inclusive_deltas))
+
+    def __len__(self):
+        return len(self.after_functions)
+
+    def get_profile_function(self, row):
+        """Get the profile and the index of the function of a row
+
+        The function from the profile after, if it is in it.
+        """
+        if self.after_functions[row] != -1:
+            return self.after, self.after_functions[row]
+
+        return self.before, self.before_functions[row]
+
+    def get_function_name(self, row):
+        profile, function = self.get_profile_function(row)
+        return profile.get_function_name(function)
+
+    def get_function_file(self, row):
+        profile, function = self.get_profile_function(row)
+        return profile.get_function_file(function)
+
+    def get_function_line(self, row):
+        profile, function = self.get_profile_function(row)
+        return profile.get_function_line(function)
+
+    def get_relative_delta(self, row):
+        """Get the change of the inclusive cost, in percents
+
+        None for a function that is new in the profile after.
+        """
+        delta = self.relative_deltas[row]
+
+        return None if delta == float('inf') else delta
+
+    def get_regressions(self):
+        """Get the rows, the largest increase of the inclusive cost first"""
+        return sorted(range(len(self)),
+                      key=self.inclusive_deltas.__getitem__,
+                      reverse=True)
+
+    def __align_functions(self):
+        """Align the functions of the profiles by their files and names
+
+        A trace tells only where a function was called from, so the
+        functions left over are aligned by their names, if the name is
+        of only one function left over in the profile before.
+        """
+        before = self.before
+        after = self.after
+
+        before_functions = dict(
+            ((before.files[file_index], name), function)
+            for function, (file_index, name) in enumerate(before.functions)
+        )
+
+        # Indexes of the functions in the profiles, -1 if not in one
+        self.before_functions = array('l')
+        self.after_functions = array('l')
+
+        for function, (file_index, name) in enumerate(after.functions):
+            self.after_functions.append(function)
+            self.before_functions.append(before_functions.pop(
+                (after.files[file_index], name),
+                -1
+            ))
+
+        names = {}
+
+        for (filename, name), function in before_functions.items():
+            names[name] = function if name not in names else -1
+
+        for row, function in enumerate(self.after_functions):
+            if self.before_functions[row] != -1:
+                continue
+
+            name = after.get_function_name(function)
+            function = names.pop(name, -1)
+
+            if function != -1:
+                self.before_functions[row] = function
+                del before_functions[(before.get_function_file(function),
+                                      name)]
+
+        for function in sorted(before_functions.values()):
+            self.after_functions.append(-1)
+            self.before_functions.append(function)
+
+    def __get_costs(self, functions, costs, scale=1):
+        return array('q', (0 if function == -1 else costs[function] * scale
+                           for function in functions))
+
+
+def get_event_unit(event):
+    """Get what an event measures and the size of it's unit
+
+    `Time_(10ns)` is ('Time', 10), in nanoseconds, and `Memory_(bytes)` is
+    ('Memory', 1), in bytes. An event that isn't known is it's own kind,
+    with a unit of 1.
+    """
+    match = event_unit_pattern.match(event)
+
+    if match is not None and match.group(3) in event_units:
+        kind, count, unit = match.groups()
+        return kind, int(count or 1) * event_units[unit]
+
+    return event, default_event_units.get(event, 1)
+
+
+def find_event(profile, event):
+    """Find the event of a profile that measures the same as the event
+
+    Returns the index of the event, None if the profile has no such event.
+    """
+    kind = get_event_unit(event)[0]
+
+    for index, name in enumerate(profile.events):
+        if get_event_unit(name)[0] == kind:
+            return index
+
+    return None
+
+
+def get_relative_delta(before, delta):
+    if before == 0:
+        return float('inf') if delta != 0 else 0.0
+
+    return delta * 100.0 / before
@@ -58,6 +58,18 @@ class PugdebugProject(QSettings):
 
         return project_settings
 
+    def get_address(self):
+        """Get the host and port the project's debugger listens on
+        """
+        if not self.contains('debugger/port_number'):
+            return None
+
+        host = self.value('debugger/host')
+        if host is None:
+            host = get_setting('debugger/host')
+
+        return (host, int(self.value('debugger/port_number')))
+
     def set_settings(self, new_settings):
         for key, value in new_settings.items():
             self.setValue(key, value)
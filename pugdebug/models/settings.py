@@ -20,16 +20,27 @@ class PugdebugSettings():
         'debugger/host': '127.0.0.1',
         'debugger/port_number': 9000,
         'debugger/idekey': 'pugdebug',
+        'debugger/backlog': 32,
+        'debugger/handshake_timeout': 5,
+        'debugger/command_timeout': 30,
+        'debugger/eval_timeout': 10,
         'debugger/break_at_first_line': Qt.Checked,
+        'debugger/fetch_state': Qt.Checked,
         'debugger/max_depth': '3',
         'debugger/max_children': '128',
         'debugger/max_data': '512',
+        'debugger/listen_on_all_projects': Qt.Unchecked,
+        'debugger/recordings_dir': '',
+        'debugger/proxy': '',
+        'debugger/max_pending_connections': 16,
+        'debugger/connection_rules': '',
 
         'path/project_root': os.path.expanduser('~'),
         'path/path_mapping': '',
 
         'editor/tab_width': 80,
-        'editor/font_size': 12
+        'editor/font_size': 12,
+        'editor/stall_threshold': 500
     }
 
     def __init__(self):
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import bisect
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+class PugdebugHistogram():
+    """A histogram of durations
+
+    Durations are counted in buckets with fixed bounds, in milliseconds,
+    so a histogram takes the same memory no matter how many durations
+    are added to it. Percentiles are estimated from the buckets.
+    """
+
+    bounds = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+              1000, 2500, 5000, 10000]
+
+    def __init__(self):
+        # The last bucket counts durations above the last bound
+        self.buckets = [0] * (len(self.bounds) + 1)
+
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, seconds):
+        milliseconds = seconds * 1000
+
+        self.buckets[bisect.bisect_left(self.bounds, milliseconds)] += 1
+
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def get_mean(self):
+        return self.total / self.count if self.count > 0 else 0
+
+    def get_percentile(self, percentile):
+        """Estimate a percentile as the upper bound of it's bucket"""
+        if self.count == 0:
+            return 0
+
+        rank = percentile / 100 * self.count
+
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count > 0:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                return self.max
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.get_mean(),
+            'p50': self.get_percentile(50),
+            'p95': self.get_percentile(95),
+            'max': self.max,
+            'buckets': dict(
+                ('<=%g' % bound if index < len(self.bounds) else 'more',
+                 count)
+                for index, (bound, count) in enumerate(
+                    zip(self.bounds + [None], self.buckets)
+                )
+                if count > 0
+            )
+        }
+
+
+class PugdebugCommandTimings():
+    """Timings of a DBGp command type
+
+    The time of a command is split into:
+
+     - send: writing the command to the socket
+     - wait: from the command being sent until the first bytes of the
+       response are received, the time spent in xdebug and the network
+     - receive: receiving the rest of the response
+     - parse: parsing the response
+    """
+
+    phases = ['send', 'wait', 'receive', 'parse', 'total']
+
+    def __init__(self):
+        self.histograms = dict(
+            (phase, PugdebugHistogram()) for phase in self.phases
+        )
+
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def add(self, send, wait, receive, parse, bytes_sent, bytes_received):
+        durations = {
+            'send': send,
+            'wait': wait,
+            'receive': receive,
+            'parse': parse,
+            'total': send + wait + receive + parse
+        }
+
+        for phase, seconds in durations.items():
+            self.histograms[phase].add(seconds)
+
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+
+    def to_dict(self):
+        result = dict(
+            (phase, histogram.to_dict())
+            for phase, histogram in self.histograms.items()
+        )
+        result['bytes_sent'] = self.bytes_sent
+        result['bytes_received'] = self.bytes_received
+
+        return result
+
+
+class PugdebugTimings():
+    """Timings of DBGp commands and GUI updates, by their type
+
+    Commands are recorded from the connection worker threads, GUI
+    updates from the main thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        self.commands = {}
+        self.gui_updates = {}
+
+    def record_command(self, command, send, wait, receive, parse,
+                       bytes_sent, bytes_received):
+        with self.lock:
+            if command not in self.commands:
+                self.commands[command] = PugdebugCommandTimings()
+
+            self.commands[command].add(
+                send, wait, receive, parse, bytes_sent, bytes_received
+            )
+
+    def record_gui_update(self, name, seconds):
+        with self.lock:
+            if name not in self.gui_updates:
+                self.gui_updates[name] = PugdebugHistogram()
+
+            self.gui_updates[name].add(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.commands = {}
+            self.gui_updates = {}
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'commands': dict(
+                    (command, timings.to_dict())
+                    for command, timings in self.commands.items()
+                ),
+                'gui_updates': dict(
+                    (name, histogram.to_dict())
+                    for name, histogram in self.gui_updates.items()
+                )
+            }
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2, sort_keys=True)
+
+
+timings = PugdebugTimings()
+
+
+def get_timings():
+    return timings
+
+
+def record_gui_update(name, seconds):
+    timings.record_gui_update(name, seconds)
+
+
+@contextmanager
+def measure_gui_update(name):
+    """Record how long the GUI update in the with block takes"""
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        record_gui_update(name, time.perf_counter() - start)
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+from array import array
+
+from pugdebug.models.profile import PugdebugProfile
+
+# Traces are read this many bytes at a time
+chunk_size = 1024 * 1024
+
+
+class PugdebugTrace():
+    """A function trace of a PHP request, read from an Xdebug .xt file
+
+    Every call is kept in a call tree, as an index into arrays of the
+    function called, the parent and the children of the call, where it
+    was called from, and the time and the memory on entry and on exit.
+
+    The functions are aggregated into a profile while the trace is read,
+    with times in microseconds and memory in bytes. As a trace doesn't
+    tell where a function is defined, a function is told apart by it's
+    name only, and it's location is where it was first called from.
+    """
+
+    def __init__(self):
+        self.profile = PugdebugProfile()
+        self.profile.set_events(['Time', 'Memory'])
+
+        # Functions of the profile by their names
+        self.functions = {}
+
+        self.call_functions = array('l')
+        self.call_parents = array('l')
+        self.call_first_children = array('l')
+        self.call_next_siblings = array('l')
+        self.call_files = array('l')
+        self.call_lines = array('l')
+        self.entry_times = array('d')
+        self.exit_times = array('d')
+        self.entry_memory = array('q')
+        self.exit_memory = array('q')
+
+    def get_call_count(self):
+        return len(self.call_functions)
+
+    def get_roots(self):
+        """Get the calls that were not made from an other call"""
+        return [call for call in range(self.get_call_count())
+                if self.call_parents[call] == -1]
+
+    def get_children(self, call):
+        """Get the calls made from a call, in the order they were made"""
+        child = self.call_first_children[call]
+
+        while child != -1:
+            yield child
+            child = self.call_next_siblings[child]
+
+    def get_call_function(self, call):
+        return self.call_functions[call]
+
+    def get_call_location(self, call):
+        """Get the file and the line the call was made from"""
+        return (self.profile.files[self.call_files[call]],
+                self.call_lines[call])
+
+    def get_call_time(self, call):
+        """Get how long a call took, in seconds"""
+        return self.exit_times[call] - self.entry_times[call]
+
+    def get_call_memory(self, call):
+        """Get by how much the memory grew during a call, in bytes"""
+        return self.exit_memory[call] - self.entry_memory[call]
+
+    def get_function_index(self, name, file_index, line):
+        function = self.functions.get(name)
+
+        if function is None:
+            function = self.profile.get_function_index(file_index, name)
+            self.profile.function_lines[function] = line
+            self.functions[name] = function
+
+        return function
+
+    def add_call(self, parent, name, filename, line, time, memory):
+        """Add a call, entered at the time and with the memory
+
+        Returns the index of the call.
+        """
+        file_index = self.profile.get_file_index(filename)
+        function = self.get_function_index(name, file_index, line)
+
+        call = len(self.call_functions)
+
+        self.call_functions.append(function)
+        self.call_parents.append(parent)
+        self.call_first_children.append(-1)
+        self.call_next_siblings.append(-1)
+        self.call_files.append(file_index)
+        self.call_lines.append(line)
+        self.entry_times.append(time)
+        self.exit_times.append(time)
+        self.entry_memory.append(memory)
+        self.exit_memory.append(memory)
+
+        return call
+
+
+def read_chunks(f, size=chunk_size):
+    """Read the lines of a file, a chunk of bytes at a time
+
+    Only the chunk being split into lines is held in memory, no matter
+    how large the file is.
+    """
+    rest = b''
+
+    while True:
+        chunk = f.read(size)
+
+        if not chunk:
+            break
+
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+
+        for line in lines:
+            yield line
+
+    if rest:
+        yield rest
+
+
+def is_trace(path):
+    """Is the file a computerized Xdebug function trace"""
+    if path.endswith('.xt'):
+        return True
+
+    with open(path, 'rb') as f:
+        return f.read(8) == b'Version:'
+
+
+def read_trace(path):
+    """Read a computerized Xdebug function trace
+
+    The file is read in chunks, it is never read into memory as a whole.
+
+    Raises a ValueError if the file is not a computerized trace.
+    """
+    with open(path, 'rb') as f:
+        return parse_trace(read_chunks(f))
+
+
+def parse_trace(lines):
+    """Parse the lines of a trace into a call tree and a profile
+
+    An entry line is `level, call, 0, time, memory, function, user defined,
+    included file, file, line, ...`, an exit line is `level, call, 1, time,
+    memory`. The line after the last call has only the time and the memory
+    at the end of the trace.
+    """
+    trace = PugdebugTrace()
+
+    is_trace = False
+
+    # Open calls, as lists of the call, it's number in the trace,
+    # the time and the memory of the calls made from it, and it's last
+    # child call
+    stack = []
+
+    # How many times a function is open, to add the time of recursive
+    # calls to the inclusive costs only once
+    active = {}
+
+    time = 0.0
+    memory = 0
+
+    for line in lines:
+        fields = line.rstrip(b'\r').split(b'\t', 10)
+
+        if len(fields) < 5:
+            if line.startswith((b'Version:', b'File format:',
+                                b'TRACE START')):
+                is_trace = True
+            continue
+
+        if fields[0] == b'':
+            # The end of the trace, close the calls still open
+            time = float(fields[3] or time)
+            memory = int(fields[4] or memory)
+            break
+
+        record_type = fields[2]
+
+        if record_type == b'0' and len(fields) >= 10:
+            time = float(fields[3])
+            memory = int(fields[4])
+
+            parent = stack[-1] if stack else None
+
+            call = trace.add_call(
+                -1 if parent is None else parent[0],
+                fields[5].decode('utf-8', 'replace'),
+                fields[8].decode('utf-8', 'replace'),
+                int(fields[9] or 0),
+                time,
+                memory
+            )
+
+            if parent is not None:
+                if parent[4] == -1:
+                    trace.call_first_children[parent[0]] = call
+                else:
+                    trace.call_next_siblings[parent[4]] = call
+                parent[4] = call
+
+            function = trace.call_functions[call]
+            active[function] = active.get(function, 0) + 1
+
+            stack.append([call, fields[1], 0, 0, -1])
+        elif record_type == b'1':
+            time = float(fields[3])
+            memory = int(fields[4])
+
+            # Calls without an exit, like the ones that threw,
+            # exit along with their parent
+            if stack and (stack[-1][1] == fields[1] or
+                          any(entry[1] == fields[1] for entry in stack)):
+                while True:
+                    entry = stack.pop()
+                    exit_call(trace, stack, active, entry, time, memory)
+
+                    if entry[1] == fields[1]:
+                        break
+
+    while stack:
+        exit_call(trace, stack, active, stack.pop(), time, memory)
+
+    if not is_trace and trace.get_call_count() == 0:
+        raise ValueError("Not a computerized Xdebug function trace")
+
+    return trace
+
+
+def exit_call(trace, stack, active, entry, time, memory):
+    """Exit a call, and add it to the aggregates of it's function"""
+    profile = trace.profile
+
+    call = entry[0]
+    function = trace.call_functions[call]
+
+    trace.exit_times[call] = time
+    trace.exit_memory[call] = memory
+
+    time = int(round(trace.get_call_time(call) * 1000000))
+    memory = trace.get_call_memory(call)
+
+    profile.self_costs[0][function] += time - entry[2]
+    profile.self_costs[1][function] += memory - entry[3]
+
+    active[function] -= 1
+
+    if active[function] == 0:
+        profile.inclusive_costs[0][function] += time
+        profile.inclusive_costs[1][function] += memory
+
+    # The first call of the trace wasn't called from a line
+    if trace.call_lines[call] > 0:
+        profile.add_line_cost(trace.call_files[call],
+                              trace.call_lines[call],
+                              [time, memory])
+
+    if stack:
+        parent = stack[-1]
+        parent[2] += time
+        parent[3] += memory
+
+        profile.add_call(trace.call_functions[parent[0]], function, 1,
+                         [time, memory])
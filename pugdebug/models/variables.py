@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import base64
+import binascii
+
+
+class PugdebugChildVariables():
+    """Child variables of a variable, not displayed yet
+
+    Kept on the tree item of the variable until it's expanded. Wrapped in
+    an object, because Qt would make a deep copy of a plain list.
+    """
+
+    variables = []
+
+    def __init__(self, variables):
+        self.variables = variables
+
+
+def get_variable_type(variable):
+    """Get the type of a variable to display
+
+    The class name is displayed instead of the type for objects.
+    """
+    if 'type' not in variable:
+        return ''
+
+    if variable['type'] == 'object':
+        return variable.get('classname', 'object')
+
+    return variable['type']
+
+
+def get_variable_value(variable):
+    """Get the value of a variable as text to display
+
+    Values are kept as received from xdebug until they are displayed, and
+    only then are base64 encoded values decoded. Values that are not valid
+    UTF-8 are displayed as their bytes representation.
+
+    Returns None for variables without a value.
+    """
+    value = variable.get('value')
+
+    if value is None:
+        return None
+
+    if 'encoding' in variable:
+        value = decode_base64(value)
+
+    if variable.get('type') == 'bool':
+        value = 'false' if value == '0' else 'true'
+
+    return value
+
+
+def decode_base64(value):
+    try:
+        value = base64.b64decode(value)
+    except binascii.Error:
+        return value
+
+    try:
+        return value.decode()
+    except UnicodeDecodeError:
+        return repr(value)
+
+
+def is_true(variable):
+    """Is an evaluated boolean expression true"""
+    return variable.get('type') == 'bool' and variable.get('value') == '1'
+
+
+def is_same_value(variable, other):
+    """Do two evaluations of an expression have the same value
+
+    Arrays and objects are compared by their class and their number of
+    children only, their children are not fetched by an evaluation.
+    """
+    keys = ['type', 'classname', 'value', 'encoding', 'numchildren']
+
+    return all(variable.get(key) == other.get(key) for key in keys)
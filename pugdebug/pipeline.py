@@ -0,0 +1,586 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import errno
+import itertools
+import select
+import threading
+import time
+
+from base64 import b64encode
+from concurrent.futures import Future
+
+
+class PugdebugPendingCommand():
+    """A command waiting for it's response
+
+    Besides the future, the callback and the stream parser of the command,
+    it keeps what is needed to time the command.
+    """
+
+    future = None
+    callback = None
+    stream_parser = None
+
+    name = None
+
+    bytes_sent = 0
+
+    # When the command was sent, and how long the send took
+    sent_at = 0
+    send_time = 0
+
+    # When the command got to be the first one waiting for a response.
+    # The engine responds to the commands one at a time, so the command
+    # isn't waited on before that.
+    started_at = 0
+
+    # Seconds to wait for the response, None to wait as long as it takes
+    timeout = None
+
+    def __init__(self, future, callback, stream_parser, name, bytes_sent,
+                 timeout=None):
+        self.future = future
+        self.callback = callback
+        self.stream_parser = stream_parser
+        self.name = name
+        self.bytes_sent = bytes_sent
+        self.timeout = timeout
+
+    def get_deadline(self):
+        """When the command times out, None if it doesn't time out yet"""
+        if self.timeout is None or self.started_at == 0:
+            return None
+
+        return self.started_at + self.timeout
+
+
+class PugdebugCommandPipeline():
+    """Send DBGp commands without waiting for each reply
+
+    Commands are queued and then written to the socket together. Every
+    command gets a future, which is resolved when the response with the
+    matching transaction id is read from the socket.
+
+    This way a batch of commands, like fetching all the variable contexts,
+    the stacktraces and the expressions after a step, costs a single
+    network round trip instead of one round trip per command.
+
+    At most `max_in_flight` commands are written before their responses
+    are read. Otherwise a big batch, like setting thousands of breakpoints,
+    could fill up the socket buffers in both directions, with the engine
+    blocked writing responses and us blocked writing commands.
+
+    Responses of commands queued with a stream parser are fed to the
+    parser chunk by chunk, as they are received, instead of being read
+    into memory in one piece first.
+
+    If timings are given, the send, wait, receive and parse times of every
+    command, and the bytes sent and received, are recorded to them.
+
+    Commands can have a timeout. A command that is not responded to in
+    time fails with a TimeoutError, and it's response is ignored if it
+    arrives later. The worker of the connection is then free to go on.
+    As the engine responds to the commands in the order they were sent,
+    the timeout of a command is counted from when the command before it
+    is responded to, not from when the whole batch was sent.
+
+    The responses are read by one thread, the worker of the connection,
+    but commands can be interrupted from other threads too, for example
+    to `break` a `run` that the worker is waiting on.
+    """
+
+    socket = None
+    frame_reader = None
+    parser = None
+    timings = None
+
+    transaction_id = 0
+
+    max_in_flight = 64
+
+    # How much of a streamed message is read to find it's transaction id
+    max_header_size = 4096
+
+    def __init__(self, socket, frame_reader, parser, timings=None):
+        self.socket = socket
+        self.frame_reader = frame_reader
+        self.parser = parser
+        self.timings = timings
+
+        self.transaction_id = 0
+
+        # Commands that are queued, but not yet written to the socket
+        self.outgoing = []
+
+        # Commands waiting for a response, keyed by their transaction id
+        self.pending = {}
+
+        # Guards the commands and the writes to the socket
+        self.lock = threading.RLock()
+
+    def queue(self, command, arguments='', data=None, callback=None,
+              stream_parser=None, timeout=None):
+        """Queue a command
+
+        The command gets the next transaction id. Optional data is base64
+        encoded and appended to the command.
+
+        The callback is called with the raw response message and the value
+        it returns is the result of the returned future. Without a callback
+        the result is the raw response message.
+
+        The stream parser, if given, is called to create a parser with
+        `feed` and `close` methods. The response is fed to it as it is
+        received and the value `close` returns is the result of the future.
+
+        The timeout is in seconds, counted from when the command is sent,
+        or from when the command sent before it is responded to.
+        """
+        with self.lock:
+            transaction_id, command = self.__create_command(
+                command, arguments, data, callback, stream_parser, timeout
+            )
+
+            self.outgoing.append((transaction_id, command))
+
+            return self.pending[transaction_id].future
+
+    def interrupt(self, command, arguments=''):
+        """Send a command right away
+
+        The command is written to the socket at once, even if other
+        commands are queued or the worker is waiting for a response, like
+        `break` is sent while `run` is waiting for the engine. It's
+        response is read by whoever is reading the responses.
+        """
+        with self.lock:
+            transaction_id, command = self.__create_command(
+                command, arguments
+            )
+
+            self.__send([(transaction_id, command)])
+
+            return self.pending[transaction_id].future
+
+    def cancel(self, future, error=None):
+        """Stop waiting for the response of a command
+
+        The future fails with the given error, a CancelledError by default,
+        and the response is ignored once it arrives.
+        """
+        with self.lock:
+            command = self.pending.pop(future.transaction_id, None)
+
+            if command is None:
+                return False
+
+            self.__start_waiting()
+
+            self.outgoing = [
+                (transaction_id, data)
+                for transaction_id, data in self.outgoing
+                if transaction_id != future.transaction_id
+            ]
+
+        if error is None:
+            future.cancel()
+        else:
+            future.set_exception(error)
+
+        return True
+
+    def flush(self):
+        """Write the queued commands to the socket
+
+        Commands are written in as few writes as possible, but when
+        `max_in_flight` commands are waiting for a response, the responses
+        are read first before more commands are written.
+        """
+        while True:
+            with self.lock:
+                if len(self.outgoing) == 0:
+                    return
+
+                room = self.max_in_flight - self.get_in_flight_count()
+
+                if room > 0:
+                    commands = self.outgoing[:room]
+                    self.outgoing = self.outgoing[room:]
+
+                    self.__send(commands)
+                    continue
+
+            if self.__wait_for_data():
+                self.receive()
+
+    def get_in_flight_count(self):
+        """Number of commands written, but not yet responded to
+        """
+        return len(self.pending) - len(self.outgoing)
+
+    def wait(self, futures):
+        """Wait for the responses of the given commands
+
+        Flushes the queued commands and reads the responses until all the
+        given futures are resolved, or their commands time out.
+        """
+        self.flush()
+
+        for future in futures:
+            while not future.done():
+                if self.__wait_for_data():
+                    self.receive()
+
+    def execute(self, command, arguments='', data=None, callback=None,
+                timeout=None):
+        """Send a single command and return it's result
+        """
+        future = self.queue(command, arguments, data, callback,
+                            timeout=timeout)
+
+        self.wait([future])
+
+        return future.result()
+
+    def receive(self):
+        """Read the available responses and resolve their futures
+        """
+        messages = []
+
+        try:
+            if self.__is_streaming():
+                self.__receive_streamed()
+                return
+
+            message = self.frame_reader.read_frame()
+
+            while message is not None:
+                messages.append((message, self.frame_reader.frame_started_at))
+                message = self.frame_reader.pop_frame()
+        except Exception as e:
+            self.fail(e)
+            raise
+
+        received_at = time.perf_counter()
+
+        for message, started_at in messages:
+            self.dispatch(message, started_at, received_at)
+
+    def fail(self, error):
+        """Fail all the commands that are waiting for a response
+
+        Used when the connection breaks, so no future is left behind
+        that would never be resolved.
+        """
+        with self.lock:
+            pending = self.pending
+
+            self.pending = {}
+            self.outgoing = []
+
+        for command in pending.values():
+            command.future.set_exception(error)
+
+    def dispatch(self, message, started_at=None, received_at=None):
+        """Resolve the future of the command the message is a response to
+
+        Messages that are not responses to a command we sent, like stream
+        or notify messages, are ignored.
+
+        The times the first and the last data of the message were received
+        at are used to time the command.
+        """
+        start = time.perf_counter()
+
+        transaction_id = self.parser.parse_transaction_id(message)
+
+        with self.lock:
+            command = self.pending.pop(transaction_id, None)
+
+            if command is not None:
+                self.__start_waiting()
+
+        if command is None:
+            return
+
+        callback = command.callback
+
+        try:
+            result = callback(message) if callback is not None else message
+        except Exception as e:
+            command.future.set_exception(e)
+        else:
+            command.future.set_result(result)
+
+        self.__record_timings(
+            command,
+            started_at or start,
+            received_at or start,
+            time.perf_counter() - start,
+            len(message)
+        )
+
+    def __is_streaming(self):
+        """Is any of the pending commands waiting for a streamed response
+        """
+        with self.lock:
+            return any(command.stream_parser is not None
+                       for command in self.pending.values())
+
+    def __receive_streamed(self):
+        """Read the next response in chunks
+
+        The beginning of the message is read until the transaction id is
+        known. If the command has a stream parser, the message is fed to
+        it, otherwise it is read in whole and dispatched as usual.
+        """
+        chunks = self.frame_reader.read_frame_chunks()
+
+        header = bytearray()
+        for chunk in chunks:
+            header += chunk
+            if self.__has_response_tag(header):
+                break
+
+        transaction_id = self.parser.parse_transaction_id(bytes(header))
+
+        with self.lock:
+            command = self.pending.get(transaction_id)
+
+            if command is not None and command.stream_parser is not None:
+                del self.pending[transaction_id]
+            else:
+                command = None
+
+        if command is None:
+            message = bytes(header) + b''.join(chunks)
+            self.dispatch(
+                message,
+                self.frame_reader.frame_started_at,
+                time.perf_counter()
+            )
+            return
+
+        started_at = self.frame_reader.frame_started_at
+
+        parser = command.stream_parser()
+        error = None
+
+        parse_time = 0
+        size = 0
+
+        # Errors of the socket are raised, but after a parser error the
+        # rest of the message is still read, to stay in sync
+        for chunk in itertools.chain([bytes(header)], chunks):
+            size += len(chunk)
+
+            if error is not None:
+                continue
+
+            start = time.perf_counter()
+
+            try:
+                parser.feed(chunk)
+            except Exception as e:
+                error = e
+
+            parse_time += time.perf_counter() - start
+
+        received_at = time.perf_counter()
+
+        with self.lock:
+            self.__start_waiting()
+
+        if error is None:
+            try:
+                result = parser.close()
+            except Exception as e:
+                error = e
+
+        if error is not None:
+            command.future.set_exception(error)
+        else:
+            command.future.set_result(result)
+
+        parse_time += time.perf_counter() - received_at
+
+        # The parsing is interleaved with the receiving
+        self.__record_timings(
+            command,
+            started_at,
+            received_at - parse_time,
+            parse_time,
+            size
+        )
+
+    def __has_response_tag(self, header):
+        """Is the whole opening tag of the response in the header
+
+        Also gives up on messages that are not responses, once the header
+        is long enough.
+        """
+        start = header.find(b'<response')
+
+        if start != -1 and header.find(b'>', start) != -1:
+            return True
+
+        return len(header) >= self.max_header_size
+
+    def __create_command(self, command, arguments='', data=None,
+                         callback=None, stream_parser=None, timeout=None):
+        """Create a command with the next transaction id
+
+        The command is added to the pending commands, and returned with
+        it's transaction id, ready to be written to the socket.
+        """
+        transaction_id = self.__get_transaction_id()
+
+        name = command
+        command = '%s -i %d' % (command, transaction_id)
+
+        if arguments:
+            command = '%s %s' % (command, arguments)
+
+        if data is not None:
+            data = b64encode(bytes(data, 'UTF-8')).decode()
+            command = '%s -- %s' % (command, data)
+
+        future = Future()
+        future.transaction_id = transaction_id
+
+        command = bytes(command + '\0', 'utf-8')
+
+        self.pending[transaction_id] = PugdebugPendingCommand(
+            future,
+            callback,
+            stream_parser,
+            name,
+            len(command),
+            timeout
+        )
+
+        return transaction_id, command
+
+    def __send(self, commands):
+        """Write the commands to the socket in one go
+
+        Must be called with the lock held.
+        """
+        start = time.perf_counter()
+
+        try:
+            self.socket.sendall(
+                b''.join(command for transaction_id, command in commands)
+            )
+        except Exception as e:
+            self.fail(e)
+            raise
+
+        sent_at = time.perf_counter()
+
+        for transaction_id, command in commands:
+            pending = self.pending.get(transaction_id)
+
+            if pending is not None:
+                pending.sent_at = sent_at
+                pending.send_time = sent_at - start
+
+        self.__start_waiting()
+
+    def __start_waiting(self):
+        """Start the timeout of the first command waiting for a response
+
+        The commands are kept in the order they were sent in. Must be
+        called with the lock held.
+        """
+        for command in self.pending.values():
+            if command.sent_at == 0:
+                continue
+
+            if command.started_at == 0:
+                command.started_at = time.perf_counter()
+
+            return
+
+    def __wait_for_data(self):
+        """Wait until there is a response to read
+
+        Returns False if a command timed out before that, the timed out
+        commands are failed.
+        """
+        deadline = self.__get_earliest_deadline()
+
+        if deadline is None or self.frame_reader.has_frame():
+            return True
+
+        remaining = deadline - time.perf_counter()
+
+        if remaining > 0:
+            readable, writable, exceptional = select.select(
+                [self.socket], [], [], remaining
+            )
+
+            if len(readable) > 0:
+                return True
+
+        self.__expire_commands()
+
+        return False
+
+    def __get_earliest_deadline(self):
+        with self.lock:
+            deadlines = [command.get_deadline()
+                         for command in self.pending.values()]
+
+        deadlines = [deadline for deadline in deadlines
+                     if deadline is not None]
+
+        return min(deadlines) if len(deadlines) > 0 else None
+
+    def __expire_commands(self):
+        """Fail the commands that are past their deadline"""
+        now = time.perf_counter()
+
+        with self.lock:
+            expired = [command for command in self.pending.values()
+                       if command.get_deadline() is not None and
+                       command.get_deadline() <= now]
+
+        for command in expired:
+            self.cancel(command.future, TimeoutError(
+                errno.ETIMEDOUT,
+                '%s timed out after %g seconds' % (
+                    command.name,
+                    command.timeout
+                )
+            ))
+
+    def __record_timings(self, command, started_at, received_at, parse_time,
+                         bytes_received):
+        if self.timings is None:
+            return
+
+        started_at = max(started_at, command.sent_at)
+
+        self.timings.record_command(
+            command.name,
+            command.send_time,
+            started_at - command.sent_at,
+            max(0, received_at - started_at),
+            parse_time,
+            command.bytes_sent,
+            bytes_received
+        )
+
+    def __get_transaction_id(self):
+        self.transaction_id += 1
+        return self.transaction_id
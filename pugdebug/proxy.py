@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+
+    A headless DBGp proxy, so one debugger engine port can serve several
+    developers, each running pugdebug with their own IDE key:
+
+        python -m pugdebug.proxy --engine-port 9000 --ide-port 9001
+"""
+
+__author__ = "robertbasic"
+
+import argparse
+import re
+import selectors
+import shlex
+import socket
+import threading
+
+from xml.etree import ElementTree
+from xml.sax.saxutils import quoteattr
+
+from pugdebug.frame_reader import PugdebugFrameReader
+
+idekey_pattern = re.compile(rb'<init\b[^>]*?\bidekey="([^"]*)"')
+
+
+def frame(message):
+    return str(len(message)).encode() + b'\0' + message + b'\0'
+
+
+def get_idekey(init_message):
+    """Get the idekey of an init message, without parsing all of it"""
+    match = idekey_pattern.search(init_message)
+
+    return match.group(1).decode() if match else ''
+
+
+def set_proxied(init_message, address):
+    """Add the address of the debugger engine to the init message
+
+    As the proxy connects to the IDE, the IDE would otherwise see the
+    address of the proxy as the address of the engine.
+    """
+    return init_message.replace(
+        b'<init ',
+        b'<init proxied=%s ' % quoteattr(address).encode(),
+        1
+    )
+
+
+class PugdebugProxyRegistration():
+    """An IDE registered with the proxy to get the sessions of an idekey"""
+
+    idekey = None
+    address = None
+    port = 0
+
+    # Can the IDE debug several sessions at the same time
+    multiple = True
+
+    sessions = 0
+
+    def __init__(self, idekey, address, port, multiple=True):
+        self.idekey = idekey
+        self.address = address
+        self.port = port
+        self.multiple = multiple
+        self.sessions = 0
+
+
+class PugdebugProxy():
+    """Route debugger engine connections to IDEs by their idekey
+
+    IDEs register with the proxy on the IDE port, sending `proxyinit` with
+    the port they listen on and their idekey, and unregister with
+    `proxystop`, as described by the DBGp protocol.
+
+    Debugger engines connect to the engine port. The proxy reads the init
+    message, finds the IDE registered for it's idekey and connects to it.
+    From then on the data is passed between the engine and the IDE as it
+    is, without parsing the frames. Connections with an idekey no IDE is
+    registered for are closed, and the engine runs the script on without
+    debugging it.
+    """
+
+    engine_address = ('', 9000)
+    ide_address = ('', 9001)
+
+    # Seconds an engine has to send it's init message, and an IDE
+    # it's proxy command
+    timeout = 5
+
+    engine_server = None
+    ide_server = None
+
+    def __init__(self, engine_address=('', 9000), ide_address=('', 9001),
+                 timeout=5):
+        self.engine_address = engine_address
+        self.ide_address = ide_address
+        self.timeout = timeout
+
+        self.engine_server = None
+        self.ide_server = None
+
+        self.registrations = {}
+        self.lock = threading.Lock()
+
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+
+        self.is_serving = False
+
+    def bind(self):
+        """Create the listening sockets for the engines and the IDEs"""
+        self.engine_server = self.__listen(self.engine_address)
+        self.ide_server = self.__listen(self.ide_address)
+
+    def get_engine_port(self):
+        return self.engine_server.getsockname()[1]
+
+    def get_ide_port(self):
+        return self.ide_server.getsockname()[1]
+
+    def serve_forever(self):
+        """Accept engine and IDE connections until stopped"""
+        if self.engine_server is None:
+            self.bind()
+
+        selector = selectors.DefaultSelector()
+        selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        selector.register(self.engine_server, selectors.EVENT_READ,
+                          self.handle_engine)
+        selector.register(self.ide_server, selectors.EVENT_READ,
+                          self.handle_ide)
+
+        self.is_serving = True
+
+        try:
+            while self.is_serving:
+                for key, mask in selector.select():
+                    if key.data is None:
+                        self.is_serving = False
+                        break
+
+                    self.__accept(key.fileobj, key.data)
+        finally:
+            selector.close()
+            self.engine_server.close()
+            self.ide_server.close()
+
+    def stop(self):
+        try:
+            self.wakeup_writer.send(b'\0')
+        except OSError:
+            pass
+
+    def register(self, registration):
+        with self.lock:
+            self.registrations[registration.idekey] = registration
+
+    def unregister(self, idekey):
+        with self.lock:
+            return self.registrations.pop(idekey, None) is not None
+
+    def start_session(self, idekey):
+        """Get the registration to pass a new session of the idekey to
+
+        Returns None if no IDE is registered for the idekey, or if the IDE
+        is already debugging and can't debug several sessions.
+        """
+        with self.lock:
+            registration = self.registrations.get(idekey)
+
+            if registration is None:
+                return None
+
+            if not registration.multiple and registration.sessions > 0:
+                return None
+
+            registration.sessions += 1
+
+            return registration
+
+    def end_session(self, registration):
+        with self.lock:
+            registration.sessions -= 1
+
+    def handle_engine(self, sock, address):
+        PugdebugProxySession(self, sock, address).start()
+
+    def handle_ide(self, sock, address):
+        threading.Thread(
+            target=self.__handle_proxy_command,
+            args=(sock, address),
+            daemon=True
+        ).start()
+
+    def __handle_proxy_command(self, sock, address):
+        """Handle the `proxyinit` or `proxystop` command of an IDE"""
+        try:
+            sock.settimeout(self.timeout)
+
+            command = b''
+            while b'\0' not in command and len(command) < 4096:
+                chunk = sock.recv(1024)
+                if not chunk:
+                    return
+                command += chunk
+
+            response = self.__get_proxy_response(
+                command.split(b'\0', 1)[0].decode('utf-8', 'replace'),
+                address[0]
+            )
+
+            sock.sendall(frame(
+                b'<?xml version="1.0" encoding="UTF-8"?>\n' +
+                response.encode('utf-8')
+            ))
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+    def __get_proxy_response(self, command, address):
+        try:
+            arguments = shlex.split(command)
+        except ValueError:
+            arguments = []
+
+        name = arguments[0] if arguments else ''
+        options = dict(zip(arguments[1::2], arguments[2::2]))
+
+        idekey = options.get('-k', '')
+
+        if name not in ['proxyinit', 'proxystop']:
+            return self.__get_error_response('proxyerror', 1,
+                                             'Unknown proxy command')
+
+        if idekey == '':
+            return self.__get_error_response(name, 3, 'No IDE key')
+
+        if name == 'proxystop':
+            self.unregister(idekey)
+
+            return '<proxystop success="1" idekey=%s/>' % quoteattr(idekey)
+
+        if not options.get('-p', '').isdigit():
+            return self.__get_error_response(name, 3, 'No port')
+
+        registration = PugdebugProxyRegistration(
+            idekey,
+            address,
+            int(options['-p']),
+            options.get('-m', '1') != '0'
+        )
+        self.register(registration)
+
+        return '<proxyinit success="1" idekey=%s address=%s port="%d"/>' % (
+            quoteattr(idekey),
+            quoteattr(address),
+            registration.port
+        )
+
+    def __get_error_response(self, name, code, message):
+        return ('<%s success="0"><error id="%d"><message>%s</message>'
+                '</error></%s>') % (name, code, message, name)
+
+    def __listen(self, address):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        server.listen(128)
+        server.setblocking(False)
+
+        return server
+
+    def __accept(self, server, handler):
+        while True:
+            try:
+                sock, address = server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+
+            sock.setblocking(True)
+            handler(sock, address)
+
+
+class PugdebugProxySession(threading.Thread):
+    """A debugger engine connection passed on to an IDE
+
+    Reads the init message to find out where to pass the connection to,
+    then passes the data between the two as it arrives, in both
+    directions.
+    """
+
+    buffer_size = 65536
+
+    def __init__(self, proxy, engine, address):
+        super(PugdebugProxySession, self).__init__(daemon=True)
+
+        self.proxy = proxy
+        self.engine = engine
+        self.address = address
+
+        self.ide = None
+
+    def run(self):
+        registration = None
+
+        try:
+            self.engine.settimeout(self.proxy.timeout)
+
+            reader = PugdebugFrameReader(self.engine)
+            init_message = reader.read_frame()
+
+            registration = self.proxy.start_session(get_idekey(init_message))
+
+            if registration is None:
+                return
+
+            self.ide = socket.create_connection(
+                (registration.address, registration.port),
+                self.proxy.timeout
+            )
+
+            for sock in [self.engine, self.ide]:
+                sock.settimeout(None)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            self.ide.sendall(
+                frame(set_proxied(init_message, self.address[0])) +
+                bytes(reader.view[reader.start:reader.end])
+            )
+
+            to_engine = threading.Thread(
+                target=self.relay,
+                args=(self.ide, self.engine),
+                daemon=True
+            )
+            to_engine.start()
+
+            self.relay(self.engine, self.ide)
+
+            to_engine.join()
+        except OSError:
+            pass
+        finally:
+            if registration is not None:
+                self.proxy.end_session(registration)
+
+            for sock in [self.engine, self.ide]:
+                if sock is not None:
+                    sock.close()
+
+    def relay(self, source, destination):
+        """Pass the data from the source to the destination
+
+        When either side closes the connection, both are shut down.
+        """
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+
+        try:
+            while True:
+                received = source.recv_into(buffer)
+
+                if received == 0:
+                    break
+
+                destination.sendall(view[:received])
+        except OSError:
+            pass
+        finally:
+            for sock in [source, destination]:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def register_with_proxy(proxy_address, port, idekey, timeout=5):
+    """Register with a DBGp proxy to get the sessions of the idekey
+
+    The proxy connects to the given port on the address it sees the
+    registration coming from. Raises a ConnectionError if the proxy
+    refuses the registration.
+    """
+    send_proxy_command(
+        proxy_address,
+        'proxyinit -p %d -k %s -m 1' % (port, shlex.quote(idekey)),
+        timeout
+    )
+
+
+def unregister_from_proxy(proxy_address, idekey, timeout=5):
+    send_proxy_command(
+        proxy_address,
+        'proxystop -k %s' % shlex.quote(idekey),
+        timeout
+    )
+
+
+def send_proxy_command(proxy_address, command, timeout=5):
+    sock = socket.create_connection(proxy_address, timeout)
+
+    try:
+        sock.sendall(command.encode('utf-8') + b'\0')
+        response = PugdebugFrameReader(sock).read_frame()
+    finally:
+        sock.close()
+
+    response = ElementTree.fromstring(response)
+
+    if response.get('success') != '1':
+        error = response.find('error/message')
+        raise ConnectionError(
+            'DBGp proxy refused %s: %s' % (
+                command.split(' ', 1)[0],
+                error.text if error is not None else 'unknown error'
+            )
+        )
+
+
+def parse_proxy_address(proxy):
+    """Parse a `host:port` proxy address, the port defaults to 9001"""
+    host, separator, port = proxy.rpartition(':')
+
+    if not separator:
+        return (proxy, 9001)
+
+    return (host, int(port))
+
+
+def main():
+    arguments = argparse.ArgumentParser(
+        description='Route DBGp connections to IDEs by their IDE key'
+    )
+    arguments.add_argument('--host', default='',
+                           help='address to listen on')
+    arguments.add_argument('--engine-port', type=int, default=9000,
+                           help='port the debugger engines connect to')
+    arguments.add_argument('--ide-port', type=int, default=9001,
+                           help='port the IDEs register on')
+    options = arguments.parse_args()
+
+    proxy = PugdebugProxy(
+        (options.host, options.engine_port),
+        (options.host, options.ide_port)
+    )
+
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
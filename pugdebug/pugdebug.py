@@ -15,22 +15,29 @@ import logging
 import signal
 
 from PyQt5.QtCore import QObject
-from PyQt5.QtWidgets import QErrorMessage, QMessageBox
+from PyQt5.QtWidgets import QErrorMessage, QMessageBox, QDialog
 
 from pugdebug.debugger import PugdebugDebugger
 from pugdebug.syntaxer import PugdebugFormatter
+from pugdebug.gui.breakpoints import PugdebugBreakpointDialog
 from pugdebug.gui.main_window import PugdebugMainWindow
 from pugdebug.gui.document import PugdebugDocument
+from pugdebug.watchdog import PugdebugWatchdog
+from pugdebug.models.breakpoints import (PugdebugBreakpoints,
+                                         is_line_breakpoint,
+                                         describe_breakpoint_location)
 from pugdebug.models.documents import PugdebugDocuments
 from pugdebug.models.file_browser import PugdebugFileBrowser
+from pugdebug.models.profile import format_line_costs
 from pugdebug.models.projects import PugdebugProjects
 from pugdebug.models.settings import (get_setting, set_setting,
                                       save_settings, has_setting)
+from pugdebug.models.timings import measure_gui_update
 
 
 class Pugdebug(QObject):
 
-    breakpoints = []
+    breakpoints = None
 
     def __init__(self):
         """Initialize the application
@@ -42,10 +49,16 @@ class Pugdebug(QObject):
         """
         super(Pugdebug, self).__init__()
 
+        self.breakpoints = PugdebugBreakpoints()
+
         self.debugger = PugdebugDebugger()
 
         self.formatter = PugdebugFormatter()
 
+        self.watchdog = PugdebugWatchdog(
+            int(get_setting('editor/stall_threshold'))
+        )
+
         # UI elements
         self.main_window = PugdebugMainWindow()
         self.file_browser = self.main_window.get_file_browser()
@@ -56,6 +69,8 @@ class Pugdebug(QObject):
         self.stacktrace_viewer = self.main_window.get_stacktrace_viewer()
         self.breakpoint_viewer = self.main_window.get_breakpoint_viewer()
         self.expression_viewer = self.main_window.get_expression_viewer()
+        self.log_viewer = self.main_window.get_log_viewer()
+        self.profile_viewer = self.main_window.get_profile_viewer()
 
         self.documents = PugdebugDocuments()
 
@@ -109,6 +124,7 @@ class Pugdebug(QObject):
         self.connect_expression_viewer_signals()
         self.connect_stacktrace_viewer_signals()
         self.connect_breakpoint_viewer_signals()
+        self.connect_profile_viewer_signals()
 
     def connect_file_browser_signals(self):
         """Connect file browser signals
@@ -199,9 +215,13 @@ class Pugdebug(QObject):
             self.detach_debug
         )
         self.main_window.run_debug_action.triggered.connect(self.run_debug)
+        self.main_window.pause_debug_action.triggered.connect(
+            self.pause_debug
+        )
         self.main_window.step_over_action.triggered.connect(self.step_over)
         self.main_window.step_into_action.triggered.connect(self.step_into)
         self.main_window.step_out_action.triggered.connect(self.step_out)
+        self.main_window.auto_step_action.triggered.connect(self.auto_step)
 
     def connect_debugger_signals(self):
         """Connect debugger signals
@@ -243,9 +263,15 @@ class Pugdebug(QObject):
         )
 
         # Breakpoints signals
+        self.debugger.breakpoint_set_signal.connect(
+            self.handle_breakpoint_set
+        )
         self.debugger.breakpoint_removed_signal.connect(
             self.handle_breakpoint_removed
         )
+        self.debugger.breakpoint_remove_failed_signal.connect(
+            self.handle_breakpoint_remove_failed
+        )
         self.debugger.breakpoints_listed_signal.connect(
             self.handle_breakpoints_listed
         )
@@ -258,6 +284,9 @@ class Pugdebug(QObject):
             self.handle_expressions_evaluated
         )
 
+        # Log signals
+        self.debugger.logged_signal.connect(self.handle_logged)
+
         # Error signals
         self.debugger.error_signal.connect(
             self.handle_error
@@ -270,6 +299,9 @@ class Pugdebug(QObject):
         self.expression_viewer.expression_changed_signal.connect(
             self.handle_expression_added_or_changed
         )
+        self.expression_viewer.expressions_changed_signal.connect(
+            self.debugger.set_expressions
+        )
 
     def connect_stacktrace_viewer_signals(self):
         self.stacktrace_viewer.item_double_clicked_signal.connect(
@@ -280,6 +312,20 @@ class Pugdebug(QObject):
         self.breakpoint_viewer.item_double_clicked_signal.connect(
             self.jump_to_line_in_file
         )
+        self.breakpoint_viewer.breakpoint_added_signal.connect(
+            self.set_breakpoint
+        )
+        self.breakpoint_viewer.breakpoint_removed_signal.connect(
+            self.remove_breakpoint
+        )
+
+    def connect_profile_viewer_signals(self):
+        self.profile_viewer.item_double_clicked_signal.connect(
+            self.jump_to_line_in_file
+        )
+        self.profile_viewer.profile_loaded_signal.connect(
+            self.handle_profile_loaded
+        )
 
     def handle_new_project_created(self, project_name):
         """Handle when a new project gets created
@@ -370,6 +416,15 @@ class Pugdebug(QObject):
             document_widget.document_double_clicked_signal.connect(
                 self.handle_document_double_click
             )
+            document_widget.breakpoint_edit_requested_signal.connect(
+                self.handle_breakpoint_edit_requested
+            )
+            document_widget.run_to_line_requested_signal.connect(
+                self.run_to_line
+            )
+
+            self.__set_line_costs(document_widget)
+            self.__set_breakpoint_markers(document_widget)
 
             # Add the newly opened document to the document viewer's tab stack
             self.document_viewer.add_tab(
@@ -406,6 +461,30 @@ class Pugdebug(QObject):
             logging.debug("Removing breakpoint")
             self.remove_breakpoint(breakpoint)
 
+    def handle_breakpoint_edit_requested(self, path, line_number):
+        """Handle when the breakpoint of a line is to be edited
+
+        Show the breakpoint dialog for the breakpoint on that line, or for
+        a new one if there is none. The edited breakpoint replaces the
+        breakpoint that was on the line.
+        """
+        remote_path = self.__get_path_mapped_to_remote(path)
+
+        breakpoint = self.get_breakpoint(remote_path, line_number)
+
+        dialog = PugdebugBreakpointDialog(
+            self.main_window,
+            breakpoint or {'filename': remote_path, 'lineno': line_number}
+        )
+
+        if dialog.exec_() != QDialog.Accepted:
+            return
+
+        if breakpoint is not None:
+            self.remove_breakpoint(breakpoint)
+
+        self.set_breakpoint(dialog.get_breakpoint())
+
     def handle_document_changed(self, document_model):
         """Handle when a document gets chaned
 
@@ -480,6 +559,24 @@ class Pugdebug(QObject):
         document_widget = self.document_viewer.get_current_document()
         document_widget.move_to_line(line, is_current)
 
+    def handle_profile_loaded(self, profile):
+        """Handle when a profile gets loaded
+
+        Paint the costs of the lines of the open documents.
+        """
+        for document_widget in self.document_viewer.get_all_documents():
+            self.__set_line_costs(document_widget)
+
+    def __set_line_costs(self, document_widget):
+        profile = self.profile_viewer.profile
+
+        if profile is None:
+            return
+
+        path = self.__get_path_mapped_to_remote(document_widget.get_path())
+
+        document_widget.set_line_costs(format_line_costs(profile, path))
+
     def handle_settings_changed(self, changed_settings):
         """Handle when settings have changed.
 
@@ -515,6 +612,11 @@ class Pugdebug(QObject):
                 if feature in changed_setting_keys):
             self.handle_editor_features_changed()
 
+        if 'editor/stall_threshold' in changed_setting_keys:
+            self.watchdog.set_threshold(
+                int(get_setting('editor/stall_threshold'))
+            )
+
     def handle_project_root_changed(self):
         """Handle when the project root is changed
 
@@ -621,7 +723,8 @@ class Pugdebug(QObject):
             return
 
         post_start_data = {
-            'breakpoints': self.breakpoints
+            'breakpoints': self.breakpoints.to_list(),
+            'expressions': self.expression_viewer.get_expressions()
         }
         self.debugger.post_start_command(post_start_data)
 
@@ -700,21 +803,32 @@ class Pugdebug(QObject):
         If the debugger is in a breaking state, focus the current line
         in the current file.
 
+        If a newer step was started in the meantime, for example when the
+        step over key is held down, skip rendering this stop location, only
+        the latest one is rendered.
+
         If the debugger is in a stopping state, stop the debugging session.
         """
         logging.debug("Step command")
 
+        if self.debugger.is_breaking() and self.debugger.is_step_stale():
+            logging.debug("Skipping stale step")
+            return
+
         self.main_window.set_debugging_status(3)
 
         if self.debugger.is_breaking():
             logging.debug("Debugger is breaking")
 
-            self.focus_current_line()
+            with measure_gui_update('step'):
+                self.focus_current_line()
 
-            post_step_data = {
-                'expressions': self.expression_viewer.get_expressions()
-            }
-            self.debugger.post_step_command(post_step_data)
+            # The state can be fetched already together with the step
+            if not self.debugger.has_fetched_state():
+                post_step_data = {
+                    'expressions': self.expression_viewer.get_expressions()
+                }
+                self.debugger.post_step_command(post_step_data)
         elif self.debugger.is_stopped():
             logging.debug("Debugger is stopped")
             self.stop_debug()
@@ -732,6 +846,17 @@ class Pugdebug(QObject):
 
         self.debugger.run_debug()
 
+    def pause_debug(self):
+        """Break into the script while it runs
+
+        This gets called when the "Pause" action button is pressed. The
+        step command that is running then breaks, and is handled as usual.
+        """
+        logging.debug("Pause command")
+
+        if not self.debugger.pause_debug():
+            logging.debug("Debugger is not running")
+
     def step_over(self):
         """Issue a step over continuation command on the debugger
 
@@ -765,6 +890,49 @@ class Pugdebug(QObject):
 
         self.debugger.step_out()
 
+    def auto_step(self):
+        """Step until told to stop, without refreshing on every step
+
+        This gets called when the "Auto step" action is triggered. The
+        steps are done by the debugger, until the number of steps is done,
+        or the expression is true or changes. The state is refreshed only
+        once it stops, and why it stopped is logged.
+        """
+        auto_step_window = self.main_window.auto_step_window
+
+        if auto_step_window.exec() != QDialog.Accepted:
+            return
+
+        if not self.debugger.is_connected():
+            return
+
+        options = auto_step_window.get_options()
+
+        logging.debug("Auto step command %s" % options)
+
+        self.main_window.set_debugging_status(4)
+
+        self.debugger.auto_step(options)
+
+    def run_to_line(self, path, line_number):
+        """Run the script to a line of a document
+
+        This gets called when "Run to line" is chosen in the menu of a
+        document. The script runs until it gets to the line, or until it
+        breaks before that, and the state is refreshed only then.
+        """
+        if not self.debugger.is_connected() or self.debugger.is_stopped():
+            logging.debug("Not debugging, can't run to line")
+            return
+
+        path = self.__get_path_mapped_to_remote(path)
+
+        logging.debug("Run to line command %s:%s" % (path, line_number))
+
+        self.main_window.set_debugging_status(4)
+
+        self.debugger.run_to(path, line_number)
+
     def handle_got_all_variables(self, variables):
         """Handle when all variables are retrieved from xdebug
 
@@ -772,7 +940,8 @@ class Pugdebug(QObject):
         """
         logging.debug("Setting variables received from debugger")
 
-        self.variable_viewer.set_variables(variables)
+        with measure_gui_update('variables'):
+            self.variable_viewer.set_variables(variables)
 
     def handle_got_stacktraces(self, stacktraces):
         """Handle when stacktraces are retrieved from xdebug
@@ -781,7 +950,8 @@ class Pugdebug(QObject):
         """
         logging.debug("Setting stacktraces received from debugger")
 
-        self.stacktrace_viewer.set_stacktraces(stacktraces)
+        with measure_gui_update('stacktraces'):
+            self.stacktrace_viewer.set_stacktraces(stacktraces)
 
     def set_breakpoint(self, breakpoint):
         """Set a breakpoint
@@ -791,22 +961,14 @@ class Pugdebug(QObject):
         numbers of the documents, and show them in the breakpoint viewer.
 
         If there is an active debugging session, tell the debugger to set the
-        breakpoint.
+        breakpoint. It is added once the debugger sets it.
         """
         logging.debug("Set a breakpoint")
 
         if not self.debugger.is_connected():
-            logging.debug("Debugger is not connected, appending breakpoint")
+            logging.debug("Debugger is not connected, adding breakpoint")
 
-            self.breakpoints.append(breakpoint)
-
-            path = breakpoint['filename']
-            path = self.__get_path_mapped_to_local(path)
-
-            document_widget = self.document_viewer.get_document_by_path(path)
-            document_widget.rehighlight_breakpoint_lines()
-
-            self.breakpoint_viewer.set_breakpoints(self.breakpoints)
+            self.handle_breakpoint_set(breakpoint)
 
             return
 
@@ -814,42 +976,50 @@ class Pugdebug(QObject):
 
         self.debugger.set_breakpoint(breakpoint)
 
+    def handle_breakpoint_set(self, breakpoint):
+        """Handle when a breakpoint gets set
+
+        Add the breakpoint, show it in the breakpoint viewer, and
+        rehighlight the breakpoint markers of it's document.
+        """
+        self.breakpoints.add(breakpoint)
+
+        self.breakpoint_viewer.add_breakpoint(breakpoint)
+
+        if is_line_breakpoint(breakpoint):
+            self.__rehighlight_breakpoint_lines(breakpoint['filename'])
+
     def remove_breakpoint(self, breakpoint):
         """Remove a breakpoint
 
-        If there is no active debugging session, just remove the breakpoint
-        from the breakpoints, rehighlight the line numbers for
-        breakpoint markers and update the breakpoint viewer.
+        If there is no active debugging session, or the debugger doesn't
+        know about the breakpoint, as it has no id, just remove the
+        breakpoint from the breakpoints, update the breakpoint viewer and
+        rehighlight the breakpoint markers.
 
         If there is an active debugging session, tell the debugger to remove
-        the breakpoint.
+        the breakpoint. It is removed once the debugger removes it.
         """
         logging.debug("Remove a breakpoint")
 
-        if not self.debugger.is_connected():
-            logging.debug("Debugger is not connected, removing breakpoint")
-
-            path = breakpoint['filename']
-            line_number = breakpoint['lineno']
-
-            for breakpoint in self.breakpoints:
-                if (breakpoint['filename'] == path and
-                        breakpoint['lineno'] == line_number):
-                    self.breakpoints.remove(breakpoint)
+        if not self.debugger.is_connected() or 'id' not in breakpoint:
+            logging.debug("Removing breakpoint unknown to the debugger")
 
-            path = self.__get_path_mapped_to_local(path)
+            breakpoint = self.breakpoints.remove(breakpoint)
 
-            document_widget = self.document_viewer.get_document_by_path(path)
-            document_widget.rehighlight_breakpoint_lines()
+            if breakpoint is not None:
+                self.breakpoint_viewer.remove_breakpoint(breakpoint)
 
-            self.breakpoint_viewer.set_breakpoints(self.breakpoints)
+                if is_line_breakpoint(breakpoint):
+                    self.__rehighlight_breakpoint_lines(
+                        breakpoint['filename']
+                    )
 
             return
 
-        if 'id' in breakpoint:
-            breakpoint_id = int(breakpoint['id'])
-            logging.debug("Removing breakpoint: %s" % breakpoint_id)
-            self.debugger.remove_breakpoint(breakpoint_id)
+        breakpoint_id = int(breakpoint['id'])
+        logging.debug("Removing breakpoint: %s" % breakpoint_id)
+        self.debugger.remove_breakpoint(breakpoint_id)
 
     def remove_stale_breakpoints(self, path):
         """Remove stale breakpoints for a file
@@ -863,60 +1033,57 @@ class Pugdebug(QObject):
 
         logging.debug("Removing stale breakpoints: %s" % remote_path)
 
-        breakpoints = list(filter(
-            lambda breakpoint: breakpoint['filename'] != remote_path,
-            self.breakpoints
-        ))
-        self.breakpoints = breakpoints
-
-        self.breakpoint_viewer.set_breakpoints(breakpoints)
+        for breakpoint in self.breakpoints.remove_file(remote_path):
+            self.breakpoint_viewer.remove_breakpoint(breakpoint)
 
     def handle_breakpoint_removed(self, breakpoint_id):
         """Handle when a breakpoint gets removed
 
         This slot is called when a breakpoint is removed through the debugger.
 
-        It relists the breakpoints and rehighlights the breakpoint markers
-        on the line numbers.
+        It removes the breakpoint from the breakpoint viewer and rehighlights
+        the breakpoint markers on the line numbers.
         """
-        path = None
-        line_number = None
+        logging.debug("Breakpoint removed: %s" % breakpoint_id)
 
-        logging.debug("Breakpoint removed")
+        breakpoint = self.breakpoints.remove_by_id(breakpoint_id)
 
-        for breakpoint in self.breakpoints:
-            if int(breakpoint['id']) == breakpoint_id:
-                logging.debug("Found removed breakpoint: %s" % breakpoint_id)
+        if breakpoint is None:
+            return
 
-                path = breakpoint['filename']
-                line_number = breakpoint['lineno']
+        self.breakpoint_viewer.remove_breakpoint(breakpoint)
 
-                self.debugger.list_breakpoints()
+        if is_line_breakpoint(breakpoint):
+            self.__rehighlight_breakpoint_lines(breakpoint['filename'])
 
-        logging.debug("%s:%s" % (path, line_number))
+    def handle_breakpoint_remove_failed(self, breakpoint_id):
+        """Handle when the debugger refuses to remove a breakpoint
 
-        if path is not None and line_number is not None:
-            path = self.__get_path_mapped_to_local(path)
+        The breakpoint is still set, so it's marker is shown again, in case
+        the line was double clicked, and the failure is logged.
+        """
+        breakpoint = self.breakpoints.get_by_id(breakpoint_id)
 
-            document_widget = self.document_viewer.get_document_by_path(path)
-            document_widget.rehighlight_breakpoint_lines()
+        if breakpoint is None:
+            return
 
-    def get_breakpoint(self, path, line_number):
-        """Get a breakpoint by it's path and line number
+        if is_line_breakpoint(breakpoint):
+            self.__rehighlight_breakpoint_lines(breakpoint['filename'])
+            where = 'at %s:%s' % (os.path.basename(breakpoint['filename']),
+                                  breakpoint['lineno'])
+        else:
+            where = 'on %s' % describe_breakpoint_location(breakpoint)
 
-        If the breakpoint can be found in the breakpoints from a debugging
-        session, return that breakpoint.
+        self.log_viewer.append_entry(
+            "Removing the breakpoint %s failed" % where
+        )
 
-        If the breakpoint can be found in the init breakpoints, return that.
+    def get_breakpoint(self, path, line_number):
+        """Get a breakpoint by it's path and line number
 
-        Finally return None.
+        Returns None if there is no breakpoint on that line.
         """
-        for breakpoint in self.breakpoints:
-            if (breakpoint['filename'] == path and
-                    int(breakpoint['lineno']) == line_number):
-                return breakpoint
-
-        return None
+        return self.breakpoints.get(path, line_number)
 
     def handle_breakpoints_listed(self, breakpoints):
         """Handle when debugger lists breakpoints
@@ -926,27 +1093,59 @@ class Pugdebug(QObject):
         """
         logging.debug("Breakpoints listed")
 
-        self.breakpoints = breakpoints
+        self.breakpoints.replace(breakpoints)
 
-        self.breakpoint_viewer.set_breakpoints(breakpoints)
+        with measure_gui_update('breakpoints'):
+            self.breakpoint_viewer.set_breakpoints(breakpoints)
 
-        for breakpoint in breakpoints:
-            path = self.__get_path_mapped_to_local(breakpoint['filename'])
-            document_widget = self.document_viewer.get_document_by_path(path)
-            document_widget.rehighlight_breakpoint_lines()
+            for filename in self.breakpoints.get_files():
+                self.__rehighlight_breakpoint_lines(filename)
+
+    def __rehighlight_breakpoint_lines(self, filename):
+        """Rehighlight the breakpoint markers of a file, if it is open"""
+        path = self.__get_path_mapped_to_local(filename)
+
+        document_widget = self.document_viewer.get_document_by_path(path)
+
+        if document_widget is not None:
+            self.__set_breakpoint_markers(document_widget)
+
+    def __set_breakpoint_markers(self, document_widget):
+        """Mark the lines of a document from the breakpoints that are set
+
+        The markers are built from the breakpoints, so listed breakpoints
+        and breakpoints of a project are shown the same as the ones set by
+        hand.
+        """
+        remote_path = self.__get_path_mapped_to_remote(
+            document_widget.get_path()
+        )
+
+        document_widget.set_breakpoint_markers(
+            self.breakpoints.get_line_markers(remote_path)
+        )
 
     def handle_expression_evaluated(self, index, result):
         """Handle when an expression is evaluated"""
         logging.debug("Expression evaluated")
 
-        self.expression_viewer.set_evaluated(index, result)
+        with measure_gui_update('expression'):
+            self.expression_viewer.set_evaluated(index, result)
 
     def handle_expressions_evaluated(self, results):
         """Handle when a list of expressions is evaluated"""
         logging.debug("Expressions evaluated")
 
-        for index, result in enumerate(results):
-            self.expression_viewer.set_evaluated(index, result)
+        with measure_gui_update('expressions'):
+            for index, result in enumerate(results):
+                self.expression_viewer.set_evaluated(index, result)
+
+    def handle_logged(self, entry):
+        """Handle when a logpoint logs an entry
+
+        Only the entry is shown, nothing else is refreshed.
+        """
+        self.log_viewer.append_entry(entry)
 
     def handle_expression_added_or_changed(self, index, expression):
         """Handle when an expression is added, or an existing one is changed.
@@ -1002,3 +1201,5 @@ class Pugdebug(QObject):
         """Run the application!
         """
         self.main_window.show()
+
+        self.watchdog.start()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import gzip
+import itertools
+import os
+import struct
+import threading
+import time
+
+# Directions of recorded messages
+SENT = b'>'
+RECEIVED = b'<'
+
+
+class PugdebugSessionRecorder():
+    """Record a debugging session to a file
+
+    Every command sent to the debugger engine and every frame received
+    from it is written to the file, with the time it was sent or received
+    at, relative to the start of the recording.
+
+    The file is gzip compressed. It starts with a magic header, followed
+    by a record per message: the direction, the time as a double, the
+    length of the message and the message itself.
+    """
+
+    magic = b'PUGDBGP1'
+
+    record_header = struct.Struct('<cdI')
+
+    file = None
+
+    start_time = 0
+
+    def __init__(self, path):
+        self.file = gzip.open(path, 'wb')
+        self.file.write(self.magic)
+
+        self.start_time = time.monotonic()
+
+        # The writes of the worker and the server threads are not mixed
+        self.lock = threading.Lock()
+
+        # Received data that is not a complete frame yet
+        self.received = bytearray()
+
+    def record_sent(self, data):
+        """Record the commands sent to the debugger engine
+
+        The data can hold several commands, each terminated
+        by a null byte.
+        """
+        for command in data.split(b'\0')[:-1]:
+            self.write(SENT, command)
+
+    def record_received(self, data):
+        """Record the data received from the debugger engine
+
+        Frames are written once they are received in whole.
+        """
+        self.received += data
+
+        while True:
+            null = self.received.find(b'\0')
+
+            if null == -1:
+                return
+
+            length = bytes(self.received[:null])
+
+            # Let the frame reader deal with a malformed message
+            if not length.isdigit():
+                self.received = bytearray()
+                return
+
+            body_end = null + 1 + int(length)
+
+            if len(self.received) <= body_end:
+                return
+
+            self.write(RECEIVED, bytes(self.received[null + 1:body_end]))
+
+            del self.received[:body_end + 1]
+
+    def write(self, direction, message):
+        with self.lock:
+            if self.file is None:
+                return
+
+            self.file.write(self.record_header.pack(
+                direction,
+                time.monotonic() - self.start_time,
+                len(message)
+            ))
+            self.file.write(message)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class PugdebugRecordingSocket():
+    """A socket that records the data going through it
+
+    Everything else is passed on to the wrapped socket.
+    """
+
+    socket = None
+
+    recorder = None
+
+    def __init__(self, socket, recorder):
+        self.socket = socket
+        self.recorder = recorder
+
+    def sendall(self, data):
+        self.socket.sendall(data)
+        self.recorder.record_sent(data)
+
+    def recv_into(self, buffer, nbytes=0):
+        received = self.socket.recv_into(buffer, nbytes)
+        self.recorder.record_received(buffer[:received])
+
+        return received
+
+    def close(self):
+        self.socket.close()
+        self.recorder.close()
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+# Numbers the recordings made within the same second
+recording_number = itertools.count(1)
+
+
+def get_recording_path(directory):
+    """Get the path of a new recording in the given directory"""
+    name = 'session-%s-%d.dbgp.gz' % (
+        time.strftime('%Y%m%d-%H%M%S'),
+        next(recording_number)
+    )
+
+    return os.path.join(directory, name)
+
+
+def read_recording(path):
+    """Read a recorded session
+
+    Returns a list of (direction, time, message) tuples.
+    """
+    records = []
+
+    header = PugdebugSessionRecorder.record_header
+
+    with gzip.open(path, 'rb') as file:
+        magic = file.read(len(PugdebugSessionRecorder.magic))
+
+        if magic != PugdebugSessionRecorder.magic:
+            raise ValueError('%s is not a recorded session' % path)
+
+        while True:
+            data = file.read(header.size)
+
+            if len(data) < header.size:
+                return records
+
+            direction, timestamp, length = header.unpack(data)
+
+            records.append((direction, timestamp, file.read(length)))
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+
+    Play a recorded debugging session back to pugdebug, as if it was
+    the debugger engine:
+
+        python -m pugdebug.replay session.dbgp.gz --port 9000
+"""
+
+__author__ = "robertbasic"
+
+import argparse
+import re
+import socket
+import time
+
+from collections import deque
+
+from pugdebug.message_parser import PugdebugMessageParser
+from pugdebug.recorder import SENT, read_recording
+
+transaction_id_argument = re.compile(rb' -i \d+')
+transaction_id_pattern = re.compile(rb' -i (\d+)')
+transaction_id_attribute = re.compile(rb'transaction_id="\d+"')
+
+
+def get_command_name(command):
+    return command.split(b' ', 1)[0]
+
+
+def get_command_key(command):
+    """The command without it's transaction id"""
+    return transaction_id_argument.sub(b'', command, 1)
+
+
+def frame(message):
+    return str(len(message)).encode() + b'\0' + message + b'\0'
+
+
+class PugdebugRecordedExchange():
+    """A recorded command and the messages the engine responded with
+
+    The messages are the response to the command and all the stream and
+    notify messages received between the command and it's response.
+    """
+
+    command = None
+
+    # How long it took the engine to respond
+    latency = 0
+
+    def __init__(self, command, latency, messages):
+        self.command = command
+        self.latency = latency
+        self.messages = messages
+
+    def get_messages(self, transaction_id):
+        """Get the messages with the response for the given transaction id
+        """
+        return [transaction_id_attribute.sub(
+            b'transaction_id="%d"' % transaction_id,
+            message,
+            1
+        ) for message in self.messages]
+
+
+class PugdebugSessionReplay():
+    """Play a recorded session back as a fake debugger engine
+
+    Connects to pugdebug like xdebug does and sends the recorded init
+    message. Every command pugdebug sends is answered with the recorded
+    response to the same command, with the transaction id replaced.
+
+    Commands are matched to the recorded ones with the same arguments
+    first, then with the same name, in the order they were recorded.
+    Commands that were not recorded are answered with an error. The
+    recorded response times are kept, scaled by the given speed.
+    """
+
+    parser = None
+
+    init_message = None
+
+    speed = 1.0
+
+    def __init__(self, records, speed=1.0):
+        self.parser = PugdebugMessageParser()
+        self.speed = speed
+
+        self.init_message = None
+
+        # Recorded exchanges, by the command name
+        self.exchanges = {}
+
+        self.__load(records)
+
+    def replay(self, host='127.0.0.1', port=9000):
+        """Connect to pugdebug and answer it's commands until it hangs up
+        """
+        sock = socket.create_connection((host, port))
+
+        try:
+            sock.sendall(frame(self.init_message))
+            self.__answer_commands(sock)
+        finally:
+            sock.close()
+
+    def get_exchange(self, command):
+        """Take the recorded exchange to answer the command with
+        """
+        exchanges = self.exchanges.get(get_command_name(command))
+
+        if not exchanges:
+            return None
+
+        key = get_command_key(command)
+
+        for exchange in exchanges:
+            if get_command_key(exchange.command) == key:
+                exchanges.remove(exchange)
+                return exchange
+
+        return exchanges.popleft()
+
+    def respond(self, sock, command):
+        name, transaction_id = self.__parse_command(command)
+
+        exchange = self.get_exchange(command)
+
+        if exchange is None:
+            message = ('<?xml version="1.0" encoding="iso-8859-1"?>'
+                       '<response xmlns="urn:debugger_protocol_v1" '
+                       'command="%s" transaction_id="%d">'
+                       '<error code="4"><message>'
+                       '<![CDATA[Not in the recording]]></message></error>'
+                       '</response>') % (name.decode(), transaction_id)
+            sock.sendall(frame(message.encode()))
+            return
+
+        if self.speed > 0:
+            time.sleep(exchange.latency / self.speed)
+
+        sock.sendall(b''.join(
+            frame(message)
+            for message in exchange.get_messages(transaction_id)
+        ))
+
+    def __answer_commands(self, sock):
+        data = b''
+
+        while True:
+            chunk = sock.recv(65536)
+
+            if not chunk:
+                return
+
+            data += chunk
+
+            *commands, data = data.split(b'\0')
+
+            for command in commands:
+                self.respond(sock, command)
+
+    def __parse_command(self, command):
+        match = transaction_id_pattern.search(command)
+        transaction_id = int(match.group(1)) if match else 0
+
+        return get_command_name(command), transaction_id
+
+    def __load(self, records):
+        """Pair the recorded commands with their responses
+        """
+        commands = {}
+        messages = []
+
+        for direction, timestamp, message in records:
+            if direction == SENT:
+                name, transaction_id = self.__parse_command(message)
+                commands[transaction_id] = (message, timestamp)
+                continue
+
+            if self.init_message is None:
+                self.init_message = message
+                continue
+
+            messages.append(message)
+
+            transaction_id = self.parser.parse_transaction_id(message)
+
+            if transaction_id not in commands:
+                continue
+
+            command, sent_at = commands.pop(transaction_id)
+
+            exchange = PugdebugRecordedExchange(
+                command,
+                max(0, timestamp - sent_at),
+                messages
+            )
+            messages = []
+
+            self.exchanges.setdefault(
+                get_command_name(command),
+                deque()
+            ).append(exchange)
+
+        if self.init_message is None:
+            raise ValueError('The recording has no init message')
+
+
+def main():
+    arguments = argparse.ArgumentParser(
+        description='Play a recorded debugging session back to pugdebug'
+    )
+    arguments.add_argument('recording')
+    arguments.add_argument('--host', default='127.0.0.1')
+    arguments.add_argument('--port', type=int, default=9000)
+    arguments.add_argument('--speed', type=float, default=1.0,
+                           help='speed up the recorded response times, '
+                                '0 to respond right away')
+    options = arguments.parse_args()
+
+    replay = PugdebugSessionReplay(
+        read_recording(options.recording),
+        options.speed
+    )
+    replay.replay(options.host, options.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,21 +9,72 @@
 
 __author__ = "robertbasic"
 
-from base64 import b64encode
+import itertools
+import logging
+import math
+import queue
+import selectors
 import socket
+import threading
+import time
 
-from PyQt5.QtCore import (QObject, QThread, QThreadPool, QRunnable,
-                          QMutex, pyqtSignal)
+from xml.etree.ElementTree import ParseError
 
+from PyQt5.QtCore import QObject, QThread, QMutex, pyqtSignal
+
+from pugdebug.frame_reader import PugdebugFrameReader
 from pugdebug.message_parser import PugdebugMessageParser
+from pugdebug.pipeline import PugdebugCommandPipeline
+from pugdebug.proxy import (register_with_proxy, unregister_from_proxy,
+                            parse_proxy_address)
+from pugdebug.recorder import (PugdebugSessionRecorder,
+                               PugdebugRecordingSocket, get_recording_path)
+from pugdebug.models.breakpoints import (get_breakpoint_arguments,
+                                         get_breakpoint_location,
+                                         is_line_breakpoint, is_logpoint,
+                                         get_log_expressions,
+                                         format_log_entry)
+from pugdebug.models.connection_rules import (get_connection_rules,
+                                              match_connection_rules)
 from pugdebug.models.settings import get_setting
+from pugdebug.models.timings import get_timings
+from pugdebug.models.variables import (get_variable_value, is_true,
+                                       is_same_value)
 
 
 class PugdebugServer(QThread):
+    """Listen to new connections from xdebug
+
+    The server waits on all the listening sockets with a selector, so a
+    connection is accepted the moment it arrives, and it can listen on
+    multiple host/port pairs at the same time, one for every project.
+
+    Stopping the server wakes up the selector through a socket pair, so
+    the server stops right away.
+
+    The handshake with a new connection, reading the init message and
+    loading the typemap, is done on the same selector, for all the new
+    connections at the same time. A slow or stalled connection doesn't
+    block other connections from being accepted, and it is dropped if
+    the handshake is not done before a deadline. Only connections with
+    a finished handshake are passed on to the debugger.
+    """
+
     mutex = None
 
     wait_for_accept = True
 
+    addresses = []
+
+    selector = None
+
+    # Handshakes in progress, keyed by the socket of the connection
+    handshakes = {}
+
+    # A socket pair used to wake up the selector when stopping
+    wakeup_reader = None
+    wakeup_writer = None
+
     new_connection_established_signal = pyqtSignal(object)
     server_stopped_signal = pyqtSignal()
 
@@ -34,37 +85,124 @@ class PugdebugServer(QThread):
 
         self.mutex = QMutex()
 
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+
     def run(self):
         self.mutex.lock()
 
-        socket_server = self.__connect()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+
+        socket_servers = []
 
-        if socket_server is not None:
-            self.__listen(socket_server)
+        for address in self.addresses:
+            socket_server = self.__connect(address)
+
+            if socket_server is not None:
+                socket_servers.append(socket_server)
+
+        if len(socket_servers) > 0:
+            registered = self.__register_with_proxy(socket_servers)
+
+            self.__listen(socket_servers)
+
+            if registered:
+                self.__unregister_from_proxy()
+
+        self.selector.close()
+        self.selector = None
 
         self.mutex.unlock()
 
-    def start_listening(self):
+    def start_listening(self, addresses=None):
+        """Start listening to new connections
+
+        Addresses is a list of (host, port) pairs to listen on. By default
+        listens on the host and port from the settings.
+        """
+        if addresses is None:
+            addresses = [(get_setting('debugger/host'),
+                          int(get_setting('debugger/port_number')))]
+
+        self.addresses = addresses
+
+        self.__drain_wakeup()
+
         self.wait_for_accept = True
         self.start()
 
     def stop_listening(self):
         self.wait_for_accept = False
 
-    def __connect(self):
-        """Connect to the socket server
+        try:
+            self.wakeup_writer.send(b'\0')
+        except OSError:
+            pass
+
+    def __connect(self, address):
+        """Create a listening socket server on the address
         """
+        host, port_number = address
+
+        socket_server = None
+
         try:
             socket_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             socket_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            socket_server.settimeout(1)
+            socket_server.setblocking(False)
+            socket_server.bind((host, port_number))
+            socket_server.listen(int(get_setting('debugger/backlog')))
         except OSError as e:
+            if socket_server is not None:
+                socket_server.close()
             socket_server = None
-            self.server_error_signal.emit(e.strerror)
+            self.server_error_signal.emit(
+                '%s (%s:%d)' % (e.strerror, host, port_number)
+            )
 
         return socket_server
 
-    def __listen(self, socket_server):
+    def __register_with_proxy(self, socket_servers):
+        """Register the first listening port with the DBGp proxy, if one
+        is set
+
+        The proxy then passes the connections with our IDE key on to us.
+        A proxy keeps one registration per IDE key, so only one port is
+        registered, the one of the host and port from the settings, unless
+        that one couldn't be listened on.
+        """
+        proxy = get_setting('debugger/proxy')
+
+        if not proxy:
+            return False
+
+        try:
+            register_with_proxy(
+                parse_proxy_address(proxy),
+                socket_servers[0].getsockname()[1],
+                get_setting('debugger/idekey')
+            )
+        except (OSError, ValueError, ParseError) as e:
+            self.server_error_signal.emit(
+                '%s (registering with the DBGp proxy %s)' % (e, proxy)
+            )
+            return False
+
+        return True
+
+    def __unregister_from_proxy(self):
+        proxy = get_setting('debugger/proxy')
+
+        try:
+            unregister_from_proxy(
+                parse_proxy_address(proxy),
+                get_setting('debugger/idekey')
+            )
+        except (OSError, ValueError, ParseError):
+            pass
+
+    def __listen(self, socket_servers):
         """Listen to new incomming connections
 
         For every accepted connection, see if it is valid and emit a signal
@@ -72,117 +210,436 @@ class PugdebugServer(QThread):
 
         Otherwise silently disregard that connection.
         """
-        host = get_setting('debugger/host')
-        port_number = int(get_setting('debugger/port_number'))
+        for socket_server in socket_servers:
+            self.selector.register(socket_server, selectors.EVENT_READ)
 
-        try:
-            socket_server.bind((host, port_number))
-            socket_server.listen(5)
+        self.handshakes = {}
 
+        try:
             while self.wait_for_accept:
-                try:
-                    sock, address = socket_server.accept()
-                    sock.settimeout(None)
-
-                    if sock is not None:
-                        connection = PugdebugServerConnection(sock)
-
-                        try:
-                            is_valid = connection.init_connection()
-                        except OSError as e:
-                            # in case the debugged program closes
-                            # the connection
-                            is_valid = False
-                            self.server_error_signal.emit(
-                                '%s (during connection initialization)' % e.strerror
-                            )
-
-                        if is_valid and self.wait_for_accept:
-                            self.new_connection_established_signal.emit(
-                                connection
-                            )
-                        else:
-                            connection.disconnect()
-                except socket.timeout:
-                    pass
-
+                events = self.selector.select(self.__get_select_timeout())
+
+                for key, mask in events:
+                    if key.fileobj is self.wakeup_reader:
+                        self.__drain_wakeup()
+                    elif not self.wait_for_accept:
+                        break
+                    elif key.data is not None:
+                        self.__continue_handshake(key.data)
+                    else:
+                        self.__accept(key.fileobj)
+
+                self.__expire_handshakes()
         except OSError as e:
             self.server_error_signal.emit(e.strerror)
         finally:
-            socket_server.close()
+            for socket_server in socket_servers:
+                self.selector.unregister(socket_server)
+                socket_server.close()
+
+            for handshake in list(self.handshakes.values()):
+                self.__drop_handshake(handshake)
 
         if not self.wait_for_accept:
             self.server_stopped_signal.emit()
 
+    def __accept(self, socket_server):
+        """Accept all the pending connections
+
+        Start the handshake with every new connection.
+        """
+        timeout = int(get_setting('debugger/handshake_timeout'))
+        rules = get_connection_rules()
+
+        while True:
+            try:
+                sock, address = socket_server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+
+            sock.setblocking(False)
+
+            handshake = PugdebugConnectionHandshake(
+                PugdebugServerConnection(sock),
+                timeout,
+                rules
+            )
+
+            # The connection can wrap the socket to record the session
+            sock = handshake.connection.socket
+
+            self.handshakes[sock] = handshake
+            self.selector.register(sock, selectors.EVENT_READ, handshake)
+
+    def __continue_handshake(self, handshake):
+        """Continue the handshake with a new connection
+
+        Once the handshake is done, emit a signal with that new connection.
+        If the connection is not valid, silently disregard it.
+        """
+        try:
+            is_done = handshake.proceed()
+        except (OSError, ParseError) as e:
+            # in case the debugged program closes
+            # the connection, or sends garbage
+            self.__drop_handshake(handshake)
+
+            # A script that is let go to run can end any way it likes
+            if handshake.running is not None:
+                return
+
+            self.server_error_signal.emit(
+                '%s (during connection initialization)' % (
+                    getattr(e, 'strerror', None) or e
+                )
+            )
+            return
+
+        if is_done is None:
+            return
+
+        self.__remove_handshake(handshake)
+
+        if is_done:
+            handshake.connection.socket.setblocking(True)
+            self.new_connection_established_signal.emit(handshake.connection)
+        else:
+            handshake.connection.disconnect()
+
+    def __expire_handshakes(self):
+        now = time.monotonic()
+
+        for handshake in list(self.handshakes.values()):
+            if handshake.deadline <= now:
+                self.__drop_handshake(handshake)
+                self.server_error_signal.emit(
+                    'Connection initialization timed out'
+                )
+
+    def __get_select_timeout(self):
+        """Wait for events until the earliest handshake deadline
+        """
+        deadlines = [handshake.deadline
+                     for handshake in self.handshakes.values()
+                     if handshake.deadline != math.inf]
+
+        if len(deadlines) == 0:
+            return None
+
+        return max(0, min(deadlines) - time.monotonic())
+
+    def __remove_handshake(self, handshake):
+        sock = handshake.connection.socket
+        self.selector.unregister(sock)
+        self.handshakes.pop(sock, None)
+
+    def __drop_handshake(self, handshake):
+        self.__remove_handshake(handshake)
+        handshake.connection.disconnect()
+
+    def __drain_wakeup(self):
+        try:
+            while self.wakeup_reader.recv(1024):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+
+class PugdebugConnectionHandshake():
+    """The handshake with a new connection
+
+    Read the init message, decide should the connection be accepted,
+    then request and read the typemap. The socket of the connection is
+    non-blocking during the handshake, every step reads only what is
+    available.
 
-class PugdebugAsyncTask(QRunnable):
-    def __init__(self, connection, action, data):
-        super(PugdebugAsyncTask, self).__init__()
+    Connections matching a connection rule are let go during the
+    handshake, they are run to the end or detached from, and never reach
+    the debugger. If a rule needs the request URI, it is evaluated
+    together with reading the typemap.
+    """
 
+    connection = None
+
+    deadline = 0
+
+    typemap = None
+
+    # Attributes of the init message and the request URI to match
+    # the connection rules against
+    attributes = None
+
+    request_uri = None
+
+    # Future of the run command of a connection that is let go to run
+    running = None
+
+    def __init__(self, connection, timeout, rules=None):
         self.connection = connection
-        self.action = action
-        self.data = data
+        self.deadline = time.monotonic() + timeout
+        self.rules = rules or []
+
+        self.typemap = None
+        self.attributes = None
+        self.request_uri = None
+        self.running = None
+
+    def proceed(self):
+        """Read the available data and continue the handshake
+
+        Returns None while the handshake is in progress, True when it is
+        done and False when the connection is not meant for us.
+        """
+        connection = self.connection
+
+        try:
+            connection.frame_reader.receive()
+        except (BlockingIOError, InterruptedError):
+            return None
+
+        message = connection.frame_reader.pop_frame()
+
+        while message is not None:
+            if self.typemap is None:
+                if not connection.init_connection(message):
+                    return False
+
+                self.attributes = connection.parser.parse_init_attributes(
+                    message
+                )
+
+                self.typemap = connection.pipeline.queue(
+                    'typemap_get',
+                    callback=connection.parser.parse_typemap_message
+                )
+
+                if any(rule.needs_request_uri() for rule in self.rules):
+                    self.request_uri = connection.pipeline.queue(
+                        'eval',
+                        data="$_SERVER['REQUEST_URI']",
+                        callback=connection.parser.parse_eval_message
+                    )
+
+                connection.pipeline.flush()
+            else:
+                connection.pipeline.dispatch(message)
+
+                if self.running is not None:
+                    if self.running.done():
+                        return False
+                elif self.is_ready():
+                    return self.finish()
+
+            message = connection.frame_reader.pop_frame()
+
+        return None
+
+    def is_ready(self):
+        return (self.typemap.done() and
+                (self.request_uri is None or self.request_uri.done()))
+
+    def finish(self):
+        """Accept the connection, or let it go if it matches a rule
+        """
+        connection = self.connection
+
+        if self.request_uri is not None:
+            self.attributes['request_uri'] = self.get_request_uri()
+
+        action = match_connection_rules(self.rules, self.attributes)
+
+        if action is None:
+            connection.parser.set_typemap(self.typemap.result())
+            return True
+
+        logging.debug("Connection rule %s for %s" % (
+            action, self.attributes.get('fileuri')
+        ))
+
+        future = connection.pipeline.queue(action)
+        connection.pipeline.flush()
+
+        if action == 'detach':
+            return False
+
+        # Keep reading until the script ends, without a deadline
+        self.running = future
+        self.deadline = math.inf
+
+        return None
+
+    def get_request_uri(self):
+        result = self.request_uri.result()
+
+        # There is no request URI for command line scripts
+        if result.get('type') in ['error', 'null', 'uninitialized']:
+            return ''
+
+        return get_variable_value(result) or ''
+
+
+class PugdebugConnectionWorker(threading.Thread):
+    """Perform the actions of a connection, one at a time
+
+    Every connection has it's own worker, so actions on a connection are
+    never performed in parallel and no thread is blocked waiting for
+    another action to finish.
+
+    Actions are taken from a priority queue. Actions with a lower priority
+    number are performed first, actions with the same priority are
+    performed in the order they were started.
+    """
+
+    def __init__(self, connection):
+        super(PugdebugConnectionWorker, self).__init__(daemon=True)
+
+        self.connection = connection
+
+        self.queue = queue.PriorityQueue()
+
+        # Keeps the order of actions with the same priority
+        self.sequence = itertools.count()
+
+    def put(self, priority, action, data=None):
+        self.queue.put((priority, next(self.sequence), action, data))
+
+    def stop(self):
+        """Stop the worker before any other queued action
+        """
+        self.put(-1, None)
 
     def run(self):
-        self.connection.perform(self.action, self.data)
+        while True:
+            priority, sequence, action, data = self.queue.get()
+
+            if action is None:
+                return
+
+            self.connection.perform(action, data)
 
 
 class PugdebugServerConnection(QObject):
 
+    # Action priorities, actions with a lower number are performed first.
+    # Stop and detach jump ahead of everything, user initiated commands
+    # jump ahead of refreshes done in the background.
+    PRIORITY_STOP = 0
+    PRIORITY_COMMAND = 1
+    PRIORITY_BACKGROUND = 2
+
+    action_priorities = {
+        'stop': PRIORITY_STOP,
+        'detach': PRIORITY_STOP,
+        'dismiss': PRIORITY_STOP,
+        'post_step': PRIORITY_BACKGROUND,
+        'evaluate_expression': PRIORITY_BACKGROUND
+    }
+
     socket = None
 
-    mutex = None
+    worker = None
 
     parser = None
 
+    frame_reader = None
+
+    pipeline = None
+
     is_valid = False
     init_message = None
 
-    transaction_id = 0
+    variable_contexts = None
+
+    # Generation of the latest started step
+    step_generation = 0
+
+    # Expressions evaluated when the state is fetched after a step
+    expressions = []
+
+    # Future of the continuation command the engine is running,
+    # None when the engine is not running
+    continuation = None
+
+    # Commands that can take as long as the script runs, without a timeout
+    continuation_commands = ['run', 'step_into', 'step_over', 'step_out']
+
+    # Is the worker stepping on it's own, and was it told to stop
+    auto_stepping = False
+    auto_step_interrupted = False
 
-    xdebug_encoding = 'iso-8859-1'
+    # Log messages of the logpoints, by their filename and line number
+    logpoints = None
+
+    # Filenames and line numbers of the breakpoints, by their engine id
+    breakpoint_locations = None
 
     post_start_signal = pyqtSignal()
     stopped_signal = pyqtSignal()
     detached_signal = pyqtSignal()
     stepped_signal = pyqtSignal(dict)
-    got_variables_signal = pyqtSignal(object)
-    got_stacktraces_signal = pyqtSignal(object)
-    set_breakpoint_signal = pyqtSignal(bool)
+    stepped_and_fetched_signal = pyqtSignal(dict)
+    got_variables_signal = pyqtSignal(object, int)
+    got_stacktraces_signal = pyqtSignal(object, int)
+    set_breakpoint_signal = pyqtSignal(object)
     removed_breakpoint_signal = pyqtSignal(object)
+    remove_breakpoint_failed_signal = pyqtSignal(int)
     listed_breakpoints_signal = pyqtSignal(list)
     expression_evaluated_signal = pyqtSignal(int, dict)
-    expressions_evaluated_signal = pyqtSignal(list)
+    expressions_evaluated_signal = pyqtSignal(list, int)
+    logged_signal = pyqtSignal(str)
 
     connection_error_signal = pyqtSignal(str, str)
 
     def __init__(self, socket):
         super(PugdebugServerConnection, self).__init__()
 
+        recordings_dir = get_setting('debugger/recordings_dir')
+
+        if recordings_dir:
+            # A session that can't be recorded is still debugged
+            try:
+                recorder = PugdebugSessionRecorder(
+                    get_recording_path(recordings_dir)
+                )
+            except OSError as e:
+                logging.warning("Not recording the session: %s" % e)
+            else:
+                socket = PugdebugRecordingSocket(socket, recorder)
+
         self.socket = socket
 
-        self.mutex = QMutex()
+        self.logpoints = {}
+        self.breakpoint_locations = {}
 
         self.parser = PugdebugMessageParser()
 
-    def init_connection(self):
+        self.frame_reader = PugdebugFrameReader(socket)
+
+        self.pipeline = PugdebugCommandPipeline(
+            socket,
+            self.frame_reader,
+            self.parser,
+            get_timings()
+        )
+
+    def init_connection(self, response=None):
         """Init a new connection
 
         Read in the init message from xdebug and decide based on the
         idekey should this connection be accepted or not.
 
-        Do note that it is not needed to call it from a new thread, as
-        it is already called from a thread separate from the main application
-        thread and thus should not block the main thread.
+        The server reads the init message as part of the non-blocking
+        handshake and passes it in. Otherwise it is read from the socket.
         """
         idekey = get_setting('debugger/idekey')
 
-        response = self.__receive_message()
+        if response is None:
+            response = self.__receive_message()
 
         init_message = self.parser.parse_init_message(response)
 
         # See if the init message from xdebug is meant for us
-        if idekey != '' and init_message['idekey'] != idekey:
+        if idekey != '' and init_message.get('idekey') != idekey:
             return False
 
         self.init_message = init_message
@@ -190,13 +647,22 @@ class PugdebugServerConnection(QObject):
         return True
 
     def start(self, action, data=None):
-        QThreadPool.globalInstance().start(
-            PugdebugAsyncTask(self, action, data)
-        )
+        """Queue an action on the connection's worker
+        """
+        if self.worker is None:
+            self.worker = PugdebugConnectionWorker(self)
+            self.worker.start()
 
-    def perform(self, action, data):
-        self.mutex.lock()
+        priority = self.action_priorities.get(action, self.PRIORITY_COMMAND)
+
+        # Any command of the user interrupts auto stepping, so it can be
+        # performed
+        if self.auto_stepping and priority < self.PRIORITY_BACKGROUND:
+            self.auto_step_interrupted = True
+
+        self.worker.put(priority, action, data)
 
+    def perform(self, action, data):
         try:
             if action == 'post_start':
                 response = self.__post_start(data)
@@ -211,32 +677,65 @@ class PugdebugServerConnection(QObject):
             elif action == 'detach':
                 response = self.__detach()
                 self.detached_signal.emit()
+            elif action == 'dismiss':
+                self.__detach()
+                self.disconnect()
             elif action == 'step_run':
                 response = self.__step_run()
-                self.stepped_signal.emit(response)
+                self.__handle_step_response(response, data)
             elif action == 'step_into':
                 response = self.__step_into()
-                self.stepped_signal.emit(response)
+                self.__handle_step_response(response, data)
             elif action == 'step_over':
                 response = self.__step_over()
-                self.stepped_signal.emit(response)
+                self.__handle_step_response(response, data)
             elif action == 'step_out':
                 response = self.__step_out()
-                self.stepped_signal.emit(response)
+                self.__handle_step_response(response, data)
+            elif action == 'run_to':
+                response = self.__run_to(data['breakpoint'])
+                self.__handle_step_response(response, data)
+            elif action == 'auto_step':
+                response = self.__auto_step(data['auto_step'])
+                self.__handle_step_response(response, data)
             elif action == 'post_step':
-                response = self.__post_step(data)
+                generation = data.get('generation', self.step_generation)
 
-                self.got_variables_signal.emit(response['variables'])
-                self.got_stacktraces_signal.emit(response['stacktraces'])
+                # A newer step is queued or done, the state would be stale
+                if self.is_stale(generation):
+                    return
+
+                try:
+                    response = self.__post_step(data)
+                except TimeoutError as error:
+                    self.__log_refresh_error(error)
+                    return
+
+                if self.is_stale(generation):
+                    return
+
+                self.got_variables_signal.emit(
+                    response['variables'],
+                    generation
+                )
+                self.got_stacktraces_signal.emit(
+                    response['stacktraces'],
+                    generation
+                )
                 self.expressions_evaluated_signal.emit(
-                    response['expressions']
+                    response['expressions'],
+                    generation
                 )
             elif action == 'breakpoint_set':
                 response = self.__set_breakpoint(data)
                 self.set_breakpoint_signal.emit(response)
             elif action == 'breakpoint_remove':
                 response = self.__remove_breakpoint(data)
-                self.removed_breakpoint_signal.emit(response)
+
+                if response is False:
+                    self.remove_breakpoint_failed_signal.emit(data)
+                else:
+                    self.removed_breakpoint_signal.emit(response)
             elif action == 'breakpoint_list':
                 response = self.__list_breakpoints()
                 self.listed_breakpoints_signal.emit(response)
@@ -246,13 +745,17 @@ class PugdebugServerConnection(QObject):
                 self.expression_evaluated_signal.emit(index, response)
             elif action == 'set_debugger_features':
                 self.__set_debugger_features()
-        except OSError as error:
+        except (OSError, ParseError) as error:
             self.disconnect()
-            self.connection_error_signal.emit(action, error.strerror)
-
-        self.mutex.unlock()
+            self.connection_error_signal.emit(
+                action,
+                getattr(error, 'strerror', None) or str(error)
+            )
 
     def disconnect(self):
+        if self.worker is not None:
+            self.worker.stop()
+
         if self.socket is not None:
             self.socket.close()
 
@@ -265,17 +768,114 @@ class PugdebugServerConnection(QObject):
     def detach(self):
         self.start('detach')
 
+    def dismiss(self):
+        """Detach from the connection and disconnect, without signals
+
+        Used for connections that are never debugged.
+        """
+        self.start('dismiss')
+
     def step_run(self):
-        self.start('step_run')
+        self.start_step('step_run')
 
     def step_into(self):
-        self.start('step_into')
+        self.start_step('step_into')
 
     def step_over(self):
-        self.start('step_over')
+        self.start_step('step_over')
 
     def step_out(self):
-        self.start('step_out')
+        self.start_step('step_out')
+
+    def run_to(self, filename, line_number):
+        """Run the script to a line, with a temporary breakpoint on it"""
+        self.start_step('run_to', {
+            'breakpoint': {
+                'filename': filename,
+                'lineno': line_number,
+                'temporary': True
+            }
+        })
+
+    def pause(self):
+        """Break into the script while the engine is running it
+
+        Sends `break` right away, from the calling thread, as the worker is
+        busy waiting for the response of the continuation command. The
+        engine then responds to the continuation command, breaking on the
+        line it got to.
+
+        Pausing while auto stepping stops the auto stepping after the step
+        that is being done.
+
+        Returns False if the engine is not running.
+        """
+        if self.auto_stepping:
+            self.auto_step_interrupted = True
+            return True
+
+        continuation = self.continuation
+
+        if continuation is None or continuation.done():
+            return False
+
+        try:
+            self.pipeline.interrupt('break')
+        except OSError:
+            return False
+
+        return True
+
+    def get_command_timeout(self, command):
+        """Seconds to wait for the response to the command
+
+        Continuation commands can run for as long as the script does, so
+        they don't time out, but they can be paused.
+        """
+        if command in self.continuation_commands:
+            return None
+
+        if command == 'eval':
+            return int(get_setting('debugger/eval_timeout'))
+
+        return int(get_setting('debugger/command_timeout'))
+
+    def auto_step(self, options):
+        """Step until a condition is true or a watched value changes
+
+        The options are the step `command`, `step_over` or `step_into`,
+        the largest `count` of steps, 0 for no limit, and either a
+        `condition` to stop on once it is true, or a `watch` expression to
+        stop on once it's value changes.
+        """
+        self.start_step('auto_step', {'auto_step': options})
+
+    def start_step(self, action, data=None):
+        """Start a step command with a new step generation
+
+        Every step gets a new generation number. Refreshes for older
+        generations are skipped, or their results are discarded, as the
+        state they show is already stale.
+        """
+        self.step_generation += 1
+
+        data = dict(
+            data or {},
+            generation=self.step_generation,
+            fetch_state=int(get_setting('debugger/fetch_state')) != 0
+        )
+
+        self.start(action, data)
+
+    def set_expressions(self, expressions):
+        """Set the expressions to evaluate when fetching state after a step
+        """
+        self.expressions = list(expressions)
+
+    def is_stale(self, generation):
+        """Is the generation older than the latest started step
+        """
+        return generation < self.step_generation
 
     def post_step_command(self, post_step_data):
         self.start('post_step', post_step_data)
@@ -295,232 +895,546 @@ class PugdebugServerConnection(QObject):
     def set_debugger_features(self):
         self.start('set_debugger_features')
 
-    def load_typemap(self):
-        command = 'typemap_get -i %d' % self.__get_transaction_id()
-        response = self.__send_command(command)
-        self.parser.set_typemap(self.parser.parse_typemap_message(response))
+    def __post_start(self, data):
+        """Set the initial breakpoints and debugger features
 
-        return True
+        All the commands are sent in one batch.
+        """
+        self.set_expressions(data.get('expressions', []))
+
+        breakpoints = self.__queue_set_breakpoints(data['breakpoints'])
+        debugger_features = self.__queue_set_debugger_features()
+        listed_breakpoints = self.pipeline.queue(
+            'breakpoint_list',
+            callback=self.parser.parse_breakpoint_list_message,
+            timeout=self.get_command_timeout('breakpoint_list')
+        )
 
-    def __post_start(self, data):
-        self.__set_breakpoints(data['breakpoints'])
+        self.pipeline.wait(
+            breakpoints + debugger_features + [listed_breakpoints]
+        )
 
         post_start_response = {
-            'debugger_features': self.__set_debugger_features(),
-            'breakpoints': self.__list_breakpoints()
+            'debugger_features': True,
+            'breakpoints': self.__track_breakpoints(
+                listed_breakpoints.result()
+            )
         }
 
         return post_start_response
 
     def __stop(self):
-        command = 'stop -i %d' % self.__get_transaction_id()
-        self.__send_command(command)
+        self.pipeline.execute(
+            'stop',
+            timeout=self.get_command_timeout('stop')
+        )
 
         return True
 
     def __detach(self):
-        command = 'detach -i %d' % self.__get_transaction_id()
-        self.__send_command(command)
+        self.pipeline.execute(
+            'detach',
+            timeout=self.get_command_timeout('detach')
+        )
 
         return True
 
     def __step_run(self):
-        command = 'run -i %d' % self.__get_transaction_id()
-        return self.__do_step_command(command)
+        return self.__do_step_command('run')
 
     def __step_into(self):
-        command = 'step_into -i %d' % self.__get_transaction_id()
-        return self.__do_step_command(command)
+        return self.__do_step_command('step_into')
 
     def __step_over(self):
-        command = 'step_over -i %d' % self.__get_transaction_id()
-        return self.__do_step_command(command)
+        return self.__do_step_command('step_over')
 
     def __step_out(self):
-        command = 'step_out -i %d' % self.__get_transaction_id()
-        return self.__do_step_command(command)
+        return self.__do_step_command('step_out')
 
     def __do_step_command(self, command):
-        response = self.__send_command(command)
+        """Do a step command
 
-        response = self.parser.parse_continuation_message(response)
+        When the engine breaks on a logpoint while running, the logpoint's
+        message is logged and the script runs on, the GUI doesn't get to
+        see the break at all. A step that breaks on a logpoint logs it's
+        message and stops there, as that may be where the step ends.
+        """
+        while True:
+            response = self.__do_continuation_command(command)
 
-        return response
+            message = self.__get_logpoint_message(response)
 
-    def __post_step(self, data):
-        post_step_response = {
-            'variables': self.__get_variables(),
-            'stacktraces': self.__get_stacktraces(),
-            'expressions': self.__evaluate_expressions(data['expressions'])
-        }
+            if message is None:
+                return response
 
-        return post_step_response
+            self.__log(message, response)
+
+            if command != 'run':
+                return response
+
+    def __run_to(self, breakpoint):
+        """Run to the line of a temporary breakpoint
+
+        The breakpoint and the run are sent in one batch, so getting to
+        the line costs one round trip, however far away it is.
+
+        If the script breaks elsewhere first, on an other breakpoint, the
+        temporary breakpoint is removed, so it doesn't break there later.
+        Logpoints on the way are logged, as they are with a run.
+        """
+        arguments, data = get_breakpoint_arguments(breakpoint)
+
+        breakpoint_set = self.pipeline.queue(
+            'breakpoint_set',
+            arguments,
+            data,
+            callback=self.parser.parse_breakpoint_set_message,
+            timeout=self.get_command_timeout('breakpoint_set')
+        )
+
+        location = get_breakpoint_location(breakpoint)
+
+        while True:
+            response = self.__do_continuation_command('run')
+
+            if response.get('status') != 'break' or 'lineno' not in response:
+                return response
+
+            # The engine removed the temporary breakpoint when it broke
+            if get_breakpoint_location(response) == location:
+                return response
+
+            message = self.__get_logpoint_message(response)
 
-    def __get_variables(self):
-        command = 'context_names -i %d' % self.__get_transaction_id()
-        response = self.__send_command(command)
+            if message is None:
+                break
 
-        contexts = self.parser.parse_variable_contexts_message(response)
+            self.__log(message, response)
 
-        variables = {}
+        self.pipeline.wait([breakpoint_set])
 
-        for context in contexts:
-            context_id = int(context['id'])
-            command = 'context_get -i %d -c %d' % (
-                self.__get_transaction_id(),
-                context_id
+        breakpoint_id = breakpoint_set.result()
+
+        if breakpoint_id is not True and breakpoint_id is not False:
+            self.pipeline.execute(
+                'breakpoint_remove',
+                '-d %d' % breakpoint_id,
+                callback=self.parser.parse_breakpoint_remove_message,
+                timeout=self.get_command_timeout('breakpoint_remove')
             )
-            response = self.__send_command(command)
 
-            var = self.parser.parse_variables_message(response)
-            variables[context['name']] = var
+        return response
+
+    def __auto_step(self, options):
+        """Step on the worker, until told to stop
 
-        return variables
+        Every step is sent in one batch with a single eval of the condition,
+        or of the watched expression, so a step costs one round trip. No
+        state is emitted while stepping, the GUI is refreshed only once
+        stepping stops. Why it stopped is logged.
 
-    def __get_stacktraces(self):
-        command = 'stack_get -i %d' % self.__get_transaction_id()
-        response = self.__send_command(command)
+        Logpoints stepped on are logged, and stepping goes on.
+        """
+        command = options.get('command', 'step_over')
+        count = int(options.get('count') or 0)
+        condition = options.get('condition') or ''
+        watch = options.get('watch') or ''
 
-        stacktraces = self.parser.parse_stacktraces_message(response)
+        if condition:
+            expression = '(bool)(%s)' % condition
+        else:
+            expression = watch
 
-        return stacktraces
+        watched = None
 
-    def __set_breakpoints(self, breakpoints):
-        all_successful = True
+        if watch and not condition:
+            watched = self.__evaluate_expression(watch)
 
-        for breakpoint in breakpoints:
-            response = self.__set_breakpoint(breakpoint)
-            if response is False:
-                all_successful = False
+        self.auto_stepping = True
+        self.auto_step_interrupted = False
 
-        return all_successful
+        steps = 0
+        reason = None
 
-    def __set_breakpoint(self, breakpoint):
-        command = 'breakpoint_set -i %d -t %s -f %s -n %d' % (
-            self.__get_transaction_id(),
-            'line',
-            breakpoint['filename'],
-            int(breakpoint['lineno'])
+        try:
+            while reason is None:
+                response, evaluated = self.__do_auto_step(command,
+                                                          expression)
+                steps += 1
+
+                if response.get('status') != 'break':
+                    reason = "the script is %s" % response.get('status')
+                    break
+
+                message = self.__get_logpoint_message(response)
+
+                if message is not None:
+                    self.__log(message, response)
+
+                if evaluated is not None and evaluated['type'] == 'error':
+                    reason = "%s failed: %s" % (expression,
+                                                evaluated['value'])
+                elif condition and is_true(evaluated):
+                    reason = "%s is true" % condition
+                elif watch and not condition and not is_same_value(
+                    watched,
+                    evaluated
+                ):
+                    reason = "%s changed to %s" % (
+                        watch,
+                        get_variable_value(evaluated)
+                    )
+                elif count > 0 and steps >= count:
+                    reason = "all the steps are done"
+                elif self.auto_step_interrupted:
+                    reason = "interrupted"
+        finally:
+            self.auto_stepping = False
+
+        self.logged_signal.emit(
+            "Auto stepping stopped after %d steps, %s" % (steps, reason)
         )
-        response = self.__send_command(command)
 
-        return self.parser.parse_breakpoint_set_message(response)
+        return response
 
-    def __remove_breakpoint(self, breakpoint_id):
-        command = 'breakpoint_remove -i %d -d %d' % (
-            self.__get_transaction_id(),
-            breakpoint_id
+    def __do_auto_step(self, command, expression):
+        """Do a step, and evaluate the expression after it, in one batch
+
+        Returns the response of the step and the evaluated expression, None
+        if there is no expression.
+        """
+        future = self.pipeline.queue(
+            command,
+            callback=self.parser.parse_continuation_message
         )
-        response = self.__send_command(command)
 
-        return self.parser.parse_breakpoint_remove_message(response)
+        futures = [future]
 
-    def __list_breakpoints(self):
-        command = 'breakpoint_list -i %d' % self.__get_transaction_id()
-        response = self.__send_command(command)
+        if expression:
+            futures.append(self.__queue_evaluate_expression(expression))
 
-        breakpoints = self.parser.parse_breakpoint_list_message(response)
+        self.continuation = future
 
-        return breakpoints
+        try:
+            self.pipeline.wait(futures)
+        finally:
+            self.continuation = None
 
-    def __evaluate_expressions(self, expressions):
-        results = []
-        for index, expression in enumerate(expressions):
-            results.append(
-                self.__evaluate_expression(expression)
-            )
+        if expression:
+            return future.result(), self.__get_evaluated(futures[1])
 
-        return results
+        return future.result(), None
 
-    def __evaluate_expression(self, expression):
-        tid = self.__get_transaction_id()
-        b64 = b64encode(bytes(expression, 'UTF-8')).decode()
-        command = 'eval -i %d -- %s' % (tid, b64)
-        response = self.__send_command(command)
+    def __do_continuation_command(self, command):
+        future = self.pipeline.queue(
+            command,
+            callback=self.parser.parse_continuation_message
+        )
 
-        return self.parser.parse_eval_message(response)
+        self.continuation = future
 
-    def __set_debugger_features(self):
-        max_depth = int(get_setting('debugger/max_depth'))
-        command = 'feature_set -i %d -n max_depth -v %d' % (
-            self.__get_transaction_id(),
-            max_depth
+        try:
+            self.pipeline.wait([future])
+        finally:
+            self.continuation = None
+
+        return future.result()
+
+    def __get_logpoint_message(self, response):
+        if response.get('status') != 'break' or 'lineno' not in response:
+            return None
+
+        return self.logpoints.get(get_breakpoint_location(response))
+
+    def __log(self, message, response):
+        """Evaluate the expressions of a logpoint message and log it
+
+        All the expressions are evaluated in one batch.
+        """
+        expressions = get_log_expressions(message)
+        futures = self.__queue_evaluate_expressions(expressions)
+
+        self.pipeline.wait(futures)
+
+        evaluated = dict(
+            (expression, self.__get_evaluated(future))
+            for expression, future in zip(expressions, futures)
         )
-        self.__send_command(command)
 
-        max_children = int(get_setting('debugger/max_children'))
-        command = 'feature_set -i %d -n max_children -v %d' % (
-            self.__get_transaction_id(),
-            max_children
+        self.logged_signal.emit(format_log_entry(message, response, evaluated))
+
+    def __handle_step_response(self, response, data):
+        """Emit the result of a step command
+
+        If fetching the state together with the step is turned on, and the
+        step breaks, the variables, stacktraces and the expressions from
+        the previous refresh are read right away, and emitted together with
+        the step result in one signal. This saves sending a refresh request
+        from the GUI thread back to the worker after every step.
+        """
+        generation = data['generation']
+        response['generation'] = generation
+
+        if (not data['fetch_state'] or
+                response.get('status') != 'break' or
+                self.is_stale(generation)):
+            self.stepped_signal.emit(response)
+            return
+
+        try:
+            state = self.__post_step({'expressions': self.expressions})
+        except TimeoutError as error:
+            # The step is shown, and the state is asked for again
+            self.__log_refresh_error(error)
+            self.stepped_signal.emit(response)
+            return
+
+        state['step'] = response
+        state['generation'] = generation
+
+        self.stepped_and_fetched_signal.emit(state)
+
+    def __log_refresh_error(self, error):
+        """Log a refresh that timed out
+
+        The engine is slow to respond, but the connection is still fine,
+        so it is kept.
+        """
+        self.logged_signal.emit("Refreshing the state failed: %s" % (
+            error.strerror or error
+        ))
+
+    def __post_step(self, data):
+        """Get the variables, stacktraces and expressions after a step
+
+        All the commands are sent in one batch, so this costs one round trip
+        once the variable contexts are known.
+        """
+        self.set_expressions(data['expressions'])
+
+        contexts = self.__get_variable_contexts()
+
+        variables = [
+            (context['name'], self.__queue_get_variables(context))
+            for context in contexts
+        ]
+        stacktraces = self.__queue_get_stacktraces()
+        expressions = self.__queue_evaluate_expressions(data['expressions'])
+
+        self.pipeline.wait(
+            [future for name, future in variables] +
+            [stacktraces] +
+            expressions
         )
-        self.__send_command(command)
 
-        max_data = int(get_setting('debugger/max_data'))
-        command = 'feature_set -i %d -n max_data -v %d' % (
-            self.__get_transaction_id(),
-            max_data
+        post_step_response = {
+            'variables': dict(
+                (name, future.result()) for name, future in variables
+            ),
+            'stacktraces': stacktraces.result(),
+            'expressions': [self.__get_evaluated(future)
+                            for future in expressions]
+        }
+
+        return post_step_response
+
+    def __get_variable_contexts(self):
+        """Get the variable contexts
+
+        The contexts don't change during a debugging session, so they are
+        read only once per connection.
+        """
+        if self.variable_contexts is None:
+            self.variable_contexts = self.pipeline.execute(
+                'context_names',
+                callback=self.parser.parse_variable_contexts_message,
+                timeout=self.get_command_timeout('context_names')
+            )
+
+        return self.variable_contexts
+
+    def __queue_get_variables(self, context):
+        return self.pipeline.queue(
+            'context_get',
+            '-c %d' % int(context['id']),
+            stream_parser=self.parser.get_variables_stream_parser,
+            timeout=self.get_command_timeout('context_get')
         )
-        self.__send_command(command)
 
-        return True
+    def __queue_get_stacktraces(self):
+        return self.pipeline.queue(
+            'stack_get',
+            callback=self.parser.parse_stacktraces_message,
+            timeout=self.get_command_timeout('stack_get')
+        )
 
-    def __send_command(self, command):
-        self.socket.send(bytes(command + '\0', 'utf-8'))
-        return self.__receive_message()
+    def __queue_set_breakpoints(self, breakpoints):
+        return [self.__queue_set_breakpoint(breakpoint)
+                for breakpoint in breakpoints]
 
-    def __receive_message(self):
-        length = self.__get_message_length()
-        body = self.__get_message_body(length)
+    def __set_breakpoint(self, breakpoint):
+        """Set a breakpoint
 
-        return body
+        Returns the breakpoint with the id the engine gave it, or None if
+        the engine refused to set it.
+        """
+        future = self.__queue_set_breakpoint(breakpoint)
 
-    def __get_message_length(self):
-        length = ''
+        self.pipeline.wait([future])
 
-        while True:
-            character = self.socket.recv(1)
+        breakpoint_id = future.result()
 
-            if self.__is_eof(character):
-                self.disconnect()
+        if breakpoint_id is False:
+            return None
 
-            if character.isdigit():
-                length = length + character.decode(self.xdebug_encoding)
+        breakpoint = dict(breakpoint, state='enabled')
 
-            if character.decode(self.xdebug_encoding) == '\0':
-                if length == '':
-                    return 0
-                return int(length)
+        if breakpoint_id is True:
+            return breakpoint
 
-    def __get_message_body(self, length):
-        body = ''
+        if is_line_breakpoint(breakpoint):
+            self.breakpoint_locations[breakpoint_id] = (
+                get_breakpoint_location(breakpoint)
+            )
 
-        while length > 0:
-            data = self.socket.recv(length)
+        breakpoint['id'] = str(breakpoint_id)
 
-            if self.__is_eof(data):
-                self.disconnect()
+        return breakpoint
 
-            body = body + data.decode(self.xdebug_encoding)
+    def __queue_set_breakpoint(self, breakpoint):
+        """Queue setting a breakpoint
 
-            length = length - len(data)
+        The engine knows nothing about logpoints, they are breakpoints to it.
+        The connection keeps the log messages, by location, to tell the
+        breaks on logpoints apart.
+        """
+        arguments, data = get_breakpoint_arguments(breakpoint)
+
+        if is_line_breakpoint(breakpoint):
+            location = get_breakpoint_location(breakpoint)
+
+            if is_logpoint(breakpoint):
+                self.logpoints[location] = breakpoint['log']
+            else:
+                self.logpoints.pop(location, None)
+
+        return self.pipeline.queue(
+            'breakpoint_set',
+            arguments,
+            data,
+            callback=self.parser.parse_breakpoint_set_message,
+            timeout=self.get_command_timeout('breakpoint_set')
+        )
 
-        self.__get_null()
+    def __remove_breakpoint(self, breakpoint_id):
+        """Remove a breakpoint
 
-        return body
+        Returns the id of the removed breakpoint, or False if the engine
+        refused to remove it.
+        """
+        removed_id = self.pipeline.execute(
+            'breakpoint_remove',
+            '-d %d' % breakpoint_id,
+            callback=self.parser.parse_breakpoint_remove_message,
+            timeout=self.get_command_timeout('breakpoint_remove')
+        )
 
-    def __get_null(self):
-        while True:
-            character = self.socket.recv(1)
+        # A breakpoint the engine refused to remove is still set
+        if removed_id is False:
+            return removed_id
 
-            if self.__is_eof(character):
-                self.disconnect()
+        location = self.breakpoint_locations.pop(breakpoint_id, None)
 
-            if character.decode(self.xdebug_encoding) == '\0':
-                return
+        if location is not None:
+            self.logpoints.pop(location, None)
+
+        return removed_id
+
+    def __list_breakpoints(self):
+        breakpoints = self.pipeline.execute(
+            'breakpoint_list',
+            callback=self.parser.parse_breakpoint_list_message,
+            timeout=self.get_command_timeout('breakpoint_list')
+        )
+
+        return self.__track_breakpoints(breakpoints)
+
+    def __track_breakpoints(self, breakpoints):
+        """Track the listed breakpoints
+
+        Remember where the breakpoints are, by their id, and add the log
+        messages to the listed breakpoints that are logpoints. Logpoints of
+        the breakpoints that are not listed are forgotten.
+        """
+        logpoints = {}
+        self.breakpoint_locations = {}
+
+        for breakpoint in filter(is_line_breakpoint, breakpoints):
+            location = get_breakpoint_location(breakpoint)
+
+            if 'id' in breakpoint:
+                self.breakpoint_locations[int(breakpoint['id'])] = location
 
-    def __is_eof(self, data):
-        return data.decode(self.xdebug_encoding) == ''
+            if location in self.logpoints:
+                breakpoint['log'] = self.logpoints[location]
+                logpoints[location] = breakpoint['log']
 
-    def __get_transaction_id(self):
-        self.transaction_id += 1
-        return self.transaction_id
+        self.logpoints = logpoints
+
+        return breakpoints
+
+    def __queue_evaluate_expressions(self, expressions):
+        return [self.__queue_evaluate_expression(expression)
+                for expression in expressions]
+
+    def __evaluate_expression(self, expression):
+        future = self.__queue_evaluate_expression(expression)
+
+        self.pipeline.wait([future])
+
+        return self.__get_evaluated(future)
+
+    def __queue_evaluate_expression(self, expression):
+        return self.pipeline.queue(
+            'eval',
+            data=expression,
+            callback=self.parser.parse_eval_message,
+            timeout=self.get_command_timeout('eval')
+        )
+
+    def __get_evaluated(self, future):
+        """Get the result of an evaluation
+
+        An evaluation that takes too long is cancelled, and shown as an
+        error, without dropping the connection.
+        """
+        try:
+            return future.result()
+        except TimeoutError as error:
+            return {
+                'type': 'error',
+                'value': error.strerror
+            }
+
+    def __set_debugger_features(self):
+        self.pipeline.wait(self.__queue_set_debugger_features())
+
+        return True
+
+    def __queue_set_debugger_features(self):
+        features = ['max_depth', 'max_children', 'max_data']
+
+        return [
+            self.pipeline.queue(
+                'feature_set',
+                '-n %s -v %d' % (
+                    feature,
+                    int(get_setting('debugger/%s' % feature))
+                ),
+                timeout=self.get_command_timeout('feature_set')
+            )
+            for feature in features
+        ]
+
+    def __receive_message(self):
+        return self.frame_reader.read_frame()
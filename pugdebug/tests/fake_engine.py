@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import re
+import shlex
+import socket
+import threading
+import time
+
+from base64 import b64decode
+
+from pugdebug.tests.synthetic import (frame, response, init_message,
+                                      string_property, int_property,
+                                      bool_property, variables_body,
+                                      stack_get_body)
+
+
+class PugdebugFakeEngine():
+    """A fake Xdebug engine
+
+    Speaks the part of the DBGp protocol pugdebug uses, so the server,
+    the debugger and the GUI can be tested and measured without PHP.
+
+    Every connection is a session on it's own thread. A session connects to
+    pugdebug, sends the init message and answers the commands until it is
+    stopped. Steps move through the lines of the file, and the session
+    stops after the given number of steps.
+
+    The size of the responses is set with the knobs:
+
+     - `variables`, `width` and `depth` - the number of variables in every
+       context, and how wide and deep the array tree of every variable is
+     - `value_size` - the length of string values
+     - `stack_depth` - the number of frames in the stack
+     - `latency` - seconds to wait before every response
+     - `connections` - the number of sessions connecting at the same time
+     - `steps` - the number of steps before a session stops
+     - `connect_timeout` - how long to keep trying to connect to pugdebug
+    """
+
+    host = '127.0.0.1'
+    port = 9000
+    idekey = 'pugdebug'
+    fileuri = 'file:///var/www/index.php'
+
+    variables = 10
+    width = 4
+    depth = 2
+    value_size = 16
+    stack_depth = 5
+    latency = 0
+    connections = 1
+    steps = 100
+    connect_timeout = 5
+
+    contexts = ['Locals', 'Superglobals', 'User defined constants']
+
+    def __init__(self, **knobs):
+        for name, value in knobs.items():
+            if not hasattr(self, name):
+                raise TypeError('Unknown knob %s' % name)
+            setattr(self, name, value)
+
+        self.sessions = []
+
+        # Built once, every context_get gets the same variables
+        self.context_get_body = None
+
+    def start(self):
+        """Connect the sessions to pugdebug"""
+        if self.context_get_body is None:
+            self.context_get_body = variables_body(
+                self.variables,
+                width=self.width,
+                depth=self.depth,
+                value_size=self.value_size
+            )
+
+        for i in range(self.connections):
+            session = PugdebugFakeEngineSession(self)
+            session.start()
+            self.sessions.append(session)
+
+    def join(self, timeout=None):
+        """Wait for all the sessions to finish"""
+        for session in self.sessions:
+            session.join(timeout)
+
+    def get_commands(self):
+        """Get the names of the commands all the sessions received"""
+        return [command
+                for session in self.sessions
+                for command in session.commands]
+
+
+class PugdebugFakeEngineSession(threading.Thread):
+    """A single debugging session of the fake engine"""
+
+    def __init__(self, engine):
+        super(PugdebugFakeEngineSession, self).__init__(daemon=True)
+
+        self.engine = engine
+
+        self.socket = None
+
+        # Names of the commands received
+        self.commands = []
+
+        self.lineno = 1
+        self.steps = 0
+        self.status = 'starting'
+
+        self.breakpoints = {}
+        self.breakpoint_id = 0
+
+        self.handlers = {
+            'typemap_get': self.typemap_get,
+            'feature_set': self.feature_set,
+            'feature_get': self.feature_get,
+            'status': self.get_status,
+            'step_into': self.step,
+            'step_over': self.step,
+            'step_out': self.step,
+            'run': self.run_to_breakpoint,
+            'break': self.break_script,
+            'stop': self.stop,
+            'detach': self.stop,
+            'context_names': self.context_names,
+            'context_get': self.context_get,
+            'stack_get': self.stack_get,
+            'eval': self.eval,
+            'breakpoint_set': self.breakpoint_set,
+            'breakpoint_remove': self.breakpoint_remove,
+            'breakpoint_list': self.breakpoint_list,
+        }
+
+    def run(self):
+        try:
+            self.socket = self.connect()
+        except OSError:
+            return
+
+        try:
+            self.send(self.init())
+            self.answer_commands()
+        except OSError:
+            pass
+        finally:
+            self.socket.close()
+
+    def connect(self):
+        """Connect to pugdebug
+
+        Keep trying until the connect timeout, pugdebug might not be
+        listening yet.
+        """
+        deadline = time.monotonic() + self.engine.connect_timeout
+
+        while True:
+            try:
+                return socket.create_connection(
+                    (self.engine.host, self.engine.port)
+                )
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def answer_commands(self):
+        data = b''
+
+        while self.status != 'stopped':
+            chunk = self.socket.recv(65536)
+
+            if not chunk:
+                return
+
+            data += chunk
+
+            *commands, data = data.split(b'\0')
+
+            for command in commands:
+                self.answer(command.decode())
+
+    def answer(self, command):
+        if ' -- ' in command:
+            command, data = command.split(' -- ', 1)
+            data = b64decode(data).decode()
+        else:
+            data = None
+
+        arguments = shlex.split(command)
+        name = arguments[0]
+        options = dict(zip(arguments[1::2], arguments[2::2]))
+
+        self.commands.append(name)
+
+        handler = self.handlers.get(name, self.unknown_command)
+        body, attributes = handler(options, data)
+
+        if self.engine.latency > 0:
+            time.sleep(self.engine.latency)
+
+        self.send(response(
+            name,
+            int(options['-i']),
+            body,
+            b''.join(b' %s="%s"' % (key.encode(), str(value).encode())
+                     for key, value in attributes.items())
+        ))
+
+    def send(self, message):
+        self.socket.sendall(frame(message))
+
+    def init(self):
+        return init_message(self.engine.idekey, self.engine.fileuri)
+
+    def typemap_get(self, options, data):
+        types = [('bool', 'bool'), ('int', 'int'), ('float', 'float'),
+                 ('string', 'string'), ('null', 'null'), ('array', 'hash'),
+                 ('object', 'object'), ('resource', 'resource')]
+
+        body = b''.join(
+            b'<map type="%s" name="%s" xsi:type="xsd:%s"></map>' % (
+                common.encode(), language.encode(), common.encode()
+            ) for language, common in types
+        )
+
+        return body, {
+            'xmlns:xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+            'xmlns:xsd': 'http://www.w3.org/2001/XMLSchema'
+        }
+
+    def feature_set(self, options, data):
+        return b'', {'feature': options.get('-n'), 'success': 1}
+
+    def feature_get(self, options, data):
+        return b'0', {'feature_name': options.get('-n'), 'supported': 0}
+
+    def get_status(self, options, data):
+        return b'', {'status': self.status, 'reason': 'ok'}
+
+    def step(self, options, data):
+        return self.break_at(self.lineno + 1)
+
+    def run_to_breakpoint(self, options, data):
+        breakpoints = sorted(
+            (int(breakpoint['-n']), breakpoint_id)
+            for breakpoint_id, breakpoint in self.breakpoints.items()
+            if int(breakpoint.get('-n', 0)) > self.lineno
+        )
+
+        if len(breakpoints) == 0:
+            return self.stopping()
+
+        lineno, breakpoint_id = breakpoints[0]
+
+        # Temporary breakpoints are removed once they break
+        if self.breakpoints[breakpoint_id].get('-r') == '1':
+            del self.breakpoints[breakpoint_id]
+
+        return self.break_at(lineno)
+
+    def break_script(self, options, data):
+        # Every command is answered before the next is read,
+        # so there is never a running script to break
+        return b'', {'success': 1}
+
+    def break_at(self, lineno):
+        self.steps += 1
+
+        if self.steps > self.engine.steps:
+            return self.stopping()
+
+        self.lineno = lineno
+        self.status = 'break'
+
+        body = (b'<xdebug:message filename="%s" lineno="%d">'
+                b'</xdebug:message>') % (self.engine.fileuri.encode(), lineno)
+
+        return body, {
+            'status': 'break',
+            'reason': 'ok'
+        }
+
+    def stopping(self):
+        self.status = 'stopping'
+        return b'', {'status': 'stopping', 'reason': 'ok'}
+
+    def stop(self, options, data):
+        self.status = 'stopped'
+        return b'', {'status': 'stopped', 'reason': 'ok'}
+
+    def context_names(self, options, data):
+        body = b''.join(
+            b'<context name="%s" id="%d"></context>' % (name.encode(), i)
+            for i, name in enumerate(self.engine.contexts)
+        )
+
+        return body, {}
+
+    def context_get(self, options, data):
+        return self.engine.context_get_body, {
+            'context': options.get('-c', 0)
+        }
+
+    def stack_get(self, options, data):
+        return stack_get_body(
+            self.engine.stack_depth,
+            self.engine.fileuri,
+            self.lineno
+        ), {}
+
+    def eval(self, options, data):
+        # The line the script is on is known as $lineno, and conditions
+        # on it are evaluated, other expressions evaluate to themselves
+        if data == '$lineno':
+            return int_property('', self.lineno), {}
+
+        match = re.match(r'\(bool\)\(\$lineno == (\d+)\)$', data or '')
+
+        if match:
+            return bool_property('', self.lineno == int(match.group(1))), {}
+
+        return string_property('', data or ''), {}
+
+    def breakpoint_set(self, options, data):
+        self.breakpoint_id += 1
+        self.breakpoints[self.breakpoint_id] = options
+
+        return b'', {'state': 'enabled', 'id': self.breakpoint_id}
+
+    def breakpoint_remove(self, options, data):
+        breakpoint_id = int(options['-d'])
+
+        if self.breakpoints.pop(breakpoint_id, None) is None:
+            return self.error(205, 'No such breakpoint')
+
+        return b'<breakpoint type="line" id="%d"></breakpoint>' % (
+            breakpoint_id
+        ), {}
+
+    def breakpoint_list(self, options, data):
+        body = b''.join(
+            b'<breakpoint type="%s" filename="%s" lineno="%s" '
+            b'state="enabled" hit_count="0" hit_value="0" id="%d">'
+            b'</breakpoint>' % (
+                breakpoint.get('-t', 'line').encode(),
+                self.get_fileuri(breakpoint.get('-f', '')).encode(),
+                breakpoint.get('-n', '0').encode(),
+                breakpoint_id
+            ) for breakpoint_id, breakpoint in self.breakpoints.items()
+        )
+
+        return body, {}
+
+    def unknown_command(self, options, data):
+        return self.error(4, 'Unimplemented command')
+
+    def error(self, code, message):
+        return (b'<error code="%d"><message><![CDATA[%s]]></message>'
+                b'</error>') % (code, message.encode()), {}
+
+    def get_fileuri(self, filename):
+        if re.match('^[a-z]+://', filename):
+            return filename
+
+        return 'file://' + filename
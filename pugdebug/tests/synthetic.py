@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+from base64 import b64encode
+
+
+def frame(message):
+    """Wrap a message into a DBGp frame"""
+    return str(len(message)).encode() + b'\0' + message + b'\0'
+
+
+def response(command, transaction_id, body=b'', attributes=b''):
+    """Build a response message to a command"""
+    return (b'<?xml version="1.0" encoding="iso-8859-1"?>'
+            b'<response xmlns="urn:debugger_protocol_v1" '
+            b'xmlns:xdebug="http://xdebug.org/dbgp/xdebug" '
+            b'command="' + command.encode() + b'" '
+            b'transaction_id="' + str(transaction_id).encode() + b'"' +
+            attributes + b'>' + body + b'</response>')
+
+
+def string_property(name, value):
+    """Build a base64 encoded string property, like xdebug sends them"""
+    encoded = b64encode(value.encode())
+    return (b'<property name="' + name.encode() + b'" fullname="' +
+            name.encode() + b'" type="string" size="' +
+            str(len(value)).encode() + b'" encoding="base64"><![CDATA[' +
+            encoded + b']]></property>')
+
+
+def int_property(name, value):
+    return (b'<property name="' + name.encode() + b'" fullname="' +
+            name.encode() + b'" type="int"><![CDATA[' +
+            str(value).encode() + b']]></property>')
+
+
+def bool_property(name, value):
+    return (b'<property name="' + name.encode() + b'" fullname="' +
+            name.encode() + b'" type="bool"><![CDATA[' +
+            (b'1' if value else b'0') + b']]></property>')
+
+
+def array_property(name, children):
+    return (b'<property name="' + name.encode() + b'" fullname="' +
+            name.encode() + b'" type="array" children="1" numchildren="' +
+            str(len(children)).encode() + b'" page="0" pagesize="' +
+            str(len(children)).encode() + b'">' + b''.join(children) +
+            b'</property>')
+
+
+def object_property(name, classname, children):
+    return (b'<property name="' + name.encode() + b'" fullname="' +
+            name.encode() + b'" type="object" classname="' +
+            classname.encode() + b'" children="1" numchildren="' +
+            str(len(children)).encode() + b'" page="0" pagesize="' +
+            str(len(children)).encode() + b'">' + b''.join(children) +
+            b'</property>')
+
+
+def variable_tree(name, width, depth, value_size=16):
+    """Build an array property `depth` levels deep, `width` children wide
+
+    The leaves are alternately string and int properties.
+    """
+    if depth == 0:
+        return string_property(name, 'v' * value_size)
+
+    children = []
+    for i in range(width):
+        child_name = '%s[%d]' % (name, i)
+        if depth == 1 and i % 2:
+            children.append(int_property(child_name, i))
+        else:
+            children.append(
+                variable_tree(child_name, width, depth - 1, value_size)
+            )
+
+    return array_property(name, children)
+
+
+def context_get_body(size, width=10, depth=3, value_size=16):
+    """Build the body of a context_get response of roughly `size` bytes
+
+    The body is made of top level variables, each a tree of the given
+    width and depth, until the size is reached.
+    """
+    properties = []
+    total = 0
+    i = 0
+
+    while total < size:
+        tree = variable_tree('$var%d' % i, width, depth, value_size)
+        properties.append(tree)
+        total += len(tree)
+        i += 1
+
+    return b''.join(properties)
+
+
+def variables_body(count, width=10, depth=3, value_size=16):
+    """Build the body of a context_get response with `count` variables"""
+    return b''.join(
+        variable_tree('$var%d' % i, width, depth, value_size)
+        for i in range(count)
+    )
+
+
+def context_get_response(size, transaction_id=1, **kwargs):
+    """Build a context_get response message of roughly `size` bytes"""
+    return response(
+        'context_get',
+        transaction_id,
+        context_get_body(size, **kwargs),
+        b' context="0"'
+    )
+
+
+def stack_get_body(depth, fileuri='file:///var/www/index.php', lineno=3):
+    """Build the body of a stack_get response `depth` frames deep"""
+    frames = []
+
+    for level in range(depth):
+        where = b'{main}' if level == depth - 1 else b'function%d' % level
+        frames.append(
+            b'<stack where="' + where + b'" level="' +
+            str(level).encode() + b'" type="file" filename="' +
+            fileuri.encode() + b'" lineno="' +
+            str(lineno + level).encode() + b'"></stack>'
+        )
+
+    return b''.join(frames)
+
+
+def object_chain(name, depth, value_size=16):
+    """Build an object `depth` levels deep
+
+    Every object has a string property and a property with the next
+    object in the chain.
+    """
+    if depth == 0:
+        return string_property(name, 'v' * value_size)
+
+    return object_property(name, 'Node', [
+        string_property('label', 'v' * value_size),
+        object_chain('next', depth - 1, value_size)
+    ])
+
+
+def repeat_until(size, build):
+    """Join the results of build(i) until they are `size` bytes long
+
+    Returns the joined bytes and how many times build was called.
+    """
+    parts = []
+    total = 0
+
+    while total < size:
+        part = build(len(parts))
+        parts.append(part)
+        total += len(part)
+
+    return b''.join(parts), len(parts)
+
+
+def init_message(idekey='pugdebug', fileuri='file:///var/www/index.php'):
+    return (b'<?xml version="1.0" encoding="iso-8859-1"?>'
+            b'<init xmlns="urn:debugger_protocol_v1" '
+            b'xmlns:xdebug="http://xdebug.org/dbgp/xdebug" '
+            b'fileuri="' + fileuri.encode() + b'" '
+            b'language="PHP" protocol_version="1.0" appid="1" '
+            b'idekey="' + idekey.encode() + b'">'
+            b'<engine version="2.9.0"><![CDATA[Xdebug]]></engine>'
+            b'<author><![CDATA[Derick Rethans]]></author>'
+            b'<url><![CDATA[http://xdebug.org]]></url>'
+            b'<copyright><![CDATA[Copyright (c) 2002-2019]]></copyright>'
+            b'</init>')
+
+
+def typemap_body(count):
+    """Build the body of a typemap_get response with `count` types"""
+    return b''.join(
+        b'<map type="string" name="type%d" xsi:type="xsd:string"></map>' % i
+        for i in range(count)
+    )
+
+
+def typemap_attributes():
+    return (b' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+            b' xmlns:xsd="http://www.w3.org/2001/XMLSchema"')
+
+
+def contexts_body(count):
+    """Build the body of a context_names response with `count` contexts"""
+    return b''.join(
+        b'<context name="Context %d" id="%d"></context>' % (i, i)
+        for i in range(count)
+    )
+
+
+def breakpoints_body(count, fileuri='file:///var/www/index.php'):
+    """Build the body of a breakpoint_list response"""
+    return b''.join(
+        b'<breakpoint type="line" filename="' + fileuri.encode() +
+        b'" lineno="%d" state="enabled" hit_count="0" hit_value="0" '
+        b'id="%d"></breakpoint>' % (i + 1, i + 1)
+        for i in range(count)
+    )
+
+
+def break_attributes(status='break'):
+    return b' status="' + status.encode() + b'" reason="ok"'
+
+
+def break_body(fileuri='file:///var/www/index.php', lineno=3):
+    return (b'<xdebug:message filename="' + fileuri.encode() +
+            b'" lineno="%d"></xdebug:message>' % lineno)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import unittest
+
+from pugdebug.message_parser import PugdebugMessageParser
+from pugdebug.models.breakpoints import (PugdebugBreakpoints,
+                                         get_breakpoint_arguments,
+                                         is_conditional_breakpoint,
+                                         describe_breakpoint_condition,
+                                         get_log_expressions,
+                                         format_log_entry)
+
+
+class PugdebugBreakpointsTest(unittest.TestCase):
+
+    def test_line_breakpoint_arguments(self):
+        arguments, data = get_breakpoint_arguments({
+            'filename': '/var/www/index.php',
+            'lineno': '3'
+        })
+
+        self.assertEqual('-t line -f /var/www/index.php -n 3', arguments)
+        self.assertIsNone(data)
+
+    def test_conditional_breakpoint_arguments(self):
+        breakpoint = {
+            'type': 'conditional',
+            'filename': '/var/www/index.php',
+            'lineno': 3,
+            'expression': '$id == 42',
+            'hit_condition': '%',
+            'hit_value': 500
+        }
+
+        arguments, data = get_breakpoint_arguments(breakpoint)
+
+        self.assertEqual(
+            '-t conditional -f /var/www/index.php -n 3 -h 500 -o %',
+            arguments
+        )
+        self.assertEqual('$id == 42', data)
+        self.assertTrue(is_conditional_breakpoint(breakpoint))
+        self.assertEqual('$id == 42, hit % 500',
+                         describe_breakpoint_condition(breakpoint))
+
+    def test_hit_count_makes_a_line_breakpoint_conditional(self):
+        breakpoint = {
+            'type': 'line',
+            'filename': '/var/www/index.php',
+            'lineno': '3',
+            'hit_value': '0'
+        }
+
+        self.assertFalse(is_conditional_breakpoint(breakpoint))
+
+        breakpoint['hit_value'] = '500'
+
+        self.assertTrue(is_conditional_breakpoint(breakpoint))
+        self.assertEqual(
+            '-t line -f /var/www/index.php -n 3 -h 500 -o >=',
+            get_breakpoint_arguments(breakpoint)[0]
+        )
+
+    def test_call_return_and_exception_breakpoint_arguments(self):
+        self.assertEqual(
+            ('-t call -a User -m save', None),
+            get_breakpoint_arguments({'type': 'call',
+                                      'function': 'User::save'})
+        )
+        self.assertEqual(
+            ('-t return -m strlen', None),
+            get_breakpoint_arguments({'type': 'return',
+                                      'function': 'strlen'})
+        )
+        self.assertEqual(
+            ('-t exception -x RuntimeException', None),
+            get_breakpoint_arguments({'type': 'exception',
+                                      'exception': 'RuntimeException'})
+        )
+
+    def test_temporary_breakpoint_arguments(self):
+        self.assertEqual(
+            ('-t line -f /var/www/index.php -n 3 -r 1', None),
+            get_breakpoint_arguments({'filename': '/var/www/index.php',
+                                      'lineno': 3,
+                                      'temporary': True})
+        )
+
+    def test_unknown_type_is_refused(self):
+        with self.assertRaises(ValueError):
+            get_breakpoint_arguments({'type': 'watch'})
+
+    def test_logpoint_is_set_as_a_breakpoint(self):
+        breakpoint = {
+            'filename': '/var/www/index.php',
+            'lineno': 3,
+            'log': 'id {$id}'
+        }
+
+        self.assertEqual(
+            ('-t line -f /var/www/index.php -n 3', None),
+            get_breakpoint_arguments(breakpoint)
+        )
+        self.assertEqual('log "id {$id}"',
+                         describe_breakpoint_condition(breakpoint))
+
+    def test_log_expressions_are_evaluated_once(self):
+        self.assertEqual(
+            ['$id', '$user->name'],
+            get_log_expressions('{$id}: {$user->name} ({$id})')
+        )
+
+    def test_log_entry_is_formatted(self):
+        entry = format_log_entry(
+            '{$id}: {$user} {$missing}',
+            {'filename': '/var/www/index.php', 'lineno': '3'},
+            {
+                '$id': {'type': 'int', 'value': '42'},
+                '$user': {'type': 'object', 'classname': 'User'},
+            }
+        )
+
+        self.assertEqual('index.php:3 42: User {$missing}', entry)
+
+
+class PugdebugBreakpointStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.breakpoints = PugdebugBreakpoints([
+            {'filename': '/var/www/index.php', 'lineno': '3', 'id': '10'},
+            {'filename': '/var/www/index.php', 'lineno': '7', 'id': '11'},
+            {'filename': '/var/www/user.php', 'lineno': '3', 'id': '12'},
+            {'type': 'exception', 'exception': 'RuntimeException', 'id': '13'},
+        ])
+
+    def test_breakpoints_are_found_by_location_and_id(self):
+        self.assertEqual('10', self.breakpoints.get('/var/www/index.php',
+                                                    3)['id'])
+        self.assertIsNone(self.breakpoints.get('/var/www/index.php', 4))
+        self.assertEqual('RuntimeException',
+                         self.breakpoints.get_by_id(13)['exception'])
+        self.assertEqual(
+            ['7'],
+            [breakpoint['lineno'] for breakpoint
+             in self.breakpoints.get_file_breakpoints('/var/www/index.php')
+             if breakpoint['id'] == '11']
+        )
+
+    def test_breakpoint_on_the_same_line_is_replaced(self):
+        self.breakpoints.add({'filename': '/var/www/index.php', 'lineno': 3,
+                              'id': '20', 'log': 'id {$id}'})
+
+        self.assertEqual(4, len(self.breakpoints))
+        self.assertIsNone(self.breakpoints.get_by_id(10))
+        self.assertEqual('id {$id}',
+                         self.breakpoints.get('/var/www/index.php', 3)['log'])
+
+    def test_breakpoints_are_removed_from_every_index(self):
+        removed = self.breakpoints.remove_by_id(10)
+
+        self.assertEqual('3', removed['lineno'])
+        self.assertIsNone(self.breakpoints.remove_by_id(10))
+        self.assertIsNone(self.breakpoints.get('/var/www/index.php', 3))
+
+        removed = self.breakpoints.remove_file('/var/www/index.php')
+
+        self.assertEqual(['11'], [breakpoint['id'] for breakpoint in removed])
+        self.assertEqual(['/var/www/user.php'], self.breakpoints.get_files())
+        self.assertEqual(['12', '13'],
+                         [breakpoint['id'] for breakpoint in self.breakpoints])
+
+    def test_listed_conditional_breakpoint_is_marked_as_conditional(self):
+        listed = PugdebugMessageParser().parse_breakpoint_list_message(
+            '<?xml version="1.0" encoding="iso-8859-1"?>'
+            '<response xmlns="urn:debugger_protocol_v1" '
+            'command="breakpoint_list" transaction_id="5">'
+            '<breakpoint type="conditional" '
+            'filename="file:///var/www/index.php" lineno="5" '
+            'state="enabled" id="20">'
+            '<expression encoding="base64"><![CDATA[JGlkID09IDQy]]>'
+            '</expression></breakpoint>'
+            '<breakpoint type="line" filename="file:///var/www/index.php" '
+            'lineno="9" state="enabled" id="21"/>'
+            '</response>'
+        )
+
+        # The logpoints are known only to the connection, which adds the
+        # log messages to the listed breakpoints
+        listed[1]['log'] = 'id {$id}'
+
+        self.breakpoints.replace(listed)
+
+        self.assertEqual(
+            {5: (True, False), 9: (False, True)},
+            self.breakpoints.get_line_markers('/var/www/index.php')
+        )
+        self.assertEqual({}, self.breakpoints.get_line_markers(
+            '/var/www/user.php'
+        ))
+
+    def test_thousands_of_breakpoints(self):
+        self.breakpoints.replace(
+            {'filename': '/var/www/file%d.php' % (i % 100), 'lineno': i,
+             'id': str(i)}
+            for i in range(10000)
+        )
+
+        for i in range(0, 10000, 2):
+            self.breakpoints.remove_by_id(i)
+
+        self.assertEqual(5000, len(self.breakpoints))
+        self.assertEqual(100, len(self.breakpoints.get_file_breakpoints(
+            '/var/www/file1.php'
+        )))
+        self.assertEqual([], self.breakpoints.get_file_breakpoints(
+            '/var/www/file0.php'
+        ))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import unittest
+
+from pugdebug.models.connection_rules import (parse_connection_rules,
+                                              match_connection_rules)
+
+
+class PugdebugConnectionRulesTest(unittest.TestCase):
+
+    def test_rules_are_parsed_one_per_line(self):
+        with self.assertLogs(level='WARNING'):
+            rules = parse_connection_rules(
+                '# comment\n'
+                '\n'
+                'detach fileuri */vendor/*\n'
+                'ignore fileuri *\n'
+                'run request_uri /assets/* \n'
+            )
+
+        self.assertEqual(
+            [('detach', 'fileuri', '*/vendor/*'),
+             ('run', 'request_uri', '/assets/*')],
+            [(rule.action, rule.field, rule.pattern) for rule in rules]
+        )
+        self.assertFalse(rules[0].needs_request_uri())
+        self.assertTrue(rules[1].needs_request_uri())
+
+    def test_first_matching_rule_wins(self):
+        rules = parse_connection_rules(
+            'run fileuri /var/www/cron.php\n'
+            'detach idekey other-*\n'
+            'run idekey *\n'
+        )
+
+        self.assertEqual('detach', match_connection_rules(rules, {
+            'fileuri': '/var/www/index.php',
+            'idekey': 'other-developer'
+        }))
+        self.assertEqual('run', match_connection_rules(rules, {
+            'fileuri': '/var/www/cron.php',
+            'idekey': 'other-developer'
+        }))
+
+    def test_missing_fields_do_not_match(self):
+        rules = parse_connection_rules('detach request_uri *')
+
+        self.assertIsNone(match_connection_rules(rules, {}))
+        self.assertIsNone(match_connection_rules([], {'fileuri': 'x'}))
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import socket
+import time
+import unittest
+
+from PyQt5.QtCore import QCoreApplication
+
+from pugdebug.debugger import PugdebugDebugger
+from pugdebug.tests.fake_engine import PugdebugFakeEngine
+
+application = QCoreApplication.instance() or QCoreApplication([])
+
+
+def get_free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def process_events_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        application.processEvents()
+        time.sleep(0.001)
+
+    return True
+
+
+class PugdebugFakeEngineTest(unittest.TestCase):
+    """Debug sessions of the fake engine through the server and debugger
+    """
+
+    def setUp(self):
+        self.port = get_free_port()
+
+        self.debugger = PugdebugDebugger()
+        self.debugger.server.start_listening([('127.0.0.1', self.port)])
+
+        # Set up by run_session
+        self.session = None
+
+        self.variables = []
+        self.stacktraces = []
+        self.expressions = []
+        self.logged = []
+        self.steps = []
+        self.sessions = 0
+        self.connections = []
+        self.stopped = False
+
+        self.debugger.debugging_started_signal.connect(self.start_session)
+        self.debugger.debugging_post_start_signal.connect(
+            self.handle_post_start
+        )
+        self.debugger.got_all_variables_signal.connect(self.variables.append)
+        self.debugger.got_stacktraces_signal.connect(self.stacktraces.append)
+        self.debugger.expressions_evaluated_signal.connect(
+            self.expressions.append
+        )
+        self.debugger.logged_signal.connect(self.logged.append)
+        self.debugger.step_command_signal.connect(self.handle_step)
+        self.debugger.debugging_stopped_signal.connect(self.handle_stopped)
+
+    def tearDown(self):
+        self.debugger.stop_listening()
+        process_events_until(lambda: not self.debugger.server.isRunning())
+
+    def run_session(self, step, arguments=(), breakpoints=(), **knobs):
+        """Debug the sessions of a fake engine until the debugger stops
+
+        Every session sets the breakpoints, and once they are set, calls
+        the step method of the debugger with the arguments. The knobs are
+        passed on to the fake engine. Returns the engine.
+        """
+        self.session = {
+            'step': step,
+            'arguments': arguments,
+            'breakpoints': list(breakpoints)
+        }
+
+        engine = PugdebugFakeEngine(port=self.port, **knobs)
+        engine.start()
+
+        connections = knobs.get('connections', 1)
+
+        self.assertTrue(process_events_until(
+            lambda: self.sessions == connections and self.stopped
+        ))
+        engine.join(5)
+
+        return engine
+
+    def start_session(self):
+        self.sessions += 1
+        self.connections.append(self.debugger.current_connection)
+        self.debugger.post_start_command({
+            'breakpoints': self.session['breakpoints'],
+            'expressions': ['$foo']
+        })
+
+    def handle_post_start(self):
+        getattr(self.debugger, self.session['step'])(
+            *self.session['arguments']
+        )
+
+    def handle_step(self):
+        self.steps.append(self.debugger.step_result.get('lineno'))
+
+        # One step is enough, the state was fetched together with it
+        if self.debugger.is_breaking():
+            self.debugger.stop_debug()
+
+    def handle_stopped(self):
+        self.stopped = True
+
+    def test_concurrent_sessions(self):
+        engine = self.run_session(
+            'step_into',
+            connections=3,
+            variables=20,
+            width=3,
+            depth=2,
+            stack_depth=7
+        )
+
+        self.assertEqual(3, len(self.variables))
+        for variables in self.variables:
+            self.assertEqual(
+                ['Locals', 'Superglobals', 'User defined constants'],
+                sorted(variables.keys())
+            )
+            self.assertEqual(20, len(variables['Locals']))
+            self.assertEqual(3, len(variables['Locals'][0]['variables']))
+
+        self.assertEqual([7, 7, 7], [len(stack) for stack in self.stacktraces])
+        self.assertEqual('JGZvbw==', self.expressions[0][0]['value'])
+
+        commands = engine.get_commands()
+        self.assertEqual(3, commands.count('step_into'))
+        self.assertEqual(3, commands.count('stop'))
+
+    def test_stopped_sessions_are_disconnected_on_handoff(self):
+        self.run_session('step_into', connections=3)
+
+        self.assertEqual(3, len(self.connections))
+
+        for connection in self.connections:
+            connection.worker.join(5)
+            self.assertFalse(connection.worker.is_alive())
+
+    def test_logpoints_are_logged_without_stopping(self):
+        engine = self.run_session('run_debug', breakpoints=[
+            {'filename': '/var/www/index.php', 'lineno': 3,
+             'log': 'at {$i} of {$n}'},
+            {'filename': '/var/www/index.php', 'lineno': 5},
+        ])
+
+        # The engine's eval answers with the expression itself
+        self.assertEqual(['index.php:3 at $i of $n'], self.logged)
+        self.assertEqual(['5'], self.steps)
+        self.assertEqual(2, engine.get_commands().count('run'))
+
+    def test_run_to_line_refreshes_once_on_arrival(self):
+        engine = self.run_session(
+            'run_to',
+            ('/var/www/index.php', 6),
+            [{'filename': '/var/www/index.php', 'lineno': 9}]
+        )
+
+        self.assertEqual(['6'], self.steps)
+        self.assertEqual(1, len(self.variables))
+
+        commands = engine.get_commands()
+        self.assertEqual(1, commands.count('run'))
+        self.assertEqual(2, commands.count('breakpoint_set'))
+        self.assertEqual(0, commands.count('breakpoint_remove'))
+        self.assertEqual(0, commands.count('step_over'))
+
+    def test_run_to_line_stops_on_an_earlier_breakpoint(self):
+        engine = self.run_session(
+            'run_to',
+            ('/var/www/index.php', 6),
+            [{'filename': '/var/www/index.php', 'lineno': 4}]
+        )
+
+        self.assertEqual(['4'], self.steps)
+
+        # The temporary breakpoint doesn't break later on
+        self.assertEqual(1, engine.get_commands().count('breakpoint_remove'))
+
+    def test_auto_step_until_a_condition_is_true(self):
+        engine = self.run_session('auto_step', ({
+            'command': 'step_over',
+            'count': 100,
+            'condition': '$lineno == 7'
+        },))
+
+        # Only the line the stepping stopped on is refreshed
+        self.assertEqual(['7'], self.steps)
+        self.assertEqual(1, len(self.variables))
+        self.assertEqual(
+            ['Auto stepping stopped after 6 steps, $lineno == 7 is true'],
+            self.logged
+        )
+
+        commands = engine.get_commands()
+        self.assertEqual(6, commands.count('step_over'))
+        # One eval after every step, and the expressions of the refresh
+        self.assertEqual(7, commands.count('eval'))
+
+    def test_auto_step_until_a_watched_value_changes(self):
+        self.run_session('auto_step', ({
+            'command': 'step_into',
+            'count': 0,
+            'watch': '$lineno'
+        },))
+
+        self.assertEqual(['2'], self.steps)
+        self.assertEqual(
+            ['Auto stepping stopped after 1 steps, $lineno changed to 2'],
+            self.logged
+        )
+
+    def test_auto_step_a_number_of_steps(self):
+        engine = self.run_session('auto_step', ({
+            'command': 'step_over',
+            'count': 5
+        },))
+
+        self.assertEqual(['6'], self.steps)
+
+        commands = engine.get_commands()
+        self.assertEqual(5, commands.count('step_over'))
+        self.assertEqual(1, commands.count('eval'))
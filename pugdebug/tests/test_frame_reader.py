@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import socket
+import threading
+import unittest
+
+from pugdebug.frame_reader import PugdebugFrameReader
+
+
+def frame(body):
+    return str(len(body)).encode() + b'\0' + body + b'\0'
+
+
+class CountingSocket():
+    """Wraps a socket and counts the recv calls made on it"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.calls = 0
+
+    def recv_into(self, buffer):
+        self.calls += 1
+        return self.sock.recv_into(buffer)
+
+
+class PugdebugFrameReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine, self.ide = socket.socketpair()
+        self.socket = CountingSocket(self.ide)
+        self.reader = PugdebugFrameReader(self.socket, 1024)
+
+    def tearDown(self):
+        self.engine.close()
+        self.ide.close()
+
+    def send_in_background(self, data):
+        thread = threading.Thread(target=self.engine.sendall, args=(data,))
+        thread.start()
+        return thread
+
+    def test_read_single_frame(self):
+        body = b'<?xml version="1.0" encoding="iso-8859-1"?><init/>'
+        self.engine.sendall(frame(body))
+
+        self.assertEqual(body, self.reader.read_frame())
+
+    def test_read_frames_in_bulk(self):
+        bodies = [b'<response transaction_id="%d"/>' % i for i in range(10)]
+        self.engine.sendall(b''.join(frame(body) for body in bodies))
+
+        frames = []
+        while len(frames) < len(bodies):
+            frames.extend(self.reader.read_frames())
+
+        self.assertEqual(bodies, frames)
+
+    def test_read_frame_split_across_receives(self):
+        body = b'<response>' + b'x' * 5000 + b'</response>'
+        data = frame(body)
+
+        self.engine.sendall(data[:3])
+        self.assertIsNone(self.reader.pop_frame())
+        self.reader.receive()
+        self.assertIsNone(self.reader.pop_frame())
+
+        self.engine.sendall(data[3:])
+        self.assertEqual(body, self.reader.read_frame())
+
+    def test_frame_larger_than_buffer_grows_buffer(self):
+        body = b'a' * 10000
+        thread = self.send_in_background(frame(body) + frame(b'b'))
+
+        self.assertEqual(body, self.reader.read_frame())
+        self.assertEqual(b'b', self.reader.read_frame())
+
+        thread.join()
+
+    def test_closed_connection_raises(self):
+        self.engine.sendall(b'10\0abc')
+        self.engine.close()
+
+        with self.assertRaises(ConnectionResetError):
+            self.reader.read_frame()
+
+    def test_large_messages_need_few_receives(self):
+        # roughly the size of a big context_get reply
+        body = b'<property name="$x" type="string">' * 60000
+        steps = 10
+
+        thread = self.send_in_background(frame(body) * steps)
+
+        for i in range(steps):
+            self.assertEqual(len(body), len(self.reader.read_frame()))
+
+        thread.join()
+
+        # A byte-at-a-time reader would need millions of calls here
+        self.assertLess(self.socket.calls, steps * 1000)
+
+    def test_buffer_shrinks_after_large_frame(self):
+        thread = self.send_in_background(frame(b'a' * 10000))
+
+        self.reader.read_frame()
+        thread.join()
+
+        self.assertEqual(1024, len(self.reader.buffer))
+
+        self.engine.sendall(frame(b'b'))
+        self.assertEqual(b'b', self.reader.read_frame())
+
+    def test_invalid_length_header_raises(self):
+        self.engine.sendall(b'<response/>\0')
+
+        with self.assertRaises(ConnectionError):
+            self.reader.read_frame()
+
+    def test_missing_terminator_raises(self):
+        self.engine.sendall(b'3\0abcd\0')
+
+        with self.assertRaises(ConnectionError):
+            self.reader.read_frame()
+
+    def test_read_frame_in_chunks(self):
+        body = b'<response>' + b'x' * 10000 + b'</response>'
+        thread = self.send_in_background(frame(body) + frame(b'b'))
+
+        chunks = list(self.reader.read_frame_chunks())
+        thread.join()
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(body, b''.join(chunks))
+
+        # The buffer did not grow to fit the whole frame
+        self.assertEqual(1024, len(self.reader.buffer))
+
+        self.assertEqual(b'b', self.reader.read_frame())
@@ -54,6 +54,18 @@ class PugdebugMessageParserTest(unittest.TestCase):
 
         self.assertEqual(expected, result)
 
+    def test_parse_transaction_id(self):
+        message = b'<?xml version="1.0" encoding="iso-8859-1"?>\
+<response xmlns="urn:debugger_protocol_v1" xmlns:xdebug="http://xdebug.org/dbgp/xdebug" command="step_into" transaction_id="28" status="stopping" reason="ok"></response>'
+
+        self.assertEqual(28, self.parser.parse_transaction_id(message))
+
+    def test_parse_transaction_id_of_stream_message(self):
+        message = b'<?xml version="1.0" encoding="iso-8859-1"?>\
+<stream xmlns="urn:debugger_protocol_v1" type="stdout" encoding="base64"><![CDATA[aGk=]]></stream>'
+
+        self.assertIsNone(self.parser.parse_transaction_id(message))
+
     def test_parse_status_stopping_message(self):
         message = '<?xml version="1.0" encoding="iso-8859-1"?>\
 <response xmlns="urn:debugger_protocol_v1" xmlns:xdebug="http://xdebug.org/dbgp/xdebug" command="step_into" transaction_id="28" status="stopping" reason="ok"></response>'
@@ -389,13 +401,38 @@ class PugdebugMessageParserTest(unittest.TestCase):
         self.assertEqual(expected[6], result[6])
         self.assertEqual(expected[6]['variables'][28], result[6]['variables'][28])
 
+    def test_stream_parse_variables_superglobals(self):
+        file = open('./pugdebug/tests/_files/superglobals.xml', 'rb')
+        message = file.read()
+        file.close()
+
+        stream_parser = self.parser.get_variables_stream_parser()
+        for i in range(0, len(message), 7):
+            stream_parser.feed(message[i:i + 7])
+
+        result = stream_parser.close()
+
+        self.assertEqual(self.parser.parse_variables_message(message), result)
+
+    def test_stream_parse_nested_variables(self):
+        message = b'<?xml version="1.0" encoding="iso-8859-1"?>\
+<response xmlns="urn:debugger_protocol_v1" command="context_get" transaction_id="2"><property name="$a" type="array" numchildren="2"><property name="0" type="int"><![CDATA[1]]></property><property name="1" type="object" classname="Foo" numchildren="1"><property name="bar" type="string" size="3" encoding="base64"><![CDATA[YmF6]]></property></property></property><property name="$b" type="null"></property></response>'
+
+        stream_parser = self.parser.get_variables_stream_parser()
+        stream_parser.feed(message)
+
+        result = stream_parser.close()
+
+        self.assertEqual(self.parser.parse_variables_message(message), result)
+        self.assertEqual('YmF6', result[0]['variables'][1]['variables'][0]['value'])
+
     def test_parse_successful_breakpoint_set_message(self):
         message = '<?xml version="1.0" encoding="iso-8859-1"?>\
 <response xmlns="urn:debugger_protocol_v1" xmlns:xdebug="http://xdebug.org/dbgp/xdebug" command="breakpoint_set" transaction_id="9" id="32310001"></response>'
 
         result = self.parser.parse_breakpoint_set_message(message)
 
-        self.assertTrue(result)
+        self.assertEqual(32310001, result)
 
     def test_parse_unsuccessful_breakpoint_set_message(self):
         message = '<?xml version="1.0" encoding="iso-8859-1"?>\
@@ -432,6 +469,8 @@ class PugdebugMessageParserTest(unittest.TestCase):
         expected = [
             {
                 'filename': '/home/robert/www/pugdebug/index.php',
+                'hit_count': '0',
+                'hit_value': '0',
                 'id': '32350002',
                 'lineno': '3',
                 'state': 'enabled',
@@ -439,6 +478,8 @@ class PugdebugMessageParserTest(unittest.TestCase):
             },
             {
                 'filename': '/home/robert/www/pugdebug/index.php',
+                'hit_count': '0',
+                'hit_value': '0',
                 'id': '32350001',
                 'lineno': '10',
                 'state': 'enabled',
@@ -448,6 +489,44 @@ class PugdebugMessageParserTest(unittest.TestCase):
 
         self.assertEqual(expected, result)
 
+    def test_parse_conditional_breakpoint_list_message(self):
+        message = '<?xml version="1.0" encoding="iso-8859-1"?>\
+<response xmlns="urn:debugger_protocol_v1" xmlns:xdebug="http://xdebug.org/dbgp/xdebug" command="breakpoint_list" transaction_id="12"><breakpoint type="conditional" filename="file:///home/robert/www/pugdebug/index.php" lineno="3" state="enabled" hit_count="2" hit_value="500" hit_condition="&gt;=" id="32350002"><expression encoding="base64"><![CDATA[JGlkID09IDQy]]></expression></breakpoint><breakpoint type="call" function="save" class="User" state="enabled" hit_count="0" hit_value="0" id="32350003"></breakpoint><breakpoint type="exception" exception="RuntimeException" state="enabled" hit_count="0" hit_value="0" id="32350004"></breakpoint></response>'
+
+        result = self.parser.parse_breakpoint_list_message(message)
+
+        expected = [
+            {
+                'expression': '$id == 42',
+                'filename': '/home/robert/www/pugdebug/index.php',
+                'hit_condition': '>=',
+                'hit_count': '2',
+                'hit_value': '500',
+                'id': '32350002',
+                'lineno': '3',
+                'state': 'enabled',
+                'type': 'conditional'
+            },
+            {
+                'function': 'User::save',
+                'hit_count': '0',
+                'hit_value': '0',
+                'id': '32350003',
+                'state': 'enabled',
+                'type': 'call'
+            },
+            {
+                'exception': 'RuntimeException',
+                'hit_count': '0',
+                'hit_value': '0',
+                'id': '32350004',
+                'state': 'enabled',
+                'type': 'exception'
+            }
+        ]
+
+        self.assertEqual(expected, result)
+
     def test_parse_stacktraces_message(self):
         message = '<?xml version="1.0" encoding="iso-8859-1"?>\
 <response xmlns="urn:debugger_protocol_v1" xmlns:xdebug="http://xdebug.org/dbgp/xdebug" command="stack_get" transaction_id="118"><stack where="{main}" level="0" type="file" filename="file:///home/robert/www/pugdebug/index.php" lineno="30"></stack></response>'
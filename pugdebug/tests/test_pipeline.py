@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import socket
+import threading
+import time
+import unittest
+
+from xml.etree.ElementTree import ParseError
+
+from pugdebug.frame_reader import PugdebugFrameReader
+from pugdebug.message_parser import PugdebugMessageParser
+from pugdebug.pipeline import PugdebugCommandPipeline
+from pugdebug.models.timings import PugdebugTimings
+
+
+def frame(message):
+    return str(len(message)).encode() + b'\0' + message + b'\0'
+
+
+def response(command, transaction_id, body=''):
+    message = ('<?xml version="1.0" encoding="iso-8859-1"?>'
+               '<response xmlns="urn:debugger_protocol_v1" command="%s" '
+               'transaction_id="%d">%s</response>') % (
+                   command, transaction_id, body
+               )
+    return frame(message.encode('iso-8859-1'))
+
+
+def respond_to_commands(engine, count, close_after=None):
+    """Answer commands one by one, like xdebug does
+
+    Every command is read and answered before the next one is read. If
+    close_after is given, the socket is closed after that many responses.
+    """
+    data = b''
+    answered = 0
+
+    while answered < count:
+        chunk = engine.recv(4096)
+        if not chunk:
+            return
+        data += chunk
+
+        while b'\0' in data:
+            command, data = data.split(b'\0', 1)
+            name, transaction_id = command.split(b' ')[0:3:2]
+
+            if answered == close_after:
+                engine.shutdown(socket.SHUT_RDWR)
+                return
+
+            engine.sendall(response(name.decode(), int(transaction_id)))
+            answered += 1
+
+
+class PugdebugCommandPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine, self.ide = socket.socketpair()
+        self.parser = PugdebugMessageParser()
+        self.pipeline = PugdebugCommandPipeline(
+            self.ide,
+            PugdebugFrameReader(self.ide),
+            self.parser
+        )
+
+    def tearDown(self):
+        self.engine.close()
+        self.ide.close()
+
+    def test_queued_commands_are_sent_together(self):
+        self.pipeline.queue('stack_get')
+        self.pipeline.queue('context_get', '-c 1')
+        self.pipeline.queue('eval', data='$x')
+
+        self.pipeline.flush()
+
+        self.assertEqual(
+            b'stack_get -i 1\0context_get -i 2 -c 1\0eval -i 3 -- JHg=\0',
+            self.engine.recv(1024)
+        )
+
+    def test_responses_are_matched_by_transaction_id(self):
+        stack = self.pipeline.queue(
+            'stack_get',
+            callback=lambda message: 'stack'
+        )
+        context = self.pipeline.queue('context_get')
+        self.pipeline.flush()
+
+        self.engine.sendall(
+            response('context_get', 2) +
+            frame(b'<stream type="stdout">aGk=</stream>') +
+            response('stack_get', 1)
+        )
+
+        self.pipeline.wait([stack, context])
+
+        self.assertEqual('stack', stack.result())
+        self.assertIn(b'command="context_get"', context.result())
+        self.assertEqual({}, self.pipeline.pending)
+
+    def test_execute_returns_the_parsed_result(self):
+        self.engine.sendall(response('breakpoint_set', 1))
+
+        result = self.pipeline.execute(
+            'breakpoint_set',
+            '-t line -f /tmp/index.php -n 3',
+            callback=self.parser.parse_breakpoint_set_message
+        )
+
+        self.assertTrue(result)
+        self.assertEqual(
+            b'breakpoint_set -i 1 -t line -f /tmp/index.php -n 3\0',
+            self.engine.recv(1024)
+        )
+
+    def test_callback_errors_are_raised_from_the_result(self):
+        def callback(message):
+            raise ValueError('bad message')
+
+        future = self.pipeline.queue('stack_get', callback=callback)
+        self.engine.sendall(response('stack_get', 1))
+
+        self.pipeline.wait([future])
+
+        with self.assertRaises(ValueError):
+            future.result()
+
+    def test_streamed_responses_are_fed_to_the_parser(self):
+        body = ''.join(
+            '<property name="$x%d" type="int"><![CDATA[%d]]></property>' % (
+                i, i
+            ) for i in range(5000)
+        )
+
+        variables = self.pipeline.queue(
+            'context_get',
+            stream_parser=self.parser.get_variables_stream_parser
+        )
+        stack = self.pipeline.queue('stack_get')
+        self.pipeline.flush()
+
+        thread = threading.Thread(
+            target=self.engine.sendall,
+            args=(response('context_get', 1, body) +
+                  response('stack_get', 2),)
+        )
+        thread.start()
+
+        self.pipeline.wait([variables, stack])
+        thread.join()
+
+        self.assertEqual(5000, len(variables.result()))
+        self.assertEqual({'name': '$x4999', 'type': 'int', 'value': '4999'},
+                         variables.result()[-1])
+        self.assertIn(b'command="stack_get"', stack.result())
+
+        # The large response was never held in the buffer in one piece
+        self.assertEqual(65536, len(self.pipeline.frame_reader.buffer))
+
+    def test_stream_parser_errors_are_raised_from_the_result(self):
+        variables = self.pipeline.queue(
+            'context_get',
+            stream_parser=self.parser.get_variables_stream_parser
+        )
+        stack = self.pipeline.queue('stack_get')
+        self.pipeline.flush()
+
+        self.engine.sendall(
+            response('context_get', 1, '<property type="int"></x>') +
+            response('stack_get', 2)
+        )
+
+        self.pipeline.wait([variables, stack])
+
+        with self.assertRaises(ParseError):
+            variables.result()
+        self.assertIn(b'command="stack_get"', stack.result())
+
+    def test_commands_are_timed(self):
+        timings = PugdebugTimings()
+        self.pipeline.timings = timings
+
+        variables = self.pipeline.queue(
+            'context_get',
+            '-c 0',
+            stream_parser=self.parser.get_variables_stream_parser
+        )
+        stack = self.pipeline.queue('stack_get')
+        self.pipeline.flush()
+
+        context_get = response(
+            'context_get',
+            1,
+            '<property name="$x" type="int"><![CDATA[1]]></property>'
+        )
+        stack_get = response('stack_get', 2)
+        self.engine.sendall(context_get + stack_get)
+
+        self.pipeline.wait([variables, stack])
+
+        commands = timings.to_dict()['commands']
+
+        self.assertEqual(['context_get', 'stack_get'], sorted(commands))
+
+        for name, message in [('context_get', context_get),
+                              ('stack_get', stack_get)]:
+            command = commands[name]
+
+            self.assertEqual(1, command['total']['count'])
+            self.assertEqual(len(message.split(b'\0')[1]),
+                             command['bytes_received'])
+
+        self.assertEqual(len(b'context_get -i 1 -c 0\0'),
+                         commands['context_get']['bytes_sent'])
+        self.assertEqual(len(b'stack_get -i 2\0'),
+                         commands['stack_get']['bytes_sent'])
+
+    def test_interrupt_is_sent_while_waiting(self):
+        run = self.pipeline.queue('run')
+        self.pipeline.flush()
+        self.assertEqual(b'run -i 1\0', self.engine.recv(1024))
+
+        waiter = threading.Thread(target=self.pipeline.wait, args=([run],))
+        waiter.start()
+
+        interrupt = self.pipeline.interrupt('break')
+        self.assertEqual(b'break -i 2\0', self.engine.recv(1024))
+
+        self.engine.sendall(response('break', 2) + response('run', 1))
+        waiter.join(5)
+
+        self.assertTrue(run.done())
+        self.assertTrue(interrupt.done())
+        self.assertEqual({}, self.pipeline.pending)
+
+    def test_commands_time_out(self):
+        slow = self.pipeline.queue('eval', data='sleep(60)', timeout=0.1)
+        fast = self.pipeline.queue('stack_get', timeout=5)
+
+        self.pipeline.wait([slow])
+
+        with self.assertRaises(TimeoutError):
+            slow.result()
+        self.assertFalse(fast.done())
+
+        # The late response of the timed out command is ignored
+        self.engine.sendall(response('eval', 1) + response('stack_get', 2))
+        self.pipeline.wait([fast])
+
+        self.assertIn(b'command="stack_get"', fast.result())
+        self.assertEqual({}, self.pipeline.pending)
+
+    def test_timeout_starts_once_the_previous_command_is_responded_to(self):
+        step = self.pipeline.queue('step_over')
+        first = self.pipeline.queue('context_get', timeout=1)
+        second = self.pipeline.queue('eval', timeout=0.3)
+
+        def respond():
+            # The step and each response take longer than the timeout of
+            # the eval, but the eval itself is responded to right away
+            time.sleep(0.4)
+            self.engine.sendall(response('step_over', 1))
+            time.sleep(0.4)
+            self.engine.sendall(response('context_get', 2))
+            self.engine.sendall(response('eval', 3))
+
+        engine = threading.Thread(target=respond)
+        engine.start()
+
+        self.pipeline.wait([step, first, second])
+        engine.join()
+
+        self.assertIn(b'command="context_get"', first.result())
+        self.assertIn(b'command="eval"', second.result())
+
+    def test_large_batch_does_not_deadlock(self):
+        count = 5000
+
+        for socket_ in (self.engine, self.ide):
+            socket_.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+            socket_.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+
+        engine = threading.Thread(
+            target=respond_to_commands,
+            args=(self.engine, count)
+        )
+        engine.start()
+
+        futures = [
+            self.pipeline.queue(
+                'breakpoint_set',
+                '-t line -f /var/www/index.php -n %d' % line,
+                callback=self.parser.parse_breakpoint_set_message
+            )
+            for line in range(count)
+        ]
+        self.pipeline.wait(futures)
+
+        engine.join()
+
+        self.assertTrue(all(future.result() for future in futures))
+        self.assertEqual({}, self.pipeline.pending)
+
+    def test_closed_connection_fails_pending_commands(self):
+        engine = threading.Thread(
+            target=respond_to_commands,
+            args=(self.engine, 10, 5)
+        )
+        engine.start()
+
+        futures = [self.pipeline.queue('stack_get') for i in range(10)]
+
+        with self.assertRaises(ConnectionResetError):
+            self.pipeline.wait(futures)
+
+        engine.join()
+
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(5, len([
+            future for future in futures if future.exception() is None
+        ]))
+        self.assertIsInstance(futures[-1].exception(), ConnectionResetError)
+        self.assertEqual({}, self.pipeline.pending)
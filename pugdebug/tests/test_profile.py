@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import os
+import tempfile
+import unittest
+
+from pugdebug.models.profile import (PugdebugProfile, PugdebugProfileDiff,
+                                     read_cachegrind, parse_cachegrind,
+                                     format_line_costs)
+
+cachegrind = b"""version: 1
+creator: xdebug 2.9.8 (PHP 7.4.3)
+cmd: /var/www/index.php
+part: 1
+positions: line
+
+events: Time Memory
+
+fl=(1) /var/www/user.php
+fn=(1) User->load
+12 300 64
++2 100 0
+
+fl=(2) php:internal
+fn=(2) php::strlen
+0 5 0
+
+fl=(3) /var/www/index.php
+fn=(3) {main}
+1 50 16
+cfl=(1)
+cfn=(1)
+calls=2 0 0
+5 400 64
+cfl=(2)
+cfn=(2)
+calls=1 0 0
+* 5 0
++1 20 0
+
+summary: 480 80
+"""
+
+
+class PugdebugProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = parse_cachegrind(iter(cachegrind.splitlines(True)))
+
+    def test_header_is_read(self):
+        self.assertEqual('/var/www/index.php', self.profile.cmd)
+        self.assertEqual(['Time', 'Memory'], self.profile.events)
+        self.assertEqual(480, self.profile.get_total(0))
+        self.assertEqual(80, self.profile.get_total(1))
+
+    def test_compressed_names_are_resolved(self):
+        self.assertEqual(3, self.profile.get_function_count())
+
+        main = self.profile.find_function('/var/www/index.php', '{main}')
+        load = self.profile.find_function('/var/www/user.php', 'User->load')
+        strlen = self.profile.find_function('php:internal', 'php::strlen')
+
+        self.assertEqual([load, strlen],
+                         list(self.profile.get_callees(main)))
+        self.assertEqual(12, self.profile.get_function_line(load))
+        self.assertEqual(1, self.profile.get_function_line(main))
+
+    def test_self_and_inclusive_costs(self):
+        main = self.profile.find_function('/var/www/index.php', '{main}')
+        load = self.profile.find_function('/var/www/user.php', 'User->load')
+        strlen = self.profile.find_function('php:internal', 'php::strlen')
+
+        self.assertEqual(70, self.profile.self_costs[0][main])
+        self.assertEqual(475, self.profile.inclusive_costs[0][main])
+        self.assertEqual(400, self.profile.self_costs[0][load])
+        self.assertEqual(400, self.profile.inclusive_costs[0][load])
+        self.assertEqual(64, self.profile.inclusive_costs[1][load])
+
+        self.assertEqual(2, self.profile.calls[load])
+        self.assertEqual(1, self.profile.calls[strlen])
+        self.assertEqual(0, self.profile.calls[main])
+
+        self.assertEqual([2, 400, 64], self.profile.get_callers(load)[main])
+
+    def test_line_costs_include_calls(self):
+        self.assertEqual(
+            {1: 50, 5: 405, 6: 20},
+            self.profile.get_line_costs('/var/www/index.php')
+        )
+        self.assertEqual(
+            {12: 300, 14: 100},
+            self.profile.get_line_costs('/var/www/user.php')
+        )
+        self.assertEqual({}, self.profile.get_line_costs('/var/www/none.php'))
+        self.assertEqual(
+            {12: '62.5%', 14: '20.8%'},
+            format_line_costs(self.profile, '/var/www/user.php')
+        )
+
+    def test_file_is_read_memory_mapped(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(cachegrind)
+
+        try:
+            profile = read_cachegrind(f.name)
+        finally:
+            os.unlink(f.name)
+
+        self.assertEqual(3, profile.get_function_count())
+
+    def test_not_a_cachegrind_file_is_refused(self):
+        with self.assertRaises(ValueError):
+            parse_cachegrind(iter([b'<?php echo 1;\n']))
+
+    def test_many_functions(self):
+        lines = [b'events: Time\n']
+
+        for i in range(100000):
+            lines.append(b'fl=(%d) /var/www/file%d.php\n' % (i % 100, i % 100)
+                         if i < 100 else b'fl=(%d)\n' % (i % 100))
+            lines.append(b'fn=(%d) function%d\n' % (i, i))
+            lines.append(b'%d %d\n' % (i % 1000 + 1, i))
+
+        profile = parse_cachegrind(iter(lines))
+
+        self.assertEqual(100000, profile.get_function_count())
+        self.assertEqual(99999, profile.self_costs[0][99999])
+        self.assertEqual(
+            '/var/www/file99.php',
+            profile.get_function_file(99999)
+        )
+
+
+class PugdebugProfileDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        before = parse_cachegrind(iter(cachegrind.splitlines(True)))
+        after = parse_cachegrind(iter(
+            cachegrind
+            .replace(b'12 300 64', b'12 600 64')
+            .replace(b'5 400 64', b'5 700 64')
+            .replace(b'php::strlen', b'php::mb_strlen')
+            .splitlines(True)
+        ))
+
+        self.diff = PugdebugProfileDiff(before, after)
+
+    def get_row(self, name):
+        for row in range(len(self.diff)):
+            if self.diff.get_function_name(row) == name:
+                return row
+
+    def test_functions_are_aligned(self):
+        self.assertEqual(4, len(self.diff))
+
+        load = self.get_row('User->load')
+
+        self.assertEqual(400, self.diff.before_inclusive[load])
+        self.assertEqual(700, self.diff.after_inclusive[load])
+        self.assertEqual(300, self.diff.inclusive_deltas[load])
+        self.assertEqual(300, self.diff.self_deltas[load])
+        self.assertEqual(75.0, self.diff.get_relative_delta(load))
+
+    def test_new_and_removed_functions(self):
+        new = self.get_row('php::mb_strlen')
+        removed = self.get_row('php::strlen')
+
+        self.assertIsNone(self.diff.get_relative_delta(new))
+        self.assertEqual(-100.0, self.diff.get_relative_delta(removed))
+        self.assertIs(self.diff.before,
+                      self.diff.get_profile_function(removed)[0])
+
+    def test_largest_regression_first(self):
+        self.assertEqual(
+            ['User->load', '{main}', 'php::mb_strlen', 'php::strlen'],
+            [self.diff.get_function_name(row)
+             for row in self.diff.get_regressions()]
+        )
+
+    def test_xdebug_2_and_xdebug_3_profiles_are_compared(self):
+        xdebug_3 = parse_cachegrind(iter(
+            cachegrind
+            .replace(b'events: Time Memory',
+                     b'events: Time_(10ns) Memory_(bytes)')
+            .replace(b'12 300 64', b'12 60000 64')
+            .replace(b'+2 100 0', b'+2 10000 0')
+            .splitlines(True)
+        ))
+
+        diff = PugdebugProfileDiff(self.diff.before, xdebug_3)
+        self.diff = diff
+
+        load = self.get_row('User->load')
+
+        # The microseconds of Xdebug 2 are compared as 10 nanoseconds
+        self.assertEqual('Time_(10ns)', diff.event)
+        self.assertEqual(40000, diff.before_self[load])
+        self.assertEqual(70000, diff.after_self[load])
+        self.assertEqual(75.0, diff.get_relative_delta(load))
+
+        memory = PugdebugProfileDiff(self.diff.before, xdebug_3, 1)
+
+        self.assertEqual('Memory_(bytes)', memory.event)
+        self.assertEqual(0, memory.inclusive_deltas[load])
+
+    def test_trace_is_compared_with_a_profile(self):
+        trace = PugdebugProfile()
+        trace.set_events(['Time', 'Memory'])
+
+        # A trace tells only where a function is called from
+        load = trace.get_function_index(
+            trace.get_file_index('/var/www/index.php'),
+            'User->load'
+        )
+        trace.self_costs[0][load] = 500
+        trace.inclusive_costs[0][load] = 500
+
+        self.diff = PugdebugProfileDiff(self.diff.before, trace)
+
+        self.assertEqual(3, len(self.diff))
+
+        load = self.get_row('User->load')
+
+        self.assertEqual(400, self.diff.before_inclusive[load])
+        self.assertEqual(500, self.diff.after_inclusive[load])
+
+    def test_profiles_without_a_common_event_are_refused(self):
+        other = parse_cachegrind(iter([b'events: Memory\n']))
+
+        with self.assertRaises(ValueError):
+            PugdebugProfileDiff(other, self.diff.after)
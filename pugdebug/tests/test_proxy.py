@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import socket
+import threading
+import unittest
+
+from pugdebug.frame_reader import PugdebugFrameReader
+from pugdebug.proxy import (PugdebugProxy, register_with_proxy,
+                            unregister_from_proxy, get_idekey, set_proxied)
+from pugdebug.tests.synthetic import frame, init_message, response
+
+
+class PugdebugProxyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = PugdebugProxy(('127.0.0.1', 0), ('127.0.0.1', 0), 2)
+        self.proxy.bind()
+
+        self.thread = threading.Thread(target=self.proxy.serve_forever)
+        self.thread.start()
+
+        self.proxy_address = ('127.0.0.1', self.proxy.get_ide_port())
+
+        self.ide_server = socket.socket()
+        self.ide_server.bind(('127.0.0.1', 0))
+        self.ide_server.listen(1)
+        self.ide_server.settimeout(5)
+
+    def tearDown(self):
+        self.proxy.stop()
+        self.thread.join()
+        self.ide_server.close()
+
+    def connect_engine(self, idekey):
+        engine = socket.create_connection(
+            ('127.0.0.1', self.proxy.get_engine_port())
+        )
+        engine.settimeout(5)
+        engine.sendall(frame(init_message(idekey)))
+
+        return engine
+
+    def test_sessions_are_passed_to_the_registered_ide(self):
+        register_with_proxy(
+            self.proxy_address,
+            self.ide_server.getsockname()[1],
+            'alice'
+        )
+
+        engine = self.connect_engine('alice')
+        ide, address = self.ide_server.accept()
+        ide.settimeout(5)
+
+        try:
+            init = PugdebugFrameReader(ide).read_frame()
+
+            self.assertEqual('alice', get_idekey(init))
+            self.assertIn(b'proxied="127.0.0.1"', init)
+
+            ide.sendall(b'stack_get -i 1\0')
+            self.assertEqual(b'stack_get -i 1\0', engine.recv(1024))
+
+            engine.sendall(frame(response('stack_get', 1, b'')))
+            self.assertIn(
+                b'command="stack_get"',
+                PugdebugFrameReader(ide).read_frame()
+            )
+
+            # Closing the engine side closes the IDE side too
+            engine.close()
+            self.assertEqual(b'', ide.recv(1024))
+        finally:
+            engine.close()
+            ide.close()
+
+    def test_sessions_of_unknown_idekeys_are_closed(self):
+        register_with_proxy(
+            self.proxy_address,
+            self.ide_server.getsockname()[1],
+            'alice'
+        )
+        unregister_from_proxy(self.proxy_address, 'alice')
+
+        engine = self.connect_engine('alice')
+
+        try:
+            self.assertEqual(b'', engine.recv(1024))
+        finally:
+            engine.close()
+
+    def test_registration_without_idekey_is_refused(self):
+        with self.assertRaises(ConnectionError):
+            register_with_proxy(self.proxy_address, 9000, '')
+
+    def test_proxied_address_is_added_to_the_init_message(self):
+        message = set_proxied(init_message('bob'), '10.0.0.1')
+
+        self.assertIn(b'<init proxied="10.0.0.1" ', message)
+        self.assertEqual('bob', get_idekey(message))
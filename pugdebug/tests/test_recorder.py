@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from pugdebug.frame_reader import PugdebugFrameReader
+from pugdebug.recorder import (PugdebugSessionRecorder,
+                               PugdebugRecordingSocket,
+                               SENT, RECEIVED, read_recording)
+from pugdebug.replay import PugdebugSessionReplay
+
+
+def frame(message):
+    return str(len(message)).encode() + b'\0' + message + b'\0'
+
+
+def response(command, transaction_id, body=b''):
+    return (b'<response xmlns="urn:debugger_protocol_v1" command="%s" '
+            b'transaction_id="%d">%s</response>') % (
+                command, transaction_id, body
+            )
+
+
+class PugdebugSessionRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'session.dbgp.gz')
+
+        self.engine, ide = socket.socketpair()
+        self.socket = PugdebugRecordingSocket(
+            ide,
+            PugdebugSessionRecorder(self.path)
+        )
+
+    def tearDown(self):
+        self.engine.close()
+        self.socket.close()
+        shutil.rmtree(self.directory)
+
+    def test_commands_and_frames_are_recorded(self):
+        reader = PugdebugFrameReader(self.socket, 16)
+
+        init = b'<init idekey="pugdebug"/>'
+        self.engine.sendall(frame(init))
+        reader.read_frame()
+
+        self.socket.sendall(b'stack_get -i 1\0context_get -i 2 -c 0\0')
+
+        stack = response(b'stack_get', 1)
+        context = response(b'context_get', 2, b'x' * 100)
+
+        # The second frame arrives in pieces
+        data = frame(stack) + frame(context)
+        self.engine.sendall(data[:50])
+        reader.receive()
+        self.engine.sendall(data[50:])
+        reader.read_frame()
+        reader.read_frame()
+
+        self.socket.close()
+
+        records = read_recording(self.path)
+
+        self.assertEqual([
+            (RECEIVED, init),
+            (SENT, b'stack_get -i 1'),
+            (SENT, b'context_get -i 2 -c 0'),
+            (RECEIVED, stack),
+            (RECEIVED, context),
+        ], [(direction, message) for direction, time, message in records])
+
+        times = [time for direction, time, message in records]
+        self.assertEqual(sorted(times), times)
+
+    def test_replay_answers_with_recorded_responses(self):
+        records = [
+            (RECEIVED, 0.0, b'<init idekey="pugdebug"/>'),
+            (SENT, 0.1, b'step_into -i 1'),
+            (RECEIVED, 0.2, b'<stream type="stdout">aGk=</stream>'),
+            (RECEIVED, 0.3, response(b'step_into', 1, b'<a/>')),
+            (SENT, 0.4, b'context_get -i 2 -c 0'),
+            (SENT, 0.4, b'context_get -i 3 -c 1'),
+            (RECEIVED, 0.5, response(b'context_get', 2, b'<locals/>')),
+            (RECEIVED, 0.6, response(b'context_get', 3, b'<globals/>')),
+        ]
+
+        replay = PugdebugSessionReplay(records, speed=0)
+
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+
+        thread = threading.Thread(
+            target=replay.replay,
+            args=server.getsockname()
+        )
+        thread.start()
+
+        ide, address = server.accept()
+        self.addCleanup(ide.close)
+
+        reader = PugdebugFrameReader(ide)
+        self.assertEqual(b'<init idekey="pugdebug"/>', reader.read_frame())
+
+        # Matched by the arguments, not by the recorded order
+        ide.sendall(b'context_get -i 10 -c 1\0')
+        self.assertEqual(
+            response(b'context_get', 10, b'<globals/>'),
+            reader.read_frame()
+        )
+
+        ide.sendall(b'step_into -i 11\0')
+        self.assertEqual(b'<stream type="stdout">aGk=</stream>',
+                         reader.read_frame())
+        self.assertEqual(response(b'step_into', 11, b'<a/>'),
+                         reader.read_frame())
+
+        ide.sendall(b'stack_get -i 12\0')
+        self.assertIn(b'<error code="4">', reader.read_frame())
+
+        ide.close()
+        thread.join()
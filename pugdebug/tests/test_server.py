@@ -0,0 +1,743 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import socket
+import threading
+import time
+import unittest
+
+from PyQt5.QtCore import QCoreApplication, Qt
+
+from pugdebug.server import (PugdebugServer, PugdebugServerConnection,
+                             PugdebugConnectionWorker)
+from pugdebug.proxy import PugdebugProxy
+from pugdebug.models.settings import get_setting, set_setting
+
+application = QCoreApplication.instance() or QCoreApplication([])
+
+RESPONSES = {
+    'context_names': '<context name="Locals" id="0"/>'
+                     '<context name="Superglobals" id="1"/>',
+    'context_get': '<property name="$x" type="int"><![CDATA[%(c)s]]>'
+                   '</property>',
+    'stack_get': '<stack where="{main}" level="0" type="file" '
+                 'filename="file:///var/www/index.php" lineno="3"/>',
+    'eval': '<property type="string" size="2" encoding="base64">'
+            '<![CDATA[aGk=]]></property>',
+    'breakpoint_list': '<breakpoint type="line" '
+                       'filename="file:///var/www/index.php" lineno="3" '
+                       'state="enabled" id="10"/>',
+}
+
+STEP_COMMANDS = ['run', 'step_into', 'step_over', 'step_out']
+
+
+def frame(message):
+    message = message.encode('iso-8859-1')
+    return str(len(message)).encode() + b'\0' + message + b'\0'
+
+
+def init_message(idekey='pugdebug'):
+    return frame('<?xml version="1.0" encoding="iso-8859-1"?>'
+                 '<init xmlns="urn:debugger_protocol_v1" '
+                 'fileuri="file:///var/www/index.php" language="PHP" '
+                 'protocol_version="1.0" idekey="%s"></init>' % idekey)
+
+
+def typemap_response(transaction_id):
+    return frame('<?xml version="1.0" encoding="iso-8859-1"?>'
+                 '<response xmlns="urn:debugger_protocol_v1" '
+                 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                 'command="typemap_get" transaction_id="%s">'
+                 '<map name="int" type="int" xsi:type="xsd:decimal"/>'
+                 '</response>' % transaction_id)
+
+
+def get_free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def parse_command(command):
+    parts = command.decode().split(' ')
+    arguments = dict(zip(parts[1::2], parts[2::2]))
+    return parts[0], arguments
+
+
+class RecordingSocket():
+    """Wraps a socket and records every write made to it"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.writes = []
+
+    def sendall(self, data):
+        self.writes.append(data)
+        self.sock.sendall(data)
+
+    def recv_into(self, buffer):
+        return self.sock.recv_into(buffer)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+
+class FakeEngine(threading.Thread):
+    """Answers commands with canned responses"""
+
+    def __init__(self, sock):
+        super(FakeEngine, self).__init__()
+        self.sock = sock
+        self.commands = []
+
+        # Commands that are not answered until a break
+        self.hold = set()
+        self.held = []
+
+    def run(self):
+        data = b''
+        while True:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                return
+            data += chunk
+
+            while b'\0' in data:
+                command, data = data.split(b'\0', 1)
+                self.commands.append(command)
+                self.respond(*parse_command(command))
+
+    def respond(self, name, arguments):
+        if name in self.hold:
+            self.held.append((name, arguments))
+            return
+
+        self.send_response(name, arguments)
+
+        if name == 'break':
+            for held in self.held:
+                self.send_response(*held)
+            self.held = []
+
+    def send_response(self, name, arguments):
+        body = RESPONSES.get(name, '') % {'c': arguments.get('-c')}
+        status = ' status="break" reason="ok"' if name in STEP_COMMANDS else ''
+        if name == 'breakpoint_set':
+            status = ' id="%s"' % arguments['-i']
+        message = ('<?xml version="1.0" encoding="iso-8859-1"?>'
+                   '<response xmlns="urn:debugger_protocol_v1" '
+                   'command="%s" transaction_id="%s"%s>%s</response>') % (
+                       name, arguments['-i'], status, body
+                   )
+        self.sock.sendall(frame(message))
+
+
+class PugdebugServerConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        engine, ide = socket.socketpair()
+
+        self.socket = RecordingSocket(ide)
+        self.connection = PugdebugServerConnection(self.socket)
+
+        self.engine = FakeEngine(engine)
+        self.engine.start()
+
+        self.engine_socket = engine
+
+    def tearDown(self):
+        self.socket.close()
+        self.engine.join()
+        self.engine_socket.close()
+
+    def test_post_step_sends_one_batch(self):
+        # Read the variable contexts on the first step
+        self.connection.perform('post_step', {'expressions': []})
+        self.socket.writes = []
+
+        results = {}
+        self.connection.got_variables_signal.connect(
+            lambda variables, generation: results.update(variables=variables)
+        )
+        self.connection.got_stacktraces_signal.connect(
+            lambda stacktraces, generation: results.update(
+                stacktraces=stacktraces
+            )
+        )
+        self.connection.expressions_evaluated_signal.connect(
+            lambda expressions, generation: results.update(
+                expressions=expressions
+            )
+        )
+
+        self.connection.perform('post_step', {'expressions': ['$a', '$b']})
+
+        self.assertEqual(1, len(self.socket.writes))
+        commands = self.socket.writes[0].split(b'\0')[:-1]
+        self.assertEqual(
+            [b'context_get', b'context_get', b'stack_get', b'eval', b'eval'],
+            [command.split(b' ')[0] for command in commands]
+        )
+
+        self.assertEqual({
+            'Locals': [{'name': '$x', 'type': 'int', 'value': '0'}],
+            'Superglobals': [{'name': '$x', 'type': 'int', 'value': '1'}],
+        }, results['variables'])
+        self.assertEqual([{
+            'filename': '/var/www/index.php',
+            'lineno': '3',
+            'where': '{main}',
+            'level': '0'
+        }], results['stacktraces'])
+        self.assertEqual(2, len(results['expressions']))
+        self.assertEqual('aGk=', results['expressions'][1]['value'])
+
+    def test_stale_post_step_is_skipped(self):
+        results = []
+        self.connection.got_variables_signal.connect(
+            lambda variables, generation: results.append(generation)
+        )
+
+        # Two steps were started, the refresh for the first one is stale
+        self.connection.step_generation = 2
+
+        self.connection.perform('post_step', {
+            'expressions': [],
+            'generation': 1
+        })
+        self.assertEqual([], self.socket.writes)
+
+        self.connection.perform('post_step', {
+            'expressions': [],
+            'generation': 2
+        })
+        self.assertEqual([2], results)
+
+    def test_step_fetches_state_in_one_signal(self):
+        stepped = []
+        fetched = []
+        self.connection.stepped_signal.connect(stepped.append)
+        self.connection.stepped_and_fetched_signal.connect(fetched.append)
+
+        self.connection.set_expressions(['$a'])
+        self.connection.perform('step_over', {
+            'generation': 0,
+            'fetch_state': True
+        })
+
+        self.assertEqual([], stepped)
+        self.assertEqual(1, len(fetched))
+
+        state = fetched[0]
+        self.assertEqual('break', state['step']['status'])
+        self.assertEqual(0, state['generation'])
+        self.assertEqual(['Locals', 'Superglobals'],
+                         sorted(state['variables'].keys()))
+        self.assertEqual(1, len(state['stacktraces']))
+        self.assertEqual('aGk=', state['expressions'][0]['value'])
+
+        # The expressions are evaluated with the step, no refresh is needed
+        self.assertEqual(
+            [b'step_over', b'context_names', b'context_get', b'context_get',
+             b'stack_get', b'eval'],
+            [command.split(b' ')[0] for command in self.engine.commands]
+        )
+
+    def test_step_without_fetching_state(self):
+        stepped = []
+        fetched = []
+        self.connection.stepped_signal.connect(stepped.append)
+        self.connection.stepped_and_fetched_signal.connect(fetched.append)
+
+        self.connection.perform('step_into', {
+            'generation': 0,
+            'fetch_state': False
+        })
+
+        self.assertEqual([], fetched)
+        self.assertEqual('break', stepped[0]['status'])
+        self.assertEqual(0, stepped[0]['generation'])
+
+    def test_pause_breaks_the_running_script(self):
+        self.engine.hold = {'run'}
+
+        stepped = []
+        self.connection.stepped_signal.connect(
+            stepped.append,
+            Qt.DirectConnection
+        )
+
+        # Nothing is running yet
+        self.assertFalse(self.connection.pause())
+
+        thread = threading.Thread(
+            target=self.connection.perform,
+            args=('step_run', {'generation': 0, 'fetch_state': False})
+        )
+        thread.start()
+
+        self.assertTrue(wait_until(lambda: len(self.engine.held) == 1))
+        self.assertTrue(self.connection.pause())
+
+        thread.join(5)
+
+        self.assertEqual(1, len(stepped))
+        self.assertEqual('break', stepped[0]['status'])
+        self.assertIsNone(self.connection.continuation)
+        self.assertEqual(
+            [b'run', b'break'],
+            [command.split(b' ')[0] for command in self.engine.commands]
+        )
+
+    def test_slow_eval_times_out_without_dropping_the_connection(self):
+        timeout = get_setting('debugger/eval_timeout')
+        set_setting('debugger/eval_timeout', 1)
+        self.addCleanup(set_setting, 'debugger/eval_timeout', timeout)
+
+        self.engine.hold = {'eval'}
+
+        evaluated = []
+        errors = []
+        listed = []
+        self.connection.expression_evaluated_signal.connect(
+            lambda index, result: evaluated.append(result),
+            Qt.DirectConnection
+        )
+        self.connection.connection_error_signal.connect(
+            lambda action, error: errors.append(error),
+            Qt.DirectConnection
+        )
+        self.connection.listed_breakpoints_signal.connect(
+            listed.append,
+            Qt.DirectConnection
+        )
+
+        self.connection.perform('evaluate_expression', (0, 'sleep(60)'))
+
+        self.assertEqual('error', evaluated[0]['type'])
+        self.assertIn('timed out', evaluated[0]['value'])
+        self.assertEqual([], errors)
+
+        # The late response is ignored
+        self.engine.send_response(*self.engine.held.pop())
+        self.connection.perform('breakpoint_list', None)
+
+        self.assertEqual([], errors)
+        self.assertEqual(1, len(listed))
+
+    def test_slow_refresh_times_out_without_dropping_the_connection(self):
+        timeout = get_setting('debugger/command_timeout')
+        set_setting('debugger/command_timeout', 1)
+        self.addCleanup(set_setting, 'debugger/command_timeout', timeout)
+
+        self.engine.hold = {'stack_get'}
+
+        logged = []
+        errors = []
+        self.connection.logged_signal.connect(
+            logged.append,
+            Qt.DirectConnection
+        )
+        self.connection.connection_error_signal.connect(
+            lambda action, error: errors.append(error),
+            Qt.DirectConnection
+        )
+
+        self.connection.perform('post_step', {'expressions': []})
+
+        self.assertEqual([], errors)
+        self.assertEqual(1, len(logged))
+        self.assertIn('stack_get timed out', logged[0])
+
+    def test_refused_breakpoint_removal_is_signalled(self):
+        removed = []
+        failed = []
+        self.connection.removed_breakpoint_signal.connect(
+            removed.append,
+            Qt.DirectConnection
+        )
+        self.connection.remove_breakpoint_failed_signal.connect(
+            failed.append,
+            Qt.DirectConnection
+        )
+
+        self.connection.perform('breakpoint_list', None)
+
+        # The engine answers without the removed breakpoint
+        self.connection.perform('breakpoint_remove', 10)
+
+        self.assertEqual([], removed)
+        self.assertEqual([10], failed)
+        self.assertIn(10, self.connection.breakpoint_locations)
+
+    def test_post_start_sends_one_batch(self):
+        breakpoints = []
+        self.connection.listed_breakpoints_signal.connect(breakpoints.extend)
+
+        self.connection.perform('post_start', {'breakpoints': [
+            {'filename': '/var/www/index.php', 'lineno': 3},
+            {'filename': '/var/www/index.php', 'lineno': 7},
+        ]})
+
+        self.assertEqual(1, len(self.socket.writes))
+        commands = [command.split(b' ')[0] for command
+                    in self.socket.writes[0].split(b'\0')[:-1]]
+        self.assertEqual(
+            [b'breakpoint_set'] * 2 + [b'feature_set'] * 3 +
+            [b'breakpoint_list'],
+            commands
+        )
+        self.assertEqual('10', breakpoints[0]['id'])
+
+    def test_set_breakpoint_gets_its_id_without_listing(self):
+        breakpoints = []
+        self.connection.set_breakpoint_signal.connect(breakpoints.append)
+
+        self.connection.perform('breakpoint_set', {
+            'filename': '/var/www/index.php',
+            'lineno': 3
+        })
+
+        self.assertEqual([{
+            'filename': '/var/www/index.php',
+            'lineno': 3,
+            'state': 'enabled',
+            'id': '1'
+        }], breakpoints)
+        self.assertEqual(1, len(self.socket.writes))
+
+    def test_conditional_breakpoint_is_set_on_the_engine(self):
+        self.connection.perform('breakpoint_set', {
+            'type': 'conditional',
+            'filename': '/var/www/index.php',
+            'lineno': 3,
+            'expression': '$id == 42',
+            'hit_condition': '>=',
+            'hit_value': 500
+        })
+
+        self.assertEqual(
+            b'breakpoint_set -i 1 -t conditional -f /var/www/index.php '
+            b'-n 3 -h 500 -o >= -- JGlkID09IDQy\0',
+            self.socket.writes[0]
+        )
+
+
+class PugdebugServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = PugdebugServer()
+
+        self.connections = []
+        self.server.new_connection_established_signal.connect(
+            self.connections.append,
+            Qt.DirectConnection
+        )
+
+        self.clients = []
+
+    def tearDown(self):
+        self.server.stop_listening()
+        self.server.wait()
+
+        for connection in self.connections:
+            connection.disconnect()
+
+        for client in self.clients:
+            client.close()
+
+    def connect_client(self, port, idekey='pugdebug', handshake=True):
+        client = socket.create_connection(('127.0.0.1', port))
+        self.clients.append(client)
+
+        if handshake:
+            self.handshake(client, idekey)
+
+        return client
+
+    def handshake(self, client, idekey='pugdebug'):
+        client.sendall(init_message(idekey))
+
+        command = b''
+        while not command.endswith(b'\0'):
+            command += client.recv(1024)
+
+        self.assertTrue(command.startswith(b'typemap_get -i '))
+        client.sendall(typemap_response(command[15:-1].decode()))
+
+    def test_listens_on_multiple_addresses(self):
+        ports = [get_free_port(), get_free_port()]
+
+        self.server.start_listening([('127.0.0.1', port) for port in ports])
+
+        for port in ports:
+            self.assertTrue(wait_until(lambda: self.__can_connect(port)))
+
+        self.assertTrue(wait_until(lambda: len(self.connections) == 2))
+        self.assertEqual(
+            '/var/www/index.php',
+            self.connections[0].init_message['fileuri']
+        )
+        self.assertEqual({'int': 'int'}, self.connections[0].parser.typemap)
+
+    def test_stalled_connection_does_not_block_others(self):
+        port = get_free_port()
+        self.server.start_listening([('127.0.0.1', port)])
+        self.assertTrue(wait_until(
+            lambda: self.__can_connect(port, handshake=False)
+        ))
+
+        # The first client never sends the init message
+        self.connect_client(port)
+
+        self.assertTrue(wait_until(lambda: len(self.connections) == 1))
+
+    def test_stalled_connection_is_dropped_after_deadline(self):
+        timeout = get_setting('debugger/handshake_timeout')
+        set_setting('debugger/handshake_timeout', 1)
+        self.addCleanup(set_setting, 'debugger/handshake_timeout', timeout)
+
+        errors = []
+        self.server.server_error_signal.connect(
+            errors.append,
+            Qt.DirectConnection
+        )
+
+        port = get_free_port()
+        self.server.start_listening([('127.0.0.1', port)])
+        self.assertTrue(wait_until(
+            lambda: self.__can_connect(port, handshake=False)
+        ))
+
+        self.clients[0].settimeout(5)
+        self.assertEqual(b'', self.clients[0].recv(1024))
+
+        # The error is emitted right after the connection is closed
+        self.assertTrue(wait_until(
+            lambda: 'Connection initialization timed out' in errors
+        ))
+
+    def read_commands(self, client, count):
+        data = b''
+        while data.count(b'\0') < count:
+            data += client.recv(1024)
+
+        return [parse_command(command)
+                for command in data.split(b'\0')[:-1]]
+
+    def set_connection_rules(self, rules):
+        previous = get_setting('debugger/connection_rules')
+        set_setting('debugger/connection_rules', rules)
+        self.addCleanup(set_setting, 'debugger/connection_rules', previous)
+
+    def test_connection_matching_a_detach_rule_is_let_go(self):
+        self.set_connection_rules('detach fileuri */index.php')
+
+        port = get_free_port()
+        self.server.start_listening([('127.0.0.1', port)])
+        self.assertTrue(wait_until(
+            lambda: self.__can_connect(port, handshake=False)
+        ))
+
+        client = self.clients[0]
+        client.settimeout(5)
+        self.handshake(client)
+
+        [(name, arguments)] = self.read_commands(client, 1)
+        self.assertEqual('detach', name)
+
+        self.assertEqual(b'', client.recv(1024))
+        self.assertEqual([], self.connections)
+
+    def test_connection_matching_a_request_uri_rule_is_run(self):
+        self.set_connection_rules('# Skip the assets\n'
+                                  'run request_uri /assets/*')
+
+        port = get_free_port()
+        self.server.start_listening([('127.0.0.1', port)])
+        self.assertTrue(wait_until(
+            lambda: self.__can_connect(port, handshake=False)
+        ))
+
+        client = self.clients[0]
+        client.settimeout(5)
+        client.sendall(init_message())
+
+        typemap, request_uri = self.read_commands(client, 2)
+        self.assertEqual('typemap_get', typemap[0])
+        self.assertEqual('eval', request_uri[0])
+
+        client.sendall(
+            typemap_response(typemap[1]['-i']) +
+            frame('<?xml version="1.0" encoding="iso-8859-1"?>'
+                  '<response xmlns="urn:debugger_protocol_v1" command="eval" '
+                  'transaction_id="%s"><property type="string" '
+                  'encoding="base64"><![CDATA[L2Fzc2V0cy9hcHAuY3Nz]]>'
+                  '</property></response>' % request_uri[1]['-i'])
+        )
+
+        [(name, arguments)] = self.read_commands(client, 1)
+        self.assertEqual('run', name)
+
+        client.sendall(frame(
+            '<?xml version="1.0" encoding="iso-8859-1"?>'
+            '<response xmlns="urn:debugger_protocol_v1" command="run" '
+            'transaction_id="%s" status="stopping" reason="ok"/>' % (
+                arguments['-i']
+            )
+        ))
+
+        self.assertEqual(b'', client.recv(1024))
+        self.assertEqual([], self.connections)
+
+    def test_connection_with_wrong_idekey_is_dropped(self):
+        port = get_free_port()
+        self.server.start_listening([('127.0.0.1', port)])
+        self.assertTrue(wait_until(
+            lambda: self.__can_connect(port, handshake=False)
+        ))
+
+        client = self.clients[0]
+        client.sendall(init_message('someone-else'))
+
+        self.assertEqual(b'', client.recv(1024))
+        self.assertEqual([], self.connections)
+
+    def test_connection_is_debugged_when_it_cannot_be_recorded(self):
+        recordings_dir = get_setting('debugger/recordings_dir')
+        set_setting('debugger/recordings_dir', '/nonexistent/recordings')
+        self.addCleanup(set_setting, 'debugger/recordings_dir',
+                        recordings_dir)
+
+        port = get_free_port()
+        self.server.start_listening([('127.0.0.1', port)])
+        self.assertTrue(wait_until(lambda: self.__can_connect(port)))
+
+        # The listener is still accepting connections
+        self.connect_client(port)
+
+        self.assertTrue(wait_until(lambda: len(self.connections) == 2))
+        self.assertTrue(self.server.isRunning())
+        self.assertIsInstance(self.connections[0].socket, socket.socket)
+
+    def test_registers_once_with_the_proxy(self):
+        proxy = PugdebugProxy(('127.0.0.1', 0), ('127.0.0.1', 0))
+        proxy.bind()
+
+        thread = threading.Thread(target=proxy.serve_forever)
+        thread.start()
+
+        def stop_proxy():
+            proxy.stop()
+            thread.join()
+
+        self.addCleanup(stop_proxy)
+
+        previous = get_setting('debugger/proxy')
+        set_setting('debugger/proxy', '127.0.0.1:%d' % proxy.get_ide_port())
+        self.addCleanup(set_setting, 'debugger/proxy', previous)
+
+        ports = [get_free_port(), get_free_port()]
+        self.server.start_listening([('127.0.0.1', port) for port in ports])
+
+        self.assertTrue(wait_until(lambda: len(proxy.registrations) == 1))
+
+        # The first port is registered, it isn't replaced by the second one
+        time.sleep(0.1)
+        registration = proxy.registrations[get_setting('debugger/idekey')]
+        self.assertEqual(ports[0], registration.port)
+
+        self.server.stop_listening()
+        self.assertTrue(self.server.wait(5000))
+        self.assertEqual({}, proxy.registrations)
+
+    def test_stops_without_waiting_for_a_timeout(self):
+        port = get_free_port()
+        self.server.start_listening([('127.0.0.1', port)])
+        self.assertTrue(wait_until(lambda: self.__can_connect(port)))
+
+        stopped = time.monotonic()
+        self.server.stop_listening()
+
+        self.assertTrue(self.server.wait(5000))
+        self.assertLess(time.monotonic() - stopped, 0.5)
+
+    def __can_connect(self, port, handshake=True):
+        try:
+            self.connect_client(port, handshake=handshake)
+        except ConnectionRefusedError:
+            return False
+        return True
+
+
+class BlockingConnection():
+    """Records performed actions, blocks on the first one until released"""
+
+    def __init__(self):
+        self.performed = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def perform(self, action, data):
+        if len(self.performed) == 0:
+            self.started.set()
+            self.release.wait(5)
+        self.performed.append(action)
+
+
+class PugdebugConnectionWorkerTest(unittest.TestCase):
+
+    def test_actions_are_performed_by_priority(self):
+        connection = BlockingConnection()
+        background = PugdebugServerConnection.PRIORITY_BACKGROUND
+        command = PugdebugServerConnection.PRIORITY_COMMAND
+        stop = PugdebugServerConnection.PRIORITY_STOP
+
+        worker = PugdebugConnectionWorker(connection)
+        worker.start()
+
+        worker.put(command, 'step_over')
+        connection.started.wait(5)
+
+        worker.put(background, 'post_step')
+        worker.put(background, 'evaluate_expression')
+        worker.put(command, 'breakpoint_set')
+        worker.put(command, 'step_into')
+        worker.put(stop, 'detach')
+
+        connection.release.set()
+        self.assertTrue(wait_until(lambda: len(connection.performed) == 6))
+        worker.stop()
+        worker.join(5)
+
+        self.assertEqual([
+            'step_over',
+            'detach',
+            'breakpoint_set',
+            'step_into',
+            'post_step',
+            'evaluate_expression'
+        ], connection.performed)
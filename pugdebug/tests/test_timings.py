@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import json
+import os
+import tempfile
+import unittest
+
+from pugdebug.models.timings import PugdebugHistogram, PugdebugTimings
+
+
+class PugdebugHistogramTest(unittest.TestCase):
+
+    def test_empty_histogram(self):
+        histogram = PugdebugHistogram()
+
+        self.assertEqual(0, histogram.get_percentile(50))
+        self.assertEqual(0, histogram.get_mean())
+
+    def test_percentiles_are_bucket_bounds(self):
+        histogram = PugdebugHistogram()
+
+        for i in range(90):
+            histogram.add(0.0008)
+        for i in range(10):
+            histogram.add(0.2)
+
+        self.assertEqual(100, histogram.count)
+        self.assertEqual(1, histogram.get_percentile(50))
+        self.assertEqual(200, histogram.get_percentile(95))
+        self.assertAlmostEqual(200, histogram.max)
+
+    def test_durations_above_the_last_bound(self):
+        histogram = PugdebugHistogram()
+        histogram.add(30)
+
+        self.assertEqual(30000, histogram.get_percentile(50))
+        self.assertEqual({'more': 1}, histogram.to_dict()['buckets'])
+
+
+class PugdebugTimingsTest(unittest.TestCase):
+
+    def test_timings_are_aggregated_by_type(self):
+        timings = PugdebugTimings()
+
+        timings.record_command('stack_get', 0.001, 0.002, 0.003, 0.004,
+                               15, 300)
+        timings.record_command('stack_get', 0.001, 0.002, 0.003, 0.004,
+                               15, 500)
+        timings.record_gui_update('stacktraces', 0.01)
+
+        result = timings.to_dict()
+
+        stack_get = result['commands']['stack_get']
+        self.assertEqual(2, stack_get['total']['count'])
+        self.assertAlmostEqual(10, stack_get['total']['mean'])
+        self.assertEqual(30, stack_get['bytes_sent'])
+        self.assertEqual(800, stack_get['bytes_received'])
+
+        self.assertEqual(1, result['gui_updates']['stacktraces']['count'])
+
+        timings.reset()
+        self.assertEqual({'commands': {}, 'gui_updates': {}},
+                         timings.to_dict())
+
+    def test_dump_to_json(self):
+        timings = PugdebugTimings()
+        timings.record_gui_update('variables', 0.05)
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'timings.json')
+
+        try:
+            timings.dump(path)
+
+            with open(path) as file:
+                self.assertEqual(timings.to_dict(), json.load(file))
+        finally:
+            os.remove(path)
+            os.rmdir(directory)
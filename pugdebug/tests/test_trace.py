@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import io
+import os
+import tempfile
+import unittest
+
+from pugdebug.models.trace import (read_chunks, read_trace, parse_trace,
+                                   is_trace)
+
+trace = b"""Version: 3.1.0
+File format: 4
+TRACE START [2021-11-22 10:00:00.000000]
+1\t0\t0\t0.000100\t1000\t{main}\t1\t\t/var/www/index.php\t0\t0
+2\t1\t0\t0.000200\t1100\tload\t1\t\t/var/www/index.php\t5\t1\t42
+3\t2\t0\t0.000300\t1200\tstrlen\t0\t\t/var/www/user.php\t12\t1\t'x'
+3\t2\t1\t0.000400\t1200
+3\t2\tR\t\t\t1
+2\t1\t1\t0.001200\t1600
+2\t3\t0\t0.001300\t1600\tload\t1\t\t/var/www/index.php\t6\t1\t43
+3\t4\t0\t0.001400\t1600\tload\t1\t\t/var/www/user.php\t14\t1\t44
+3\t4\t1\t0.001500\t1700
+2\t3\t1\t0.002300\t1800
+\t\t\t0.002500\t1000
+TRACE END   [2021-11-22 10:00:00.002500]
+"""
+
+
+class PugdebugTraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trace = parse_trace(iter(trace.splitlines()))
+        self.profile = self.trace.profile
+
+    def test_lines_are_read_in_chunks(self):
+        lines = list(read_chunks(io.BytesIO(trace), 7))
+
+        self.assertEqual(trace.split(b'\n')[:-1], lines)
+
+    def test_call_tree(self):
+        self.assertEqual(5, self.trace.get_call_count())
+        self.assertEqual([0], self.trace.get_roots())
+        self.assertEqual([1, 3], list(self.trace.get_children(0)))
+        self.assertEqual([2], list(self.trace.get_children(1)))
+        self.assertEqual([4], list(self.trace.get_children(3)))
+        self.assertEqual([], list(self.trace.get_children(4)))
+
+        self.assertEqual(('/var/www/user.php', 12),
+                         self.trace.get_call_location(2))
+        self.assertAlmostEqual(0.001, self.trace.get_call_time(1))
+        self.assertEqual(500, self.trace.get_call_memory(1))
+
+        # Closed at the end of the trace
+        self.assertAlmostEqual(0.0024, self.trace.get_call_time(0))
+        self.assertEqual(0, self.trace.get_call_memory(0))
+
+    def test_functions_are_aggregated(self):
+        load = self.trace.functions['load']
+        strlen = self.trace.functions['strlen']
+        main = self.trace.functions['{main}']
+
+        self.assertEqual(3, self.profile.get_function_count())
+        self.assertEqual(3, self.profile.calls[load])
+        self.assertEqual(1, self.profile.calls[strlen])
+
+        # The recursive call is counted in the inclusive time only once
+        self.assertEqual(2000, self.profile.inclusive_costs[0][load])
+        self.assertEqual(1900, self.profile.self_costs[0][load])
+        self.assertEqual(100, self.profile.self_costs[0][strlen])
+        self.assertEqual(400, self.profile.self_costs[0][main])
+        self.assertEqual(2400, self.profile.get_total(0))
+
+        self.assertEqual([2, 2000, 700], self.profile.get_callers(load)[main])
+        self.assertEqual([1, 100, 100], self.profile.get_callees(load)[load])
+
+        # A function is where it was first called from
+        self.assertEqual('/var/www/index.php',
+                         self.profile.get_function_file(load))
+        self.assertEqual(5, self.profile.get_function_line(load))
+
+    def test_calls_are_costs_of_the_lines_they_are_made_on(self):
+        self.assertEqual(
+            {5: 1000, 6: 1000},
+            self.profile.get_line_costs('/var/www/index.php')
+        )
+
+    def test_unclosed_calls_exit_with_their_parent(self):
+        trace = parse_trace(iter([
+            b'1\t0\t0\t0.1\t100\t{main}\t1\t\t/var/www/index.php\t0\t0',
+            b'2\t1\t0\t0.2\t100\tthrows\t1\t\t/var/www/index.php\t3\t0',
+            b'1\t0\t1\t0.5\t100',
+        ]))
+
+        self.assertAlmostEqual(0.3, trace.get_call_time(1))
+        self.assertAlmostEqual(0.4, trace.get_call_time(0))
+
+    def test_file_is_read(self):
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+            f.write(trace)
+
+        try:
+            self.assertTrue(is_trace(f.name))
+            self.assertEqual(5, read_trace(f.name).get_call_count())
+        finally:
+            os.unlink(f.name)
+
+    def test_not_a_trace_is_refused(self):
+        with self.assertRaises(ValueError):
+            parse_trace(iter([b'<?php echo 1;']))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import unittest
+
+from pugdebug.models.variables import get_variable_type, get_variable_value
+
+
+class PugdebugVariablesTest(unittest.TestCase):
+
+    def test_get_type_of_object_is_class_name(self):
+        variable = {'name': '$foo', 'type': 'object', 'classname': 'Foo'}
+
+        self.assertEqual('Foo', get_variable_type(variable))
+
+    def test_get_type_without_type(self):
+        self.assertEqual('', get_variable_type({'value': 'error'}))
+
+    def test_get_base64_encoded_value(self):
+        variable = {'type': 'string', 'encoding': 'base64', 'value': 'aGk='}
+
+        self.assertEqual('hi', get_variable_value(variable))
+
+    def test_get_binary_value(self):
+        variable = {'type': 'string', 'encoding': 'base64', 'value': '/w=='}
+
+        self.assertEqual("b'\\xff'", get_variable_value(variable))
+
+    def test_get_bool_value(self):
+        self.assertEqual('true',
+                         get_variable_value({'type': 'bool', 'value': '1'}))
+        self.assertEqual('false',
+                         get_variable_value({'type': 'bool', 'value': '0'}))
+
+    def test_get_missing_value(self):
+        self.assertIsNone(get_variable_value({'type': 'array'}))
+        self.assertIsNone(get_variable_value({'type': 'null', 'value': None}))
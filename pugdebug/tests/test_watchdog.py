@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import logging
+import time
+import unittest
+
+from PyQt5.QtCore import QCoreApplication
+
+from pugdebug.watchdog import PugdebugWatchdog
+
+application = QCoreApplication.instance() or QCoreApplication([])
+
+
+def process_events_for(seconds):
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        QCoreApplication.processEvents()
+        time.sleep(0.005)
+
+
+def block_the_event_loop():
+    time.sleep(0.5)
+
+
+class PugdebugWatchdogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.watchdog = PugdebugWatchdog(100)
+
+    def tearDown(self):
+        self.watchdog.stop()
+
+    def test_stall_is_logged_with_the_main_thread_stack(self):
+        self.watchdog.start()
+
+        with self.assertLogs(level='WARNING') as logs:
+            process_events_for(0.1)
+            block_the_event_loop()
+            process_events_for(0.1)
+
+        self.assertEqual(2, len(logs.output))
+        self.assertIn('GUI stalled for', logs.output[0])
+        self.assertIn('block_the_event_loop', logs.output[0])
+        self.assertIn('GUI stall ended after', logs.output[1])
+
+    def test_turning_event_loop_is_not_logged(self):
+        self.watchdog.start()
+
+        with self.assertLogs(level='WARNING') as logs:
+            process_events_for(0.3)
+
+            # assertLogs fails without any logs
+            logging.warning('done')
+
+        self.assertEqual(['WARNING:root:done'], logs.output)
+
+    def test_zero_threshold_turns_the_watchdog_off(self):
+        self.watchdog.set_threshold(0)
+
+        self.assertIsNone(self.watchdog.monitor)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+    pugdebug - a standalone PHP debugger
+    =========================
+    copyright: (c) 2015 Robert Basic
+    license: GNU GPL v3, see LICENSE for more details
+"""
+
+__author__ = "robertbasic"
+
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from PyQt5.QtCore import QObject, QTimer
+
+
+class PugdebugWatchdog(QObject):
+    """Notice when the GUI event loop stalls
+
+    A timer on the main thread beats regularly while the event loop turns.
+    A monitor thread checks the beats, and when there was no beat for
+    longer than the threshold, it captures the stack of the main thread,
+    at the moment it is stuck, and logs it. Once the event loop turns
+    again, how long the stall lasted is logged as well.
+
+    A threshold of 0 turns the watchdog off.
+    """
+
+    # Milliseconds without a beat to consider the event loop stalled
+    threshold = 500
+
+    timer = None
+
+    monitor = None
+
+    # `time.monotonic` of the latest beat
+    last_beat = 0
+
+    def __init__(self, threshold=500):
+        super(PugdebugWatchdog, self).__init__()
+
+        self.threshold = threshold
+
+        self.main_thread_id = threading.get_ident()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.beat)
+
+        self.stopped = threading.Event()
+        self.monitor = None
+
+        # Start of the stall that was logged, None when not stalled
+        self.stalled_since = None
+
+        self.last_beat = time.monotonic()
+
+    def start(self):
+        """Start watching the event loop
+
+        Must be called from the main thread.
+        """
+        if self.threshold <= 0 or self.monitor is not None:
+            return
+
+        self.main_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+
+        self.timer.start(self.get_interval())
+
+        self.stopped.clear()
+        self.monitor = threading.Thread(
+            target=self.watch,
+            name='pugdebug-watchdog',
+            daemon=True
+        )
+        self.monitor.start()
+
+    def stop(self):
+        if self.monitor is None:
+            return
+
+        self.timer.stop()
+
+        self.stopped.set()
+        self.monitor.join()
+        self.monitor = None
+
+    def set_threshold(self, threshold):
+        self.stop()
+        self.threshold = threshold
+        self.start()
+
+    def get_interval(self):
+        """How often to beat and check the beats, in milliseconds"""
+        return max(10, self.threshold // 4)
+
+    def beat(self):
+        self.last_beat = time.monotonic()
+
+        if self.stalled_since is not None:
+            logging.warning("GUI stall ended after %d ms" % (
+                (self.last_beat - self.stalled_since) * 1000
+            ))
+            self.stalled_since = None
+
+    def watch(self):
+        interval = self.get_interval() / 1000
+
+        while not self.stopped.wait(interval):
+            self.check()
+
+    def check(self):
+        """Log the stack of the main thread if it is stalled
+
+        A stall is logged once, when it is first noticed.
+        """
+        last_beat = self.last_beat
+        stalled_for = time.monotonic() - last_beat
+
+        if stalled_for * 1000 <= self.threshold:
+            return
+
+        if self.stalled_since == last_beat:
+            return
+
+        self.stalled_since = last_beat
+
+        frame = sys._current_frames().get(self.main_thread_id)
+
+        if frame is None:
+            return
+
+        stack = ''.join(traceback.format_stack(frame))
+
+        logging.warning(
+            "GUI stalled for %d ms, main thread stack:\n%s" % (
+                stalled_for * 1000,
+                stack
+            )
+        )